@@ -1,20 +1,36 @@
 import os
 
-import pickle
-
-import numpy as np
 import pandas as pd
 
 from torch.utils.data import Dataset
 
-from models.utils import match_seq_len
+from data_loaders.cache import load_sequences, prepare_sequences, \
+    save_sequences
+from data_loaders.ingest import stream_sequences
+from data_loaders.preprocess import build_sequences
+from models.utils import window_indices
 
 
 DATASET_DIR = "datasets/algebra_2005_2006/"
 
 
 class Algebra2005(Dataset):
-    def __init__(self, seq_len, datset_dir=DATASET_DIR) -> None:
+    # The version and the parameters of the preprocessing are part of the
+    # cache key: bump VERSION when changing preprocess or
+    # preprocess_streaming in a way the parameters do not describe.
+    VERSION = 1
+    PREPROCESS_PARAMS = {
+        "user": "Anon Student Id",
+        "kc": "KC(Default)",
+        "response": "Correct First Attempt",
+        "order": "Step Start Time",
+        "dropna": ["KC(Default)"],
+    }
+
+    def __init__(
+        self, seq_len, datset_dir=DATASET_DIR, memory_budget=None,
+        stride=None
+    ) -> None:
         super().__init__()
 
         self.seq_len = seq_len
@@ -24,35 +40,29 @@ class Algebra2005(Dataset):
             self.dataset_dir, "algebra_2005_2006_train.txt"
         )
 
-        if os.path.exists(os.path.join(self.dataset_dir, "q_seqs.pkl")):
-            with open(os.path.join(self.dataset_dir, "q_seqs.pkl"), "rb") as f:
-                self.q_seqs = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "r_seqs.pkl"), "rb") as f:
-                self.r_seqs = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "q_list.pkl"), "rb") as f:
-                self.q_list = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "u_list.pkl"), "rb") as f:
-                self.u_list = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "q2idx.pkl"), "rb") as f:
-                self.q2idx = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "u2idx.pkl"), "rb") as f:
-                self.u2idx = pickle.load(f)
-
-        else:
-            self.q_seqs, self.r_seqs, self.q_list, self.u_list, self.q2idx, \
-                self.u2idx = self.preprocess()
+        self.cache_key = prepare_sequences(self, memory_budget)
+
+        self.q_seqs, self.r_seqs, self.seq_offsets, self.q_list, \
+            self.u_list, self.q2idx, self.u2idx = \
+            load_sequences(self.dataset_dir)
 
         self.num_u = self.u_list.shape[0]
         self.num_q = self.q_list.shape[0]
 
-        if self.seq_len:
-            self.q_seqs, self.r_seqs = \
-                match_seq_len(self.q_seqs, self.r_seqs, self.seq_len)
+        # Only the (user, start, length) of every window is stored, the
+        # sequences are sliced from the memory-mapped cache on access.
+        self.windows = window_indices(
+            self.seq_offsets, self.seq_len, stride
+        )
 
-        self.len = len(self.q_seqs)
+        self.len = len(self.windows)
 
     def __getitem__(self, index):
-        return self.q_seqs[index], self.r_seqs[index]
+        u, start, length = self.windows[index]
+        start += self.seq_offsets[u]
+
+        return self.q_seqs[start:start + length], \
+            self.r_seqs[start:start + length]
 
     def __len__(self):
         return self.len
@@ -61,31 +71,22 @@ class Algebra2005(Dataset):
         df = pd.read_csv(self.dataset_path, sep="\t")\
             .dropna(subset=["KC(Default)"]).sort_values(by=["Step Start Time"])
 
-        u_list = np.unique(df["Anon Student Id"].values)
-        q_list = np.unique(df["KC(Default)"].values)
-
-        u2idx = {u: idx for idx, u in enumerate(u_list)}
-        q2idx = {q: idx for idx, q in enumerate(q_list)}
-
-        q_seqs = []
-        r_seqs = []
-        for u in u_list:
-            u_df = df[df["Anon Student Id"] == u]
-
-            q_seqs.append([q2idx[q] for q in u_df["KC(Default)"].values])
-            r_seqs.append(u_df["Correct First Attempt"].values)
-
-        with open(os.path.join(self.dataset_dir, "q_seqs.pkl"), "wb") as f:
-            pickle.dump(q_seqs, f)
-        with open(os.path.join(self.dataset_dir, "r_seqs.pkl"), "wb") as f:
-            pickle.dump(r_seqs, f)
-        with open(os.path.join(self.dataset_dir, "q_list.pkl"), "wb") as f:
-            pickle.dump(q_list, f)
-        with open(os.path.join(self.dataset_dir, "u_list.pkl"), "wb") as f:
-            pickle.dump(u_list, f)
-        with open(os.path.join(self.dataset_dir, "q2idx.pkl"), "wb") as f:
-            pickle.dump(q2idx, f)
-        with open(os.path.join(self.dataset_dir, "u2idx.pkl"), "wb") as f:
-            pickle.dump(u2idx, f)
+        q_seqs, r_seqs, q_list, u_list, q2idx, u2idx = build_sequences(
+            df, "Anon Student Id", "KC(Default)", "Correct First Attempt"
+        )
+
+        save_sequences(
+            self.dataset_dir, q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+        )
 
         return q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+
+    def preprocess_streaming(self, memory_budget):
+        stream_sequences(
+            self.dataset_path, self.dataset_dir,
+            "Anon Student Id", "KC(Default)", "Correct First Attempt",
+            order_col="Step Start Time",
+            transform=lambda df: df.dropna(subset=["KC(Default)"]),
+            memory_budget=memory_budget,
+            sep="\t",
+        )
@@ -0,0 +1,187 @@
+import os
+
+import pickle
+import time
+
+import numpy as np
+
+from data_loaders.manifest import CacheManifest, artifact_key
+
+
+Q_SEQS_FILE = "q_seqs.npy"
+R_SEQS_FILE = "r_seqs.npy"
+OFFSETS_FILE = "seq_offsets.npy"
+
+MAPPING_FILES = ["q_list.pkl", "u_list.pkl", "q2idx.pkl", "u2idx.pkl"]
+
+SEQUENCE_FILES = [Q_SEQS_FILE, R_SEQS_FILE, OFFSETS_FILE] + MAPPING_FILES
+
+# The pickled per-user lists written by the loaders before the CSR format.
+LEGACY_SEQ_FILES = ["q_seqs.pkl", "r_seqs.pkl"]
+
+
+def prepare_sequences(dataset, memory_budget=None):
+    '''
+        Makes sure the CSR sequence cache of a dataset loader is up to date
+        and rebuilds it otherwise. The cache is keyed on the hash of the raw
+        file, the loader version and its preprocessing parameters, so that a
+        changed file or preprocessing never trains on stale sequences.
+
+        Args:
+            dataset: the dataset loader, with its dataset_dir, \
+                dataset_path, VERSION, PREPROCESS_PARAMS, preprocess and \
+                preprocess_streaming
+            memory_budget: the memory budget in bytes of the streaming \
+                preprocessing, None to preprocess in memory
+
+        Returns:
+            key: the key of the sequence cache
+    '''
+    manifest = CacheManifest(dataset.dataset_dir)
+    source_hash = manifest.source_hash(dataset.dataset_path)
+
+    key = artifact_key(
+        source=source_hash,
+        loader=type(dataset).__name__,
+        version=dataset.VERSION,
+        params=dataset.PREPROCESS_PARAMS,
+    )
+
+    if source_hash is None:
+        # Without the raw file, an existing cache can only be trusted as is.
+        if has_sequences(dataset.dataset_dir):
+            return key
+    elif manifest.lookup("sequences", key, SEQUENCE_FILES):
+        return key
+
+    start = time.time()
+    if memory_budget:
+        dataset.preprocess_streaming(memory_budget)
+    else:
+        dataset.preprocess()
+
+    offsets = np.load(os.path.join(dataset.dataset_dir, OFFSETS_FILE))
+    with open(os.path.join(dataset.dataset_dir, "q_list.pkl"), "rb") as f:
+        num_q = len(pickle.load(f))
+
+    manifest.record(
+        "sequences", key, time.time() - start,
+        interactions=int(offsets[-1]),
+        users=len(offsets) - 1,
+        kcs=num_q,
+        streaming=bool(memory_budget),
+    )
+
+    return key
+
+
+def has_sequences(dataset_dir):
+    '''
+        Returns whether the CSR sequence cache of dataset_dir is complete.
+        A cache in the legacy pickle format is converted on the fly.
+    '''
+    if all(
+        os.path.exists(os.path.join(dataset_dir, f)) for f in SEQUENCE_FILES
+    ):
+        return True
+
+    legacy_files = LEGACY_SEQ_FILES + MAPPING_FILES
+    if all(os.path.exists(os.path.join(dataset_dir, f)) for f in legacy_files):
+        convert_legacy_sequences(dataset_dir)
+        return True
+
+    return False
+
+
+def save_sequences(dataset_dir, q_seqs, r_seqs, q_list, u_list, q2idx, u2idx):
+    '''
+        Saves the per-user sequences as a CSR cache: the flat int16 (or
+        int32 for large KC vocabularies) question(KC) indices, the flat
+        int8 responses and the int64 offsets of every user in the flat
+        arrays. The mappings stay pickled.
+
+        Args:
+            dataset_dir: the directory to save the cache in
+            q_seqs: the list of the question(KC) index sequences per user
+            r_seqs: the list of the response sequences per user
+            q_list: the sorted unique questions(KCs)
+            u_list: the sorted unique users
+            q2idx: the mapping from the questions(KCs) to their indices
+            u2idx: the mapping from the users to their indices
+    '''
+    lengths = np.array([len(q_seq) for q_seq in q_seqs], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    q_dtype = kc_dtype(len(q_list))
+
+    if len(q_seqs):
+        q_flat = np.concatenate(q_seqs).astype(q_dtype)
+        r_flat = np.concatenate(r_seqs).astype(np.int8)
+    else:
+        q_flat = np.zeros(0, dtype=q_dtype)
+        r_flat = np.zeros(0, dtype=np.int8)
+
+    np.save(os.path.join(dataset_dir, Q_SEQS_FILE), q_flat)
+    np.save(os.path.join(dataset_dir, R_SEQS_FILE), r_flat)
+    np.save(os.path.join(dataset_dir, OFFSETS_FILE), offsets)
+
+    save_mappings(dataset_dir, q_list, u_list, q2idx, u2idx)
+
+
+def kc_dtype(num_q):
+    '''
+        Returns the smallest integer dtype holding the question(KC) indices.
+    '''
+    if num_q <= np.iinfo(np.int16).max + 1:
+        return np.int16
+
+    return np.int32
+
+
+def save_mappings(dataset_dir, q_list, u_list, q2idx, u2idx):
+    for name, obj in zip(MAPPING_FILES, [q_list, u_list, q2idx, u2idx]):
+        with open(os.path.join(dataset_dir, name), "wb") as f:
+            pickle.dump(obj, f)
+
+
+def load_sequences(dataset_dir):
+    '''
+        Opens the CSR cache of dataset_dir with memory mapping, so that the
+        processes reading the same cache share one page-cached copy.
+
+        Returns:
+            q_seqs: the question(KC) index sequences of all the users \
+                concatenated, as a read-only memory-mapped array
+            r_seqs: the response sequences of all the users concatenated, \
+                as a read-only memory-mapped array
+            seq_offsets: the offsets of the sequence of every user in \
+                q_seqs and r_seqs, with the size of [num_users + 1]
+            q_list: the sorted unique questions(KCs)
+            u_list: the sorted unique users
+            q2idx: the mapping from the questions(KCs) to their indices
+            u2idx: the mapping from the users to their indices
+    '''
+    q_seqs = np.load(os.path.join(dataset_dir, Q_SEQS_FILE), mmap_mode="r")
+    r_seqs = np.load(os.path.join(dataset_dir, R_SEQS_FILE), mmap_mode="r")
+    seq_offsets = np.load(os.path.join(dataset_dir, OFFSETS_FILE))
+
+    mappings = []
+    for name in MAPPING_FILES:
+        with open(os.path.join(dataset_dir, name), "rb") as f:
+            mappings.append(pickle.load(f))
+
+    return (q_seqs, r_seqs, seq_offsets, *mappings)
+
+
+def convert_legacy_sequences(dataset_dir):
+    '''
+        Rewrites a cache made of q_seqs.pkl and r_seqs.pkl into the CSR
+        format, so that existing preprocessed datasets are not rebuilt.
+    '''
+    objs = []
+    for name in LEGACY_SEQ_FILES + MAPPING_FILES:
+        with open(os.path.join(dataset_dir, name), "rb") as f:
+            objs.append(pickle.load(f))
+
+    save_sequences(dataset_dir, *objs)
@@ -0,0 +1,263 @@
+import os
+
+import math
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data_loaders.cache import Q_SEQS_FILE, R_SEQS_FILE, OFFSETS_FILE, \
+    kc_dtype, save_mappings
+
+
+# A rough upper bound of the memory one parsed CSV row takes in a pandas
+# chunk, used to derive the chunk size from the memory budget.
+CHUNK_ROW_BYTES = 512
+
+MAX_PARTITIONS = 1024
+
+SPILL_COLUMNS = [
+    ("u", np.int64),
+    ("q", np.int32),
+    ("r", np.int8),
+    ("order", np.float64),
+    ("row", np.int64),
+]
+
+
+def stream_sequences(
+    dataset_path, dataset_dir, user_col, kc_col, response_col,
+    order_col=None, dedup=False, transform=None, usecols=None,
+    memory_budget=2 ** 30, chunksize=None, **read_kwargs
+):
+    '''
+        Builds the CSR sequence cache of dataset_dir from a CSV/TSV file
+        that does not need to fit in memory.
+
+        The file is read in chunks with only the needed columns. The rows of
+        every chunk are spilled to disk, partitioned by user, with
+        provisional integer codes for the users and the questions(KCs).
+        Every partition is then sorted and merged into the memory-mapped
+        cache, so the peak memory is bounded by memory_budget plus the
+        user and question(KC) vocabularies, not by the dataset size.
+
+        Args:
+            dataset_path: the path of the raw CSV/TSV file
+            dataset_dir: the directory to save the cache in
+            user_col: the name of the column identifying the users
+            kc_col: the name of the column identifying the questions(KCs)
+            response_col: the name of the column with the 0/1 responses
+            order_col: the name of the column ordering the interactions of \
+                a user, None to keep the order of the file
+            dedup: whether to drop the rows with the same order_col and \
+                kc_col values as a previous row of the same user
+            transform: the function applied on every chunk before it is \
+                spilled, to filter rows and to build derived columns
+            usecols: the columns to read, by default the columns above
+            memory_budget: the approximate memory budget in bytes
+            chunksize: the number of rows per chunk, derived from \
+                memory_budget by default
+            read_kwargs: the other arguments of pandas.read_csv
+    '''
+    if usecols is None:
+        usecols = [
+            c for c in [user_col, kc_col, response_col, order_col]
+            if c is not None
+        ]
+    if chunksize is None:
+        chunksize = max(1000, memory_budget // 2 // CHUNK_ROW_BYTES)
+
+    # A spilled row takes about 30 bytes, and about 100 bytes while its
+    # partition is sorted, which is less than a raw text row, so partitions
+    # of half the budget in text bytes fit in the budget once spilled.
+    num_parts = math.ceil(
+        os.path.getsize(dataset_path) / max(1, memory_budget // 2)
+    )
+    num_parts = min(max(1, num_parts), MAX_PARTITIONS)
+
+    u_vocab = {}
+    q_vocab = {}
+
+    with tempfile.TemporaryDirectory(dir=dataset_dir) as spill_dir:
+        reader = pd.read_csv(
+            dataset_path, usecols=usecols, chunksize=chunksize,
+            **read_kwargs
+        )
+
+        row_start = 0
+        for chunk in reader:
+            num_rows = len(chunk)
+            chunk["__row"] = np.arange(row_start, row_start + num_rows)
+            row_start += num_rows
+
+            if transform is not None:
+                chunk = transform(chunk)
+            chunk = chunk.dropna(subset=[user_col, kc_col])
+
+            u = encode(chunk[user_col].values, u_vocab)
+            spill(
+                spill_dir, num_parts,
+                u=u,
+                q=encode(chunk[kc_col].values, q_vocab),
+                r=chunk[response_col].values,
+                order=order_values(chunk[order_col])
+                if order_col is not None else chunk["__row"].values,
+                row=chunk["__row"].values,
+            )
+
+            del chunk
+
+        u_list, u_final = finalize_vocab(u_vocab)
+        q_list, q_final = finalize_vocab(q_vocab)
+
+        u2idx = {u: idx for idx, u in enumerate(u_list)}
+        q2idx = {q: idx for idx, q in enumerate(q_list)}
+
+        del u_vocab, q_vocab
+
+        counts = np.zeros(len(u_list), dtype=np.int64)
+        for part in range(num_parts):
+            counts += sort_partition(spill_dir, part, u_final, q_final, dedup)
+
+        offsets = np.zeros(len(u_list) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        num_interactions = int(offsets[-1])
+
+        q_flat = np.lib.format.open_memmap(
+            os.path.join(dataset_dir, Q_SEQS_FILE), mode="w+",
+            dtype=kc_dtype(len(q_list)), shape=(num_interactions,)
+        )
+        r_flat = np.lib.format.open_memmap(
+            os.path.join(dataset_dir, R_SEQS_FILE), mode="w+",
+            dtype=np.int8, shape=(num_interactions,)
+        )
+
+        for part in range(num_parts):
+            u, q, r = [
+                read_column(spill_dir, part, name, dtype)
+                for name, dtype in SPILL_COLUMNS[:3]
+            ]
+            if len(u) == 0:
+                continue
+
+            # Every user lives in a single partition, sorted by the order key,
+            # so the rows only have to be moved to the offsets of their user.
+            _, first, inv = np.unique(
+                u, return_index=True, return_inverse=True
+            )
+            pos = offsets[u] + np.arange(len(u)) - first[inv]
+
+            q_flat[pos] = q
+            r_flat[pos] = r
+
+        q_flat.flush()
+        r_flat.flush()
+        del q_flat, r_flat
+
+    np.save(os.path.join(dataset_dir, OFFSETS_FILE), offsets)
+    save_mappings(dataset_dir, q_list, u_list, q2idx, u2idx)
+
+
+def encode(values, vocab):
+    '''
+        Returns the provisional codes of values, assigning new codes to the
+        values which are not in vocab yet.
+    '''
+    codes, uniques = pd.factorize(np.asarray(values))
+    ids = np.array(
+        [vocab.setdefault(v, len(vocab)) for v in uniques], dtype=np.int64
+    )
+
+    return ids[codes]
+
+
+def finalize_vocab(vocab):
+    '''
+        Returns the sorted unique values of vocab and the mapping from the
+        provisional codes to the indices in the sorted values.
+    '''
+    values = pd.Index(list(vocab)).to_numpy()
+    final, sorted_values = pd.factorize(values, sort=True)
+
+    return sorted_values, final
+
+
+def order_values(series):
+    '''
+        Converts an order key column into float64 values. Non-numeric
+        columns are parsed as timestamps. Missing values are sorted last.
+    '''
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.values.astype(np.float64)
+    else:
+        times = pd.to_datetime(series, errors="coerce")
+        values = times.values.astype("datetime64[ns]").astype(np.int64)\
+            .astype(np.float64)
+        values[times.isna().values] = np.nan
+
+    values[np.isnan(values)] = np.inf
+
+    return values
+
+
+def part_path(spill_dir, part, name):
+    return os.path.join(spill_dir, "part_{}.{}.bin".format(part, name))
+
+
+def spill(spill_dir, num_parts, **columns):
+    parts = columns["u"] % num_parts
+    sort_idx = np.argsort(parts, kind="stable")
+    bounds = np.searchsorted(parts[sort_idx], np.arange(num_parts + 1))
+
+    for part in range(num_parts):
+        if bounds[part] == bounds[part + 1]:
+            continue
+        idx = sort_idx[bounds[part]:bounds[part + 1]]
+
+        for name, dtype in SPILL_COLUMNS:
+            with open(part_path(spill_dir, part, name), "ab") as f:
+                np.asarray(columns[name][idx], dtype=dtype).tofile(f)
+
+
+def read_column(spill_dir, part, name, dtype):
+    path = part_path(spill_dir, part, name)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=dtype)
+
+    return np.fromfile(path, dtype=dtype)
+
+
+def sort_partition(spill_dir, part, u_final, q_final, dedup):
+    '''
+        Maps the provisional codes of a spilled partition to the final
+        indices, drops the duplicated rows if needed and sorts the rows by
+        user and order key. The partition is rewritten in place.
+
+        Returns:
+            counts: the number of interactions of every user in the partition
+    '''
+    u, q, r, order, row = [
+        read_column(spill_dir, part, name, dtype)
+        for name, dtype in SPILL_COLUMNS
+    ]
+    u = u_final[u]
+    q = q_final[q].astype(np.int32)
+
+    if dedup and len(u):
+        # Keep the first row, in file order, of every (order, KC) pair.
+        idx = np.lexsort((row, q, order, u))
+        dup = np.zeros(len(idx), dtype=bool)
+        dup[1:] = (u[idx][1:] == u[idx][:-1]) & \
+            (order[idx][1:] == order[idx][:-1]) & \
+            (q[idx][1:] == q[idx][:-1])
+        keep = np.sort(idx[~dup])
+        u, q, r, order, row = u[keep], q[keep], r[keep], order[keep], row[keep]
+
+    idx = np.lexsort((row, order, u))
+    u, q, r = u[idx], q[idx], r[idx]
+
+    for name, arr in zip(["u", "q", "r"], [u, q, r]):
+        with open(part_path(spill_dir, part, name), "wb") as f:
+            arr.tofile(f)
+
+    return np.bincount(u, minlength=len(u_final)).astype(np.int64)
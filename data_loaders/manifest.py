@@ -0,0 +1,118 @@
+import os
+
+import hashlib
+import json
+import tempfile
+import time
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+def artifact_key(**parts):
+    '''
+        Returns the content key of a cached artifact: the SHA-256 of the
+        JSON encoding of everything the artifact was built from.
+    '''
+    encoded = json.dumps(parts, sort_keys=True, default=str)
+
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path, block_size=2 ** 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class CacheManifest:
+    '''
+        The manifest.json of a dataset directory. It records, for every
+        cached artifact, the key it was built with, when and how long it
+        took to build, some row counts, and how many times it was reused.
+
+        Args:
+            dataset_dir: the directory holding the cached artifacts
+    '''
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+        self.path = os.path.join(self.dataset_dir, MANIFEST_FILE)
+
+        self.data = {"sources": {}, "artifacts": {}}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data.update(json.load(f))
+
+    def source_hash(self, path):
+        '''
+            Returns the SHA-256 of the file at path, or None when it does
+            not exist. The hash is only recomputed when the size or the
+            modification time of the file changed.
+        '''
+        if not os.path.exists(path):
+            return None
+
+        stat = os.stat(path)
+        name = os.path.relpath(path, self.dataset_dir)
+        source = self.data["sources"].get(name)
+
+        if source is None or source["size"] != stat.st_size or \
+                source["mtime_ns"] != stat.st_mtime_ns:
+            source = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_sha256(path),
+            }
+            self.data["sources"][name] = source
+            self.save()
+
+        return source["sha256"]
+
+    def lookup(self, name, key, files):
+        '''
+            Returns whether the artifact name was built with key and all of
+            its files still exist, and counts the hit when it is the case.
+        '''
+        entry = self.data["artifacts"].get(name)
+
+        valid = entry is not None and entry["key"] == key and all(
+            os.path.exists(os.path.join(self.dataset_dir, f)) for f in files
+        )
+        if valid:
+            entry["hits"] += 1
+            self.save()
+
+        return valid
+
+    def record(self, name, key, build_seconds, **stats):
+        '''
+            Records that the artifact name was just built with key.
+
+            Args:
+                name: the name of the artifact
+                key: the key from artifact_key
+                build_seconds: the time it took to build the artifact
+                stats: the row counts or other values to record
+        '''
+        entry = self.data["artifacts"].get(name, {})
+
+        self.data["artifacts"][name] = {
+            "key": key,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "build_seconds": round(build_seconds, 3),
+            "builds": entry.get("builds", 0) + 1,
+            "hits": entry.get("hits", 0),
+            **stats,
+        }
+        self.save()
+
+    def save(self):
+        # Written to a temporary file first so that concurrent readers never
+        # see a partial manifest.
+        fd, tmp_path = tempfile.mkstemp(dir=self.dataset_dir, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+
+def build_sequences(df, user_col, kc_col, response_col):
+    '''
+        Splits an interaction log into per-user question(KC) and response
+        sequences with vectorized operations only.
+
+        The rows of each user keep the order they have in the given
+        dataframe, so the caller is expected to sort the log by its order
+        key (e.g. "order_id", "Step Start Time") beforehand.
+
+        Args:
+            df: the interaction log as a pandas DataFrame
+            user_col: the name of the column identifying the users
+            kc_col: the name of the column identifying the questions(KCs)
+            response_col: the name of the column with the responses
+
+        Returns:
+            q_seqs: the list of the question(KC) index sequences per user
+            r_seqs: the list of the response sequences per user
+            q_list: the sorted unique questions(KCs)
+            u_list: the sorted unique users
+            q2idx: the mapping from the questions(KCs) to their indices
+            u2idx: the mapping from the users to their indices
+    '''
+    # Hash-based factorization with sorted uniques gives the same indices as
+    # np.unique(..., return_inverse=True) without sorting the whole column.
+    u_codes, u_list = pd.factorize(np.asarray(df[user_col].values), sort=True)
+    q_codes, q_list = pd.factorize(np.asarray(df[kc_col].values), sort=True)
+    r_values = df[response_col].values
+
+    u2idx = {u: idx for idx, u in enumerate(u_list)}
+    q2idx = {q: idx for idx, q in enumerate(q_list)}
+
+    # A stable sort on the user codes groups the rows by user while keeping
+    # the order of the log inside each user.
+    sort_idx = np.argsort(u_codes, kind="stable")
+
+    _, offsets = np.unique(u_codes[sort_idx], return_index=True)
+
+    q_seqs = np.split(q_codes[sort_idx], offsets[1:])
+    r_seqs = np.split(r_values[sort_idx], offsets[1:])
+
+    return q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
@@ -1,20 +1,55 @@
 import os
 
-import pickle
-
-import numpy as np
 import pandas as pd
 
 from torch.utils.data import Dataset
 
-from models.utils import match_seq_len
+from data_loaders.cache import load_sequences, prepare_sequences, \
+    save_sequences
+from data_loaders.ingest import stream_sequences
+from data_loaders.preprocess import build_sequences
+from models.utils import window_indices
 
 
 DATASET_DIR = ".datasets/statics2011/"
 
 
+def build_kcs(df):
+    '''
+        Builds the "{Problem Name}_{Step Name}" KC of every row with
+        columnar string operations. The strings are identical to the ones
+        built with str.format, so the q2idx mapping is unchanged.
+
+        Args:
+            df: the Statics2011 interaction log as a pandas DataFrame
+
+        Returns:
+            kcs: the KC of every row as a pandas Series
+    '''
+    return df["Problem Name"].astype(str) + "_" + \
+        df["Step Name"].astype(str)
+
+
 class Statics2011(Dataset):
-    def __init__(self, seq_len, datset_dir=DATASET_DIR) -> None:
+    # The version and the parameters of the preprocessing are part of the
+    # cache key: bump VERSION when changing preprocess or
+    # preprocess_streaming in a way the parameters do not describe.
+    VERSION = 1
+    PREPROCESS_PARAMS = {
+        "user": "Anon Student Id",
+        "kc": "{Problem Name}_{Step Name}",
+        "response": "Outcome == CORRECT",
+        "order": "Time",
+        "dropna": ["Problem Name", "Step Name", "Outcome"],
+        "filters": [
+            "Attempt At Step == 1", "Student Response Type == ATTEMPT"
+        ],
+    }
+
+    def __init__(
+        self, seq_len, datset_dir=DATASET_DIR, memory_budget=None,
+        stride=None
+    ) -> None:
         super().__init__()
 
         self.seq_len = seq_len
@@ -27,35 +62,29 @@ class Statics2011(Dataset):
             )
         )
 
-        if os.path.exists(os.path.join(self.dataset_dir, "q_seqs.pkl")):
-            with open(os.path.join(self.dataset_dir, "q_seqs.pkl"), "rb") as f:
-                self.q_seqs = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "r_seqs.pkl"), "rb") as f:
-                self.r_seqs = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "q_list.pkl"), "rb") as f:
-                self.q_list = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "u_list.pkl"), "rb") as f:
-                self.u_list = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "q2idx.pkl"), "rb") as f:
-                self.q2idx = pickle.load(f)
-            with open(os.path.join(self.dataset_dir, "u2idx.pkl"), "rb") as f:
-                self.u2idx = pickle.load(f)
-
-        else:
-            self.q_seqs, self.r_seqs, self.q_list, self.u_list, self.q2idx, \
-                self.u2idx = self.preprocess()
+        self.cache_key = prepare_sequences(self, memory_budget)
+
+        self.q_seqs, self.r_seqs, self.seq_offsets, self.q_list, \
+            self.u_list, self.q2idx, self.u2idx = \
+            load_sequences(self.dataset_dir)
 
         self.num_u = self.u_list.shape[0]
         self.num_q = self.q_list.shape[0]
 
-        if self.seq_len:
-            self.q_seqs, self.r_seqs = \
-                match_seq_len(self.q_seqs, self.r_seqs, self.seq_len)
+        # Only the (user, start, length) of every window is stored, the
+        # sequences are sliced from the memory-mapped cache on access.
+        self.windows = window_indices(
+            self.seq_offsets, self.seq_len, stride
+        )
 
-        self.len = len(self.q_seqs)
+        self.len = len(self.windows)
 
     def __getitem__(self, index):
-        return self.q_seqs[index], self.r_seqs[index]
+        u, start, length = self.windows[index]
+        start += self.seq_offsets[u]
+
+        return self.q_seqs[start:start + length], \
+            self.r_seqs[start:start + length]
 
     def __len__(self):
         return self.len
@@ -67,37 +96,39 @@ class Statics2011(Dataset):
         df = df[df["Attempt At Step"] == 1]
         df = df[df["Student Response Type"] == "ATTEMPT"]
 
-        kcs = []
-        for _, row in df.iterrows():
-            kcs.append("{}_{}".format(row["Problem Name"], row["Step Name"]))
+        df["KC"] = build_kcs(df)
+        df["Correct"] = (df["Outcome"].values == "CORRECT").astype(int)
 
-        df["KC"] = kcs
-
-        u_list = np.unique(df["Anon Student Id"].values)
-        q_list = np.unique(df["KC"].values)
-
-        u2idx = {u: idx for idx, u in enumerate(u_list)}
-        q2idx = {q: idx for idx, q in enumerate(q_list)}
-
-        q_seqs = []
-        r_seqs = []
-        for u in u_list:
-            u_df = df[df["Anon Student Id"] == u]
-
-            q_seqs.append([q2idx[q] for q in u_df["KC"].values])
-            r_seqs.append((u_df["Outcome"].values == "CORRECT").astype(int))
+        q_seqs, r_seqs, q_list, u_list, q2idx, u2idx = build_sequences(
+            df, "Anon Student Id", "KC", "Correct"
+        )
 
-        with open(os.path.join(self.dataset_dir, "q_seqs.pkl"), "wb") as f:
-            pickle.dump(q_seqs, f)
-        with open(os.path.join(self.dataset_dir, "r_seqs.pkl"), "wb") as f:
-            pickle.dump(r_seqs, f)
-        with open(os.path.join(self.dataset_dir, "q_list.pkl"), "wb") as f:
-            pickle.dump(q_list, f)
-        with open(os.path.join(self.dataset_dir, "u_list.pkl"), "wb") as f:
-            pickle.dump(u_list, f)
-        with open(os.path.join(self.dataset_dir, "q2idx.pkl"), "wb") as f:
-            pickle.dump(q2idx, f)
-        with open(os.path.join(self.dataset_dir, "u2idx.pkl"), "wb") as f:
-            pickle.dump(u2idx, f)
+        save_sequences(
+            self.dataset_dir, q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+        )
 
         return q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+
+    def preprocess_streaming(self, memory_budget):
+        def transform(df):
+            df = df.dropna(subset=["Problem Name", "Step Name", "Outcome"])
+            df = df[df["Attempt At Step"] == 1]
+            df = df[df["Student Response Type"] == "ATTEMPT"]
+
+            df["KC"] = build_kcs(df)
+            df["Correct"] = (df["Outcome"].values == "CORRECT").astype(int)
+
+            return df
+
+        stream_sequences(
+            self.dataset_path, self.dataset_dir,
+            "Anon Student Id", "KC", "Correct",
+            order_col="Time",
+            transform=transform,
+            usecols=[
+                "Anon Student Id", "Problem Name", "Step Name", "Outcome",
+                "Time", "Attempt At Step", "Student Response Type",
+            ],
+            memory_budget=memory_budget,
+            sep="\t",
+        )
@@ -0,0 +1,204 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from torch.utils.data import Dataset
+
+from data_loaders.cache import load_sequences, prepare_sequences, \
+    save_sequences
+from data_loaders.ingest import stream_sequences
+from data_loaders.manifest import artifact_key
+from data_loaders.preprocess import build_sequences
+from models.utils import window_indices
+
+
+DATASET_DIR = "datasets/Synthetic/"
+
+
+def generate_interactions(
+    num_users=4000, num_q=100, mean_seq_len=80, seq_len_sigma=1.0,
+    min_seq_len=2, max_seq_len=2000, kc_zipf_a=1.0, repeat_prob=0.7,
+    practice_gain=0.3, seed=0
+):
+    '''
+        Generates an interaction log shaped like the ASSISTments skill
+        builder logs, with vectorized operations only.
+
+        The sequence lengths of the users are log-normal, so that most
+        users have short sequences and a few have very long ones. The
+        questions(KCs) are drawn from a Zipf distribution over a random
+        ranking of the KCs and are practiced in runs, as in the skill
+        builder assignments. A response is correct with the probability
+        sigmoid(ability - difficulty + practice_gain * log(1 + attempts)),
+        where attempts is the number of the previous attempts of the user
+        on the KC, so that the models have something to learn.
+
+        Args:
+            num_users: the number of the users
+            num_q: the number of the questions(KCs)
+            mean_seq_len: the mean of the sequence lengths before clipping
+            seq_len_sigma: the standard deviation of the logarithm of the \
+                sequence lengths, the larger the more skewed
+            min_seq_len: the minimum sequence length
+            max_seq_len: the maximum sequence length
+            kc_zipf_a: the exponent of the Zipf distribution of the \
+                questions(KCs), 0 for uniform frequencies
+            repeat_prob: the probability that an interaction is on the \
+                question(KC) of the previous one
+            practice_gain: the increase of the logit of a correct response \
+                per log-attempt on the question(KC)
+            seed: the seed of the generator
+
+        Returns:
+            df: the interaction log sorted by order_id, with the user_id, \
+                skill_id, correct and order_id columns
+    '''
+    rng = np.random.default_rng(seed)
+
+    mu = np.log(mean_seq_len) - seq_len_sigma ** 2 / 2
+    seq_lens = np.clip(
+        np.rint(rng.lognormal(mu, seq_len_sigma, num_users)),
+        min_seq_len, max_seq_len
+    ).astype(np.int64)
+
+    num_rows = int(seq_lens.sum())
+    starts = np.cumsum(seq_lens) - seq_lens
+
+    user = np.repeat(np.arange(num_users), seq_lens)
+    first = np.zeros(num_rows, dtype=bool)
+    first[starts] = True
+
+    kc_probs = 1 / np.arange(1, num_q + 1) ** kc_zipf_a
+    kc_probs /= kc_probs.sum()
+    kc_ranking = rng.permutation(num_q)
+    draws = kc_ranking[rng.choice(num_q, num_rows, p=kc_probs)]
+
+    # Every interaction which does not start a new run repeats the KC drawn
+    # at the start of its run.
+    new_run = first | (rng.random(num_rows) >= repeat_prob)
+    run_start = np.maximum.accumulate(
+        np.where(new_run, np.arange(num_rows), 0)
+    )
+    q = draws[run_start]
+
+    ability = rng.normal(size=num_users)
+    difficulty = rng.normal(size=num_q)
+    attempts = pd.DataFrame({"u": user, "q": q})\
+        .groupby(["u", "q"], sort=False).cumcount().to_numpy()
+
+    logits = ability[user] - difficulty[q] + \
+        practice_gain * np.log1p(attempts)
+    correct = (rng.random(num_rows) < 1 / (1 + np.exp(-logits)))\
+        .astype(np.int8)
+
+    # The users start at random times and interleave in the log, as the
+    # order_id of the real logs.
+    gaps = rng.exponential(size=num_rows)
+    elapsed = np.cumsum(gaps)
+    elapsed -= np.repeat(elapsed[starts] - gaps[starts], seq_lens)
+    t = rng.uniform(0, elapsed.max(), num_users)[user] + elapsed
+
+    order = np.argsort(t, kind="stable")
+    order_id = np.empty(num_rows, dtype=np.int64)
+    order_id[order] = np.arange(num_rows)
+
+    return pd.DataFrame({
+        "user_id": user,
+        "skill_id": q,
+        "correct": correct,
+        "order_id": order_id,
+    }).iloc[order].reset_index(drop=True)
+
+
+class Synthetic(Dataset):
+    '''
+        A generated dataset for the benchmarks and the smoke tests, loaded
+        as the real datasets. The log of generate_interactions is written
+        to a CSV file named after its parameters, so that a change of the
+        parameters gives a new raw file and invalidates the cache.
+
+        Args:
+            seq_len: the sequence length of the windows
+            dataset_dir: the directory of the generated log and its cache
+            memory_budget: the memory budget in bytes of the streaming \
+                preprocessing, None to preprocess in memory
+            stride: the stride of the windows, see window_indices
+            generator_params: the arguments of generate_interactions
+    '''
+    # The version and the parameters of the preprocessing are part of the
+    # cache key: bump VERSION when changing preprocess or
+    # preprocess_streaming in a way the parameters do not describe.
+    VERSION = 1
+    PREPROCESS_PARAMS = {
+        "user": "user_id",
+        "kc": "skill_id",
+        "response": "correct",
+        "order": "order_id",
+    }
+
+    def __init__(
+        self, seq_len, dataset_dir=DATASET_DIR, memory_budget=None,
+        stride=None, **generator_params
+    ) -> None:
+        super().__init__()
+
+        self.dataset_dir = dataset_dir
+        self.generator_params = generator_params
+        self.dataset_path = os.path.join(
+            self.dataset_dir,
+            "synthetic_{}.csv".format(artifact_key(**generator_params)[:16])
+        )
+
+        if not os.path.exists(self.dataset_path):
+            os.makedirs(self.dataset_dir, exist_ok=True)
+            generate_interactions(**generator_params)\
+                .to_csv(self.dataset_path, index=False)
+
+        self.cache_key = prepare_sequences(self, memory_budget)
+
+        self.q_seqs, self.r_seqs, self.seq_offsets, self.q_list, \
+            self.u_list, self.q2idx, self.u2idx = \
+            load_sequences(self.dataset_dir)
+
+        self.num_u = self.u_list.shape[0]
+        self.num_q = self.q_list.shape[0]
+
+        # Only the (user, start, length) of every window is stored, the
+        # sequences are sliced from the memory-mapped cache on access.
+        self.windows = window_indices(
+            self.seq_offsets, seq_len, stride
+        )
+
+        self.len = len(self.windows)
+
+    def __getitem__(self, index):
+        u, start, length = self.windows[index]
+        start += self.seq_offsets[u]
+
+        return self.q_seqs[start:start + length], \
+            self.r_seqs[start:start + length]
+
+    def __len__(self):
+        return self.len
+
+    def preprocess(self):
+        df = pd.read_csv(self.dataset_path).sort_values(by=["order_id"])
+
+        q_seqs, r_seqs, q_list, u_list, q2idx, u2idx = build_sequences(
+            df, "user_id", "skill_id", "correct"
+        )
+
+        save_sequences(
+            self.dataset_dir, q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+        )
+
+        return q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+
+    def preprocess_streaming(self, memory_budget):
+        stream_sequences(
+            self.dataset_path, self.dataset_dir,
+            "user_id", "skill_id", "correct",
+            order_col="order_id",
+            memory_budget=memory_budget,
+        )
@@ -0,0 +1,148 @@
+import os
+
+import math
+
+import torch
+import torch.distributed as dist
+
+from torch.utils.data import Sampler
+
+
+def init_distributed(num_threads=None):
+    '''
+        Joins the process group of the data-parallel training when the
+        process was launched by torchrun, e.g. on every host with:
+
+            torchrun --nnodes 2 --node_rank 0 --nproc_per_node 8 \
+                --master_addr host0 --master_port 29500 train.py
+
+        The gloo backend is used, which runs on CPU-only machines.
+
+        Args:
+            num_threads: the number of intra-op threads of every rank, by \
+                default the cores of the host divided by its ranks
+
+        Returns:
+            rank: the rank of the process, 0 without torchrun
+            world_size: the number of processes, 1 without torchrun
+    '''
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return 0, 1
+
+    if not dist.is_initialized():
+        dist.init_process_group("gloo")
+
+    # The ranks of a host would oversubscribe its cores with the default
+    # number of threads of every process.
+    if num_threads is None:
+        local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+        num_threads = max(1, (os.cpu_count() or 1) // local_world_size)
+    torch.set_num_threads(num_threads)
+
+    return dist.get_rank(), dist.get_world_size()
+
+
+def get_rank():
+    return dist.get_rank() if dist.is_initialized() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if dist.is_initialized() else 1
+
+
+# The rank 0, then the first rank of every other host, then the other ranks
+PREPARATION_STAGES = 3
+
+
+def preparation_stage(rank):
+    '''
+        Returns the stage in which the rank prepares the dataset cache and
+        the checkpoint directory: 0 for the rank 0, 1 for the first rank of
+        every other host and 2 for the other ranks. A host that does not
+        share the filesystem of the rank 0 builds its own cache once, in
+        stage 1, and its other ranks only read it.
+    '''
+    if rank == 0:
+        return 0
+
+    return 1 if int(os.environ.get("LOCAL_RANK", 0)) == 0 else 2
+
+
+def wait_barriers(num_barriers):
+    '''
+        Waits for num_barriers barriers, or returns without the process
+        group.
+    '''
+    if get_world_size() == 1:
+        return
+
+    for _ in range(num_barriers):
+        dist.barrier()
+
+
+def broadcast_object(obj, src=0):
+    '''
+        Returns the obj of the rank src on every rank, or obj without the
+        process group.
+    '''
+    if get_world_size() == 1:
+        return obj
+
+    objs = [obj]
+    dist.broadcast_object_list(objs, src=src)
+
+    return objs[0]
+
+
+def all_gather_objects(obj):
+    '''
+        Returns the list of obj of every rank, or [obj] without the process
+        group.
+    '''
+    if get_world_size() == 1:
+        return [obj]
+
+    objs = [None] * get_world_size()
+    dist.all_gather_object(objs, obj)
+
+    return objs
+
+
+def all_reduce(values, op=dist.ReduceOp.SUM):
+    '''
+        Reduces a list of floats over the ranks and returns the reduced list.
+    '''
+    if get_world_size() == 1:
+        return values
+
+    t = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(t, op=op)
+
+    return t.tolist()
+
+
+class ShardSampler(Sampler):
+    '''
+        Splits the indices of a dataset over the ranks without padding, so
+        that every window is evaluated exactly once. Unlike
+        DistributedSampler, the ranks can get one index more than others,
+        which is only safe without collective operations in the loop.
+
+        Args:
+            num_samples: the number of samples of the dataset
+            num_replicas: the number of ranks, by default the world size
+            rank: the rank of the process, by default the current rank
+    '''
+    def __init__(self, num_samples, num_replicas=None, rank=None):
+        self.num_samples = num_samples
+        self.num_replicas = num_replicas or get_world_size()
+        self.rank = get_rank() if rank is None else rank
+
+    def __iter__(self):
+        return iter(range(self.rank, self.num_samples, self.num_replicas))
+
+    def __len__(self):
+        return max(
+            0, math.ceil((self.num_samples - self.rank) / self.num_replicas)
+        )
@@ -1,11 +1,8 @@
-import os
-
-import numpy as np
 import torch
 
 from torch.nn import Module, Embedding, LSTM, Linear, Dropout
-from torch.nn.functional import one_hot, binary_cross_entropy
-from sklearn import metrics
+
+from models.utils import bce_loss, run_rnn
 
 
 class DKT(Module):
@@ -14,12 +11,15 @@ class DKT(Module):
             num_q: the total number of the questions(KCs) in the given dataset
             emb_size: the dimension of the embedding vectors in this model
             hidden_size: the dimension of the hidden vectors in this model
+            packed: whether to pack the padded sequences with their true \
+                lengths so that the LSTM skips the padded timesteps
     '''
-    def __init__(self, num_q, emb_size, hidden_size):
+    def __init__(self, num_q, emb_size, hidden_size, packed=False):
         super().__init__()
         self.num_q = num_q
         self.emb_size = emb_size
         self.hidden_size = hidden_size
+        self.packed = packed
 
         self.interaction_emb = Embedding(self.num_q * 2, self.emb_size)
         self.lstm_layer = LSTM(
@@ -28,94 +28,63 @@ class DKT(Module):
         self.out_layer = Linear(self.hidden_size, self.num_q)
         self.dropout_layer = Dropout()
 
-    def forward(self, q, r):
+    def forward(self, q, r, m=None, qry=None):
         '''
             Args:
                 q: the question(KC) sequence with the size of [batch_size, n]
                 r: the response sequence with the size of [batch_size, n]
+                m: the mask sequence with the size of [batch_size, n], \
+                    only used to pack the sequences when packed is set
+                qry: the query sequence with the size of [batch_size, n], \
+                    where the query is the question(KC) to predict at every \
+                    timestep. None to predict all the questions(KCs).
 
             Returns:
-                y: the knowledge level about the all questions(KCs)
+                y: the knowledge level about the all questions(KCs) with \
+                    the size of [batch_size, n, num_q], or about the queries \
+                    with the size of [batch_size, n] when qry is given
         '''
         x = q + self.num_q * r
 
-        h, _ = self.lstm_layer(self.interaction_emb(x))
-        y = self.out_layer(h)
+        h = run_rnn(
+            self.lstm_layer, self.interaction_emb(x),
+            m if self.packed else None
+        )
+
+        if qry is None:
+            y = self.out_layer(h)
+        else:
+            # Only the rows of out_layer of the queries are computed, instead
+            # of the num_q outputs of every timestep.
+            y = (h * self.out_layer.weight[qry]).sum(-1) + \
+                self.out_layer.bias[qry]
+
         y = self.dropout_layer(y)
         y = torch.sigmoid(y)
 
         return y
 
-    def train_model(
-        self, train_loader, test_loader, num_epochs, opt, ckpt_path
-    ):
+    def compute_loss(self, batch):
         '''
             Args:
-                train_loader: the PyTorch DataLoader instance for training
-                test_loader: the PyTorch DataLoader instance for test
-                num_epochs: the number of epochs
-                opt: the optimization to train this model
-                ckpt_path: the path to save this model's parameters
-        '''
-        aucs = []
-        loss_means = []
-
-        max_auc = 0
-
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
-
-            for data in train_loader:
-                q, r, qshft, rshft, m = data
-
-                self.train()
-
-                y = self(q.long(), r.long())
-                y = (y * one_hot(qshft.long(), self.num_q)).sum(-1)
-
-                y = torch.masked_select(y, m)
-                t = torch.masked_select(rshft, m)
-
-                opt.zero_grad()
-                loss = binary_cross_entropy(y, t)
-                loss.backward()
-                opt.step()
+                batch: the batch from collate_fn on the device of the model
 
-                loss_mean.append(loss.detach().cpu().numpy())
-
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, qshft, rshft, m = data
-
-                    self.eval()
-
-                    y = self(q.long(), r.long())
-                    y = (y * one_hot(qshft.long(), self.num_q)).sum(-1)
-
-                    y = torch.masked_select(y, m).detach().cpu()
-                    t = torch.masked_select(rshft, m).detach().cpu()
-
-                    auc = metrics.roc_auc_score(
-                        y_true=t.numpy(), y_score=y.numpy()
-                    )
-
-                    loss_mean = np.mean(loss_mean)
+            Returns:
+                loss: the training loss of the batch
+        '''
+        return bce_loss(*self.predict_targets(batch))
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    if auc > max_auc:
-                        torch.save(
-                            self.state_dict(),
-                            os.path.join(
-                                ckpt_path, "model.ckpt"
-                            )
-                        )
-                        max_auc = auc
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, qshft, rshft, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        y = self(q, r, m, qshft)
 
-        return aucs, loss_means
+        return torch.masked_select(y, m), torch.masked_select(rshft, m)
@@ -1,11 +1,8 @@
-import os
-
-import numpy as np
 import torch
 
 from torch.nn import Module, Embedding, LSTM, Linear, Dropout
-from torch.nn.functional import one_hot, binary_cross_entropy
-from sklearn import metrics
+
+from models.utils import bce_loss, select_targets, run_rnn
 
 
 class DKTPlus(Module):
@@ -17,14 +14,18 @@ class DKTPlus(Module):
             lambda_r: the hyperparameter of this model
             lambda_w1: the hyperparameter of this model
             lambda_w2: the hyperparameter of this model
+            packed: whether to pack the padded sequences with their true \
+                lengths so that the LSTM skips the padded timesteps
     '''
     def __init__(
-        self, num_q, emb_size, hidden_size, lambda_r, lambda_w1, lambda_w2
+        self, num_q, emb_size, hidden_size, lambda_r, lambda_w1, lambda_w2,
+        packed=False
     ):
         super().__init__()
         self.num_q = num_q
         self.emb_size = emb_size
         self.hidden_size = hidden_size
+        self.packed = packed
         self.lambda_r = lambda_r
         self.lambda_w1 = lambda_w1
         self.lambda_w2 = lambda_w2
@@ -36,110 +37,75 @@ class DKTPlus(Module):
         self.out_layer = Linear(self.hidden_size, self.num_q)
         self.dropout_layer = Dropout()
 
-    def forward(self, q, r):
+    def forward(self, q, r, m=None):
         '''
             Args:
                 q: the question(KC) sequence with the size of [batch_size, n]
                 r: the response sequence with the size of [batch_size, n]
+                m: the mask sequence with the size of [batch_size, n], \
+                    only used to pack the sequences when packed is set
 
             Returns:
                 y: the knowledge level about the all questions(KCs)
         '''
         x = q + self.num_q * r
 
-        h, _ = self.lstm_layer(self.interaction_emb(x))
+        h = run_rnn(
+            self.lstm_layer, self.interaction_emb(x),
+            m if self.packed else None
+        )
         y = self.out_layer(h)
         y = self.dropout_layer(y)
         y = torch.sigmoid(y)
 
         return y
 
-    def train_model(
-        self, train_loader, test_loader, num_epochs, opt, ckpt_path
-    ):
+    def compute_loss(self, batch):
         '''
             Args:
-                train_loader: the PyTorch DataLoader instance for training
-                test_loader: the PyTorch DataLoader instance for test
-                num_epochs: the number of epochs
-                opt: the optimization to train this model
-                ckpt_path: the path to save this model's parameters
-        '''
-        aucs = []
-        loss_means = []
-
-        max_auc = 0
-
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
-
-            for data in train_loader:
-                q, r, qshft, rshft, m = data
-
-                self.train()
-
-                y = self(q.long(), r.long())
-                y_curr = (y * one_hot(q.long(), self.num_q)).sum(-1)
-                y_next = (y * one_hot(qshft.long(), self.num_q)).sum(-1)
-
-                y_curr = torch.masked_select(y_curr, m)
-                y_next = torch.masked_select(y_next, m)
-                r = torch.masked_select(r, m)
-                rshft = torch.masked_select(rshft, m)
-
-                loss_w1 = torch.masked_select(
-                    torch.norm(y[:, 1:] - y[:, :-1], p=1, dim=-1),
-                    m[:, 1:]
-                )
-                loss_w2 = torch.masked_select(
-                    (torch.norm(y[:, 1:] - y[:, :-1], p=2, dim=-1) ** 2),
-                    m[:, 1:]
-                )
+                batch: the batch from collate_fn on the device of the model
 
-                opt.zero_grad()
-                loss = \
-                    binary_cross_entropy(y_next, rshft) + \
-                    self.lambda_r * binary_cross_entropy(y_curr, r) + \
-                    self.lambda_w1 * loss_w1.mean() / self.num_q + \
-                    self.lambda_w2 * loss_w2.mean() / self.num_q
-                loss.backward()
-                opt.step()
-
-                loss_mean.append(loss.detach().cpu().numpy())
-
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, qshft, rshft, m = data
-
-                    self.eval()
+            Returns:
+                loss: the training loss of the batch
+        '''
+        q, r, qshft, rshft, m = batch
 
-                    y = self(q.long(), r.long())
-                    y_next = (y * one_hot(qshft.long(), self.num_q)).sum(-1)
+        y = self(q, r, m)
+        y_curr = select_targets(y, q)
+        y_next = select_targets(y, qshft)
 
-                    y_next = torch.masked_select(y_next, m).detach().cpu()
-                    rshft = torch.masked_select(rshft, m).detach().cpu()
+        y_curr = torch.masked_select(y_curr, m)
+        y_next = torch.masked_select(y_next, m)
+        r = torch.masked_select(r, m)
+        rshft = torch.masked_select(rshft, m)
 
-                    auc = metrics.roc_auc_score(
-                        y_true=rshft.numpy(), y_score=y_next.numpy()
-                    )
+        loss_w1 = torch.masked_select(
+            torch.norm(y[:, 1:] - y[:, :-1], p=1, dim=-1),
+            m[:, 1:]
+        )
+        loss_w2 = torch.masked_select(
+            (torch.norm(y[:, 1:] - y[:, :-1], p=2, dim=-1) ** 2),
+            m[:, 1:]
+        )
 
-                    loss_mean = np.mean(loss_mean)
+        return \
+            bce_loss(y_next, rshft) + \
+            self.lambda_r * bce_loss(y_curr, r) + \
+            self.lambda_w1 * loss_w1.mean() / self.num_q + \
+            self.lambda_w2 * loss_w2.mean() / self.num_q
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    if auc > max_auc:
-                        torch.save(
-                            self.state_dict(),
-                            os.path.join(
-                                ckpt_path, "model.ckpt"
-                            )
-                        )
-                        max_auc = auc
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, qshft, rshft, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        y = self(q, r, m)
+        y_next = select_targets(y, qshft)
 
-        return aucs, loss_means
+        return torch.masked_select(y_next, m), torch.masked_select(rshft, m)
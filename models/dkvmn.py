@@ -1,12 +1,12 @@
-import os
-
-import numpy as np
 import torch
 
 from torch.nn import Module, Parameter, Embedding, Linear
 from torch.nn.init import kaiming_normal_
-from torch.nn.functional import binary_cross_entropy
-from sklearn import metrics
+
+from models.utils import bce_loss
+
+
+WRITES = ["loop", "scan"]
 
 
 class DKVMN(Module):
@@ -15,12 +15,24 @@ class DKVMN(Module):
             num_q: the total number of the questions(KCs) in the given dataset
             dim_s: the dimension of the state vectors in this model
             size_m: the memory size of this model
+            write: how to run the write process over the timesteps, "loop" \
+                for a loop over the timesteps, which reads the value memory \
+                on the fly, or "scan" for a parallel prefix scan in \
+                log2(n) steps, which keeps the value memory of every \
+                timestep
     '''
-    def __init__(self, num_q, dim_s, size_m):
+    def __init__(self, num_q, dim_s, size_m, write="loop"):
         super().__init__()
+
+        if write not in WRITES:
+            raise ValueError(
+                "The write should be in {}, got {}".format(WRITES, write)
+            )
+
         self.num_q = num_q
         self.dim_s = dim_s
         self.size_m = size_m
+        self.write = write
 
         self.k_emb_layer = Embedding(self.num_q, self.dim_s)
         self.Mk = Parameter(torch.Tensor(self.size_m, self.dim_s))
@@ -37,23 +49,23 @@ class DKVMN(Module):
         self.e_layer = Linear(self.dim_s, self.dim_s)
         self.a_layer = Linear(self.dim_s, self.dim_s)
 
-    def forward(self, q, r):
+    def forward(self, q, r, return_memory=False):
         '''
             Args:
                 q: the question(KC) sequence with the size of [batch_size, n]
                 r: the response sequence with the size of [batch_size, n]
+                return_memory: whether to return the value matrices of \
+                    every timestep, which the loop write does not keep \
+                    otherwise
 
             Returns:
                 p: the knowledge level about q
-                Mv: the value matrices from q, r
+                Mv: the value matrices from q, r with the size of \
+                    [batch_size, n + 1, size_m, dim_s], or None without \
+                    return_memory
         '''
         x = q + self.num_q * r
 
-        batch_size = x.shape[0]
-        Mvt = self.Mv0.unsqueeze(0).repeat(batch_size, 1, 1)
-
-        Mv = [Mvt]
-
         k = self.k_emb_layer(q)
         v = self.v_emb_layer(x)
 
@@ -63,97 +75,106 @@ class DKVMN(Module):
         e = torch.sigmoid(self.e_layer(v))
         a = torch.tanh(self.a_layer(v))
 
-        for et, at, wt in zip(
-            e.permute(1, 0, 2), a.permute(1, 0, 2), w.permute(1, 0, 2)
-        ):
-            Mvt = Mvt * (1 - (wt.unsqueeze(-1) * et.unsqueeze(1))) + \
-                (wt.unsqueeze(-1) * at.unsqueeze(1))
-            Mv.append(Mvt)
-
-        Mv = torch.stack(Mv, dim=1)
+        if self.write == "scan":
+            read, Mv = self.scan_write(w, e, a)
+        else:
+            read, Mv = self.loop_write(w, e, a, return_memory)
 
         # Read Process
-        f = torch.tanh(
-            self.f_layer(
-                torch.cat(
-                    [
-                        (w.unsqueeze(-1) * Mv[:, :-1]).sum(-2),
-                        k
-                    ],
-                    dim=-1
-                )
-            )
-        )
-        p = torch.sigmoid(self.p_layer(f)).squeeze()
+        f = torch.tanh(self.f_layer(torch.cat([read, k], dim=-1)))
+        p = torch.sigmoid(self.p_layer(f)).squeeze(-1)
 
-        return p, Mv
+        return p, Mv if return_memory else None
 
-    def train_model(
-        self, train_loader, test_loader, num_epochs, opt, ckpt_path
-    ):
+    def loop_write(self, w, e, a, return_memory=False):
         '''
-            Args:
-                train_loader: the PyTorch DataLoader instance for training
-                test_loader: the PyTorch DataLoader instance for test
-                num_epochs: the number of epochs
-                opt: the optimization to train this model
-                ckpt_path: the path to save this model's parameters
+            Runs the write process timestep by timestep, and reads the
+            value memory of every timestep before its write, so that the
+            value matrices are only stacked with return_memory.
+
+            Returns:
+                read: the read contents with the size of \
+                    [batch_size, n, dim_s]
+                Mv: the value matrices of every timestep, or None without \
+                    return_memory
         '''
-        aucs = []
-        loss_means = []
+        Mvt = self.Mv0.expand(w.shape[0], -1, -1)
 
-        max_auc = 0
+        Mv = [Mvt]
+        read = []
 
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
+        for et, at, wt in zip(e.unbind(1), a.unbind(1), w.unbind(1)):
+            read.append((wt.unsqueeze(1) @ Mvt).squeeze(1))
 
-            for data in train_loader:
-                q, r, _, _, m = data
+            Mvt = Mvt * (1 - (wt.unsqueeze(-1) * et.unsqueeze(1))) + \
+                (wt.unsqueeze(-1) * at.unsqueeze(1))
 
-                self.train()
+            if return_memory:
+                Mv.append(Mvt)
 
-                p, _ = self(q.long(), r.long())
-                p = torch.masked_select(p, m)
-                t = torch.masked_select(r, m).float()
+        read = torch.stack(read, dim=1)
+        Mv = torch.stack(Mv, dim=1) if return_memory else None
 
-                opt.zero_grad()
-                loss = binary_cross_entropy(p, t)
-                loss.backward()
-                opt.step()
+        return read, Mv
 
-                loss_mean.append(loss.detach().cpu().numpy())
+    def scan_write(self, w, e, a):
+        '''
+            Runs the write process Mvt = Mvt-1 * (1 - w e) + w a of all the
+            timesteps with a Hillis-Steele parallel prefix scan: every
+            timestep is an affine map of the value memory, and the maps of
+            the timesteps are composed in log2(n) steps instead of n.
 
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, _, _, m = data
+            Returns:
+                read: the read contents with the size of \
+                    [batch_size, n, dim_s]
+                Mv: the value matrices of every timestep with the size of \
+                    [batch_size, n + 1, size_m, dim_s]
+        '''
+        n = w.shape[1]
+
+        # Mvt = At * Mvt-1 + Bt
+        A = 1 - w.unsqueeze(-1) * e.unsqueeze(2)
+        B = w.unsqueeze(-1) * a.unsqueeze(2)
 
-                    self.eval()
+        d = 1
+        while d < n:
+            # Composes the map of every timestep with the map d timesteps
+            # before it
+            A, B = \
+                torch.cat([A[:, :d], A[:, d:] * A[:, :-d]], dim=1), \
+                torch.cat([B[:, :d], A[:, d:] * B[:, :-d] + B[:, d:]], dim=1)
+            d *= 2
 
-                    p, _ = self(q.long(), r.long())
-                    p = torch.masked_select(p, m).detach().cpu()
-                    t = torch.masked_select(r, m).float().detach().cpu()
+        Mv = torch.cat([
+            self.Mv0.expand(w.shape[0], 1, -1, -1),
+            A * self.Mv0 + B
+        ], dim=1)
 
-                    auc = metrics.roc_auc_score(
-                        y_true=t.numpy(), y_score=p.numpy()
-                    )
+        read = (w.unsqueeze(-2) @ Mv[:, :-1]).squeeze(-2)
 
-                    loss_mean = np.mean(loss_mean)
+        return read, Mv
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+    def compute_loss(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    if auc > max_auc:
-                        torch.save(
-                            self.state_dict(),
-                            os.path.join(
-                                ckpt_path, "model.ckpt"
-                            )
-                        )
-                        max_auc = auc
+            Returns:
+                loss: the training loss of the batch
+        '''
+        return bce_loss(*self.predict_targets(batch))
+
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
+
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, _, _, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        p, _ = self(q, r)
 
-        return aucs, loss_means
+        return torch.masked_select(p, m), torch.masked_select(r, m)
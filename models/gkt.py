@@ -1,13 +1,18 @@
-import os
+import math
 
 import numpy as np
 import torch
 
 from torch.nn import Module, Embedding, Parameter, Sequential, Linear, ReLU, \
-    Dropout, MultiheadAttention, GRU
-from torch.nn.init import kaiming_normal_
-from torch.nn.functional import one_hot, binary_cross_entropy
-from sklearn import metrics
+    Dropout, MultiheadAttention, GRUCell
+from torch.nn.init import kaiming_normal_, zeros_
+from torch.nn.functional import linear, softmax
+
+from models.utils import bce_loss
+
+
+GRAPHS = ["learned", "cooccurrence"]
+NUM_NEIGHBORS = 8
 
 
 def mlp(in_size, out_size):
@@ -19,6 +24,90 @@ def mlp(in_size, out_size):
     )
 
 
+def split_linear(layer, *xs):
+    '''
+        Applies the linear layer on the concatenation of xs over the last
+        dimension without concatenating them: every input is multiplied with
+        its block of the weight and the products are summed with
+        broadcasting, so that an input shared by all the nodes, e.g. with
+        the size of [batch_size, 1, d], is projected only once.
+    '''
+    y = layer.bias
+    start = 0
+
+    for x in xs:
+        x_y = linear(x, layer.weight[:, start:start + x.shape[-1]])
+        y = x_y if y is None else y + x_y
+        start += x.shape[-1]
+
+    return y
+
+
+def split_mlp(layers, *xs):
+    return layers[1:](split_linear(layers[0], *xs))
+
+
+def cooccurrence_graph(q_seqs, seq_offsets, num_q, num_neighbors):
+    '''
+        Builds a fixed graph of the questions(KCs) from the sequences: the
+        neighbors of every question(KC) are the questions(KCs) that most
+        often directly precede or follow it in the sequences of the users,
+        completed with the most frequent questions(KCs) when it has fewer
+        than num_neighbors of them. The responses are not used.
+
+        Args:
+            q_seqs: the question(KC) sequences of all the users concatenated
+            seq_offsets: the offsets of the sequence of every user in \
+                q_seqs with the size of [num_users + 1]
+            num_q: the total number of the questions(KCs)
+            num_neighbors: the number of the neighbors of every \
+                question(KC), at most num_q - 1
+
+        Returns:
+            neighbors: the neighbors of every question(KC), the most \
+                frequent first, with the size of [num_q, num_neighbors]
+    '''
+    q = np.asarray(q_seqs, dtype=np.int64)
+    num_neighbors = min(num_neighbors, num_q - 1)
+
+    # The consecutive interactions of the same user, in both directions
+    last = np.zeros(len(q), dtype=bool)
+    last[np.asarray(seq_offsets)[1:] - 1] = True
+    src = q[:-1][~last[:-1]]
+    dst = q[1:][~last[:-1]]
+    src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+
+    keep = src != dst
+    pairs, counts = np.unique(src[keep] * num_q + dst[keep],
+                              return_counts=True)
+    src, dst = np.divmod(pairs, num_q)
+
+    # The most frequent questions(KCs) complete every neighbor list
+    popular = np.argsort(-np.bincount(q, minlength=num_q), kind="stable")
+    rank = np.empty(num_q, dtype=np.int64)
+    rank[popular] = np.arange(num_q)
+
+    fill_src = np.repeat(np.arange(num_q), num_neighbors + 1)
+    fill_dst = np.tile(popular[:num_neighbors + 1], num_q)
+    keep = fill_src != fill_dst
+
+    src = np.concatenate([src, fill_src[keep]])
+    dst = np.concatenate([dst, fill_dst[keep]])
+    counts = np.concatenate([counts, np.zeros(keep.sum(), dtype=np.int64)])
+
+    order = np.lexsort((rank[dst], -counts, src))
+    src, dst = src[order], dst[order]
+
+    # Keeps the first, most frequent, occurrence of every edge
+    _, first = np.unique(src * num_q + dst, return_index=True)
+    first = np.sort(first)
+    src, dst = src[first], dst[first]
+
+    pos = np.arange(len(src)) - np.searchsorted(src, np.arange(num_q))[src]
+
+    return dst[pos < num_neighbors].reshape(num_q, num_neighbors)
+
+
 class GKT(Module):
     '''
         Args:
@@ -29,16 +118,31 @@ class GKT(Module):
                 the number of the attention heads in the multi-head attention
                 module in this model.
                 This argument would be used when the method is MHA.
+            compile_step: whether to run the timesteps with a torch.compile \
+                version of step, which fuses the operations of a timestep
 
         Note that this implementation is not exactly the same as the original
         paper. The erase-add gate was not implemented since the reason for
         the gate can't be found. And the batch normalization in MLP was not
         implemented because of the simplicity.
+
+        The graph state is never copied over the batch: the parameters
+        shared by all the users are broadcast, only the row and the column
+        of the answered question(KC) are read from the adjacency matrix, and
+        the MLPs of the concatenated node inputs are applied block by block
+        with split_linear.
+
+        Every node is updated from its message by the same GRU cell, all the
+        nodes at once, as in the paper.
     '''
-    def __init__(self, num_q, hidden_size, num_attn_heads, method):
+    def __init__(
+        self, num_q, hidden_size, num_attn_heads, method, compile_step=False
+    ):
         super().__init__()
         self.num_q = num_q
         self.hidden_size = hidden_size
+        self.compile_step = compile_step
+        self._compiled_step = None
 
         self.x_emb = Embedding(self.num_q * 2, self.hidden_size)
         self.q_emb = Parameter(torch.Tensor(self.num_q, self.hidden_size))
@@ -49,162 +153,180 @@ class GKT(Module):
 
         self.mlp_self = mlp(self.hidden_size * 2, self.hidden_size)
 
-        self.gru = GRU(
-            self.hidden_size * 2,
-            self.hidden_size,
-            batch_first=True
-        )
+        self.gru = GRUCell(self.hidden_size, self.hidden_size)
 
         self.bias = Parameter(torch.Tensor(1, self.num_q, 1))
         self.out_layer = Linear(self.hidden_size, 1, bias=False)
 
-    def forward(self, q, r):
+        zeros_(self.init_h)
+        zeros_(self.bias)
+
+    def forward(self, q, r, return_hidden=False, qry=None):
         '''
             Args:
                 q: the question(KC) sequence with the size of [batch_size, n]
                 r: the response sequence with the size of [batch_size, n]
+                return_hidden: whether to return the hidden states of every \
+                    timestep, which are not kept otherwise
+                qry: the query sequence with the size of [batch_size, n], \
+                    where the query is the question(KC) to predict at every \
+                    timestep. None to predict all the questions(KCs).
 
             Returns:
-                y: the knowledge level about the all questions(KCs)
-                h: the hidden states of the all questions(KCs)
+                y: the knowledge level about the all questions(KCs) with \
+                    the size of [batch_size, n, num_q], or about the queries \
+                    with the size of [batch_size, n] when qry is given
+                h: the hidden states of the all questions(KCs) with the \
+                    size of [batch_size, n + 1, num_q, hidden_size], or \
+                    None without return_hidden
         '''
         batch_size = q.shape[0]
 
         x = q + self.num_q * r
 
         x_emb = self.x_emb(x)
-        q_emb = self.q_emb.unsqueeze(0).repeat(batch_size, 1, 1)
 
-        q_onehot = one_hot(q, self.num_q)
+        nodes = torch.arange(self.num_q, device=q.device)
+        users = torch.arange(batch_size, device=q.device)
+
+        step = self.compiled_step() if self.compile_step else self.step
 
-        ht = self.init_h.unsqueeze(0).repeat(batch_size, 1, 1)
+        ht = self.init_h.expand(batch_size, -1, -1)
         h = [ht]
         y = []
 
-        for xt_emb, qt, qt_onehot in zip(
-            x_emb.permute(1, 0, 2), q.permute(1, 0), q_onehot.permute(1, 0, 2)
-        ):
-            ht_ = self.aggregate(xt_emb, qt_onehot, q_emb, ht)
+        qry = q.shape[1] * [None] if qry is None else qry.unbind(1)
 
-            ht = self.update(ht, ht_, qt, qt_onehot)
-            yt = self.predict(ht)
+        for xt_emb, qt, qryt in zip(x_emb.unbind(1), q.unbind(1), qry):
+            ht, yt = step(ht, xt_emb, qt, qryt, nodes, users)
 
-            h.append(ht)
+            if return_hidden:
+                h.append(ht)
             y.append(yt)
 
-        h = torch.stack(h, dim=1)
         y = torch.stack(y, dim=1)
+        h = torch.stack(h, dim=1) if return_hidden else None
 
         return y, h
 
-    def aggregate(self, xt_emb, qt_onehot, q_emb, ht):
-        xt_emb = xt_emb.unsqueeze(1).repeat(1, self.num_q, 1)
-        qt_onehot = qt_onehot.unsqueeze(-1)
-
-        ht_ = qt_onehot * torch.cat([ht, xt_emb], dim=-1) + \
-            (1 - qt_onehot) * torch.cat([ht, q_emb], dim=-1)
-
-        return ht_
-
-    def f_self(self, ht_):
-        return self.mlp_self(ht_)
-
-    def f_neighbor(self, ht_, qt):
-        pass
-
-    def update(self, ht, ht_, qt, qt_onehot):
-        qt_onehot = qt_onehot.unsqueeze(-1)
-
-        m = qt_onehot * self.f_self(ht_) + \
-            (1 - qt_onehot) * self.f_neighbor(ht_, qt)
-
-        ht, _ = self.gru(
-            torch.cat([m, ht], dim=-1)
-        )
-
-        return ht
-
-    def predict(self, ht):
-        return torch.sigmoid(self.out_layer(ht) + self.bias).squeeze()
-
-    def train_model(
-        self, train_loader, test_loader, num_epochs, opt, ckpt_path
-    ):
+    def step(self, ht, xt_emb, qt, qryt, nodes, users):
         '''
             Args:
-                train_loader: the PyTorch DataLoader instance for training
-                test_loader: the PyTorch DataLoader instance for test
-                num_epochs: the number of epochs
-                opt: the optimization to train this model
-                ckpt_path: the path to save this model's parameters
-        '''
-        aucs = []
-        loss_means = []
+                ht: the hidden states of the all questions(KCs) with the \
+                    size of [batch_size, num_q, hidden_size]
+                xt_emb: the embeddings of the interactions of the timestep \
+                    with the size of [batch_size, hidden_size]
+                qt: the questions(KCs) of the timestep with the size of \
+                    [batch_size]
+                qryt: the queries of the timestep with the size of \
+                    [batch_size], or None
+                nodes: torch.arange(num_q)
+                users: torch.arange(batch_size)
 
-        max_auc = 0
+            Returns:
+                ht: the hidden states after the timestep
+                yt: the knowledge level about the all questions(KCs), or \
+                    about the queries qryt, after the timestep
+        '''
+        # Whether every node is the answered question(KC)
+        mask = (qt.unsqueeze(-1) == nodes).unsqueeze(-1)
 
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
+        ht = self.update(ht, xt_emb, qt, mask, users)
 
-            for data in train_loader:
-                q, r, qshft, rshft, m = data
+        return ht, self.predict(ht, qryt, users)
 
-                self.train()
+    def compiled_step(self):
+        '''
+            Returns step compiled with torch.compile, compiled once at the
+            first call. Only one timestep is compiled, so that the graph
+            does not grow with the sequence length.
+        '''
+        if self._compiled_step is None:
+            self._compiled_step = torch.compile(self.step)
 
-                y, _ = self(q.long(), r.long())
-                y = (y * one_hot(qshft.long(), self.num_q)).sum(-1)
+        return self._compiled_step
 
-                y = torch.masked_select(y, m)
-                t = torch.masked_select(rshft, m)
+    def aggregate(self, ht, xt_emb, qt, mask, users):
+        '''
+            Returns the embeddings of the node inputs, xt_emb for the
+            answered node and q_emb for the others, with the size of
+            [batch_size, num_q, hidden_size], and the input (ht[qt], xt_emb)
+            of the answered node.
+        '''
+        et = torch.where(mask, xt_emb.unsqueeze(1), self.q_emb)
 
-                opt.zero_grad()
-                loss = binary_cross_entropy(y, t)
-                loss.backward()
-                opt.step()
+        return et, (ht[users, qt], xt_emb)
 
-                loss_mean.append(loss.detach().cpu().numpy())
+    def f_self(self, tgt):
+        return split_mlp(self.mlp_self, *tgt)
 
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, qshft, rshft, m = data
+    def f_neighbor(self, ht, et, tgt, qt):
+        raise NotImplementedError
 
-                    self.eval()
+    def update(self, ht, xt_emb, qt, mask, users):
+        et, tgt = self.aggregate(ht, xt_emb, qt, mask, users)
 
-                    y, _ = self(q.long(), r.long())
-                    y = (y * one_hot(qshft.long(), self.num_q)).sum(-1)
+        m = torch.where(
+            mask,
+            self.f_self(tgt).unsqueeze(1),
+            self.f_neighbor(ht, et, tgt, qt)
+        )
 
-                    y = torch.masked_select(y, m).detach().cpu()
-                    t = torch.masked_select(rshft, m).detach().cpu()
+        return self.update_nodes(m, ht)
 
-                    auc = metrics.roc_auc_score(
-                        y_true=t.numpy(), y_score=y.numpy()
-                    )
+    def update_nodes(self, m, ht):
+        '''
+            Updates the hidden state of every node from its message m with
+            the GRU cell, the batch_size * num_q nodes in one call.
+        '''
+        return self.gru(
+            m.reshape(-1, self.hidden_size),
+            ht.reshape(-1, self.hidden_size)
+        ).view_as(m)
+
+    def predict(self, ht, qryt=None, users=None):
+        if qryt is None:
+            return torch.sigmoid(self.out_layer(ht) + self.bias).squeeze(-1)
+
+        # Only the nodes of the queries are read out, so that ht is not kept
+        # for the backward pass of out_layer
+        return torch.sigmoid(
+            self.out_layer(ht[users, qryt]) + self.bias[0, qryt]
+        ).squeeze(-1)
+
+    def compute_loss(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    loss_mean = np.mean(loss_mean)
+            Returns:
+                loss: the training loss of the batch
+        '''
+        return bce_loss(*self.predict_targets(batch))
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    if auc > max_auc:
-                        torch.save(
-                            self.state_dict(),
-                            os.path.join(
-                                ckpt_path, "model.ckpt"
-                            )
-                        )
-                        max_auc = auc
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, qshft, rshft, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        y, _ = self(q, r, qry=qshft)
 
-        return aucs, loss_means
+        return torch.masked_select(y, m), torch.masked_select(rshft, m)
 
 
 class PAM(GKT):
-    def __init__(self, num_q, hidden_size, num_attn_heads, method):
-        super().__init__(num_q, hidden_size, num_attn_heads, method)
+    def __init__(
+        self, num_q, hidden_size, num_attn_heads, method, compile_step=False
+    ):
+        super().__init__(
+            num_q, hidden_size, num_attn_heads, method, compile_step
+        )
 
         self.A = Parameter(torch.Tensor(self.num_q, self.num_q))
         kaiming_normal_(self.A)
@@ -212,43 +334,28 @@ class PAM(GKT):
         self.mlp_outgo = mlp(self.hidden_size * 4, self.hidden_size)
         self.mlp_income = mlp(self.hidden_size * 4, self.hidden_size)
 
-    def f_neighbor(self, ht_, qt):
-        batch_size = qt.shape[0]
-        src = ht_
-        tgt = torch.gather(
-            ht_,
-            dim=1,
-            index=qt.unsqueeze(-1).unsqueeze(-1).repeat(1, 1, ht_.shape[-1])
-        )
+    def f_neighbor(self, ht, et, tgt, qt):
+        tgt_h, xt_emb = tgt
+        # The inputs [tgt, src] of the nodes, with tgt broadcast
+        inputs = (tgt_h.unsqueeze(1), xt_emb.unsqueeze(1), ht, et)
 
-        Aij = torch.gather(
-            self.A.unsqueeze(0).repeat(batch_size, 1, 1),
-            dim=1,
-            index=qt.unsqueeze(-1).unsqueeze(-1).repeat(1, 1, self.A.shape[-1])
-        ).squeeze()
+        # The row and the column of the answered question(KC)
+        Aij = self.A[qt]
+        Aji = self.A[:, qt].T
 
-        outgo_part = Aij.unsqueeze(-1) * \
-            self.mlp_outgo(
-                torch.cat([tgt.repeat(1, self.num_q, 1), src], dim=-1)
-            )
-
-        Aji = torch.gather(
-            self.A.unsqueeze(0).repeat(batch_size, 1, 1),
-            dim=2,
-            index=qt.unsqueeze(-1).unsqueeze(-1).repeat(1, self.A.shape[-1], 1)
-        ).squeeze()
-
-        income_part = Aji.unsqueeze(-1) * \
-            self.mlp_income(
-                torch.cat([tgt.repeat(1, self.num_q, 1), src], dim=-1)
-            )
+        outgo_part = Aij.unsqueeze(-1) * split_mlp(self.mlp_outgo, *inputs)
+        income_part = Aji.unsqueeze(-1) * split_mlp(self.mlp_income, *inputs)
 
         return outgo_part + income_part
 
 
 class MHA(GKT):
-    def __init__(self, num_q, hidden_size, num_attn_heads, method):
-        super().__init__(num_q, hidden_size, num_attn_heads, method)
+    def __init__(
+        self, num_q, hidden_size, num_attn_heads, method, compile_step=False
+    ):
+        super().__init__(
+            num_q, hidden_size, num_attn_heads, method, compile_step
+        )
         self.num_attn_heads = num_attn_heads
 
         #############################################################
@@ -278,25 +385,162 @@ class MHA(GKT):
             self.num_attn_heads,
         )
 
-    def f_neighbor(self, ht_, qt):
-        src = ht_
-        tgt = torch.gather(
-            ht_,
-            dim=1,
-            index=qt.unsqueeze(-1).unsqueeze(-1).repeat(1, 1, ht_.shape[-1])
+    def f_neighbor(self, ht, et, tgt, qt):
+        tgt_h, xt_emb = tgt
+
+        q = split_linear(self.Q, tgt_h, xt_emb).unsqueeze(1)
+        k = split_linear(self.K, ht, et)
+        v = split_linear(
+            self.V, tgt_h.unsqueeze(1), xt_emb.unsqueeze(1), ht, et
+        )
+
+        weights = self.attention_weights(q, k)
+
+        return weights.permute(0, 2, 1) * v
+
+    def attention_weights(self, q, k):
+        '''
+            Returns the attention weights of self.mha averaged over the
+            heads, with the size of [batch_size, 1, num_q], without
+            computing the output of the attention, which is not used.
+        '''
+        batch_size = q.shape[0]
+        head_size = self.hidden_size // self.num_attn_heads
+
+        w_q, w_k, _ = self.mha.in_proj_weight.chunk(3)
+        b_q, b_k, _ = self.mha.in_proj_bias.chunk(3)
+
+        q = linear(q, w_q, b_q)\
+            .view(batch_size, -1, self.num_attn_heads, head_size)\
+            .transpose(1, 2)
+        k = linear(k, w_k, b_k)\
+            .view(batch_size, -1, self.num_attn_heads, head_size)\
+            .transpose(1, 2)
+
+        weights = softmax(
+            q @ k.transpose(-1, -2) / math.sqrt(head_size), dim=-1
+        )
+
+        # Average attention weights over heads, as MultiheadAttention
+        return weights.mean(1)
+
+
+class SparsePAM(GKT):
+    '''
+        PAM on a sparse graph, where every question(KC) has num_neighbors
+        neighbors. A timestep only updates the answered question(KC) and its
+        neighbors, so that its cost grows with num_neighbors instead of
+        num_q.
+
+        Args:
+            num_neighbors: the number of the neighbors of every question(KC)
+            graph:
+                "learned" to pick the neighbors of the answered question(KC)
+                at every timestep as its num_neighbors strongest edges
+                |A_ij| + |A_ji| over a dense learned A, as in PAM.
+                "cooccurrence" for the fixed neighbors given by neighbors,
+                with a learned weight for every edge and direction.
+            neighbors: the fixed neighbors with the size of \
+                [num_q, num_neighbors] for the "cooccurrence" graph, e.g. \
+                from cooccurrence_graph. They are a buffer of the model, so \
+                they can be left out to load the model from a checkpoint.
+    '''
+    def __init__(
+        self, num_q, hidden_size, num_attn_heads, method, compile_step=False,
+        num_neighbors=NUM_NEIGHBORS, graph="learned", neighbors=None
+    ):
+        super().__init__(
+            num_q, hidden_size, num_attn_heads, method, compile_step
         )
 
-        q = self.Q(tgt)
-        k = self.K(src)
-        v = self.V(
-            torch.cat([tgt.repeat(1, self.num_q, 1), src], dim=-1)
+        if graph not in GRAPHS:
+            raise ValueError(
+                "The graph should be in {}, got {}".format(GRAPHS, graph)
+            )
+
+        self.graph = graph
+        self.num_neighbors = min(num_neighbors, self.num_q - 1)
+
+        if self.graph == "learned":
+            self.A = Parameter(torch.Tensor(self.num_q, self.num_q))
+            kaiming_normal_(self.A)
+        else:
+            if neighbors is None:
+                neighbors = torch.zeros(
+                    self.num_q, self.num_neighbors, dtype=torch.long
+                )
+            neighbors = torch.as_tensor(neighbors, dtype=torch.long)
+            self.num_neighbors = neighbors.shape[1]
+
+            self.register_buffer("neighbors", neighbors)
+
+            self.A_out = Parameter(
+                torch.Tensor(self.num_q, self.num_neighbors)
+            )
+            self.A_in = Parameter(
+                torch.Tensor(self.num_q, self.num_neighbors)
+            )
+            kaiming_normal_(self.A_out)
+            kaiming_normal_(self.A_in)
+
+        self.mlp_outgo = mlp(self.hidden_size * 4, self.hidden_size)
+        self.mlp_income = mlp(self.hidden_size * 4, self.hidden_size)
+
+    def edges(self, qt):
+        '''
+            Returns the neighbors of the questions(KCs) qt, and the weights
+            of the edges from and to them, each with the size of
+            [batch_size, num_neighbors].
+        '''
+        if self.graph == "cooccurrence":
+            return self.neighbors[qt], self.A_out[qt], self.A_in[qt]
+
+        Aij = self.A[qt]
+        Aji = self.A[:, qt].T
+
+        # The answered question(KC) is not its own neighbor
+        scores = (Aij.abs() + Aji.abs()).detach()\
+            .scatter(1, qt.unsqueeze(-1), -1.)
+        neighbors = scores.topk(self.num_neighbors, dim=-1).indices
+
+        return neighbors, Aij.gather(1, neighbors), Aji.gather(1, neighbors)
+
+    def update(self, ht, xt_emb, qt, mask, users):
+        neighbors, Aij, Aji = self.edges(qt)
+
+        tgt_h = ht[users, qt]
+        users = users.unsqueeze(-1)
+        src_h = ht[users, neighbors]
+        inputs = (
+            tgt_h.unsqueeze(1), xt_emb.unsqueeze(1), src_h,
+            self.q_emb[neighbors]
         )
 
-        _, weights = self.mha(
-            q.permute(1, 0, 2), k.permute(1, 0, 2), v.permute(1, 0, 2)
+        m = torch.cat([
+            self.f_self((tgt_h, xt_emb)).unsqueeze(1),
+            Aij.unsqueeze(-1) * split_mlp(self.mlp_outgo, *inputs) +
+            Aji.unsqueeze(-1) * split_mlp(self.mlp_income, *inputs),
+        ], dim=1)
+
+        nodes = torch.cat([qt.unsqueeze(-1), neighbors], dim=-1)
+        h = self.update_nodes(
+            m, torch.cat([tgt_h.unsqueeze(1), src_h], dim=1)
         )
-        # Average attention weights over heads
-        # https://github.com/pytorch/pytorch/blob/5fdcc20d8d96a6b42387f57c2ce331516ad94228/torch/nn/functional.py#L5257
-        weights = weights.permute(0, 2, 1)
 
-        return weights * v
+        # The other nodes keep their hidden states
+        return ht.index_put((users, nodes), h)
+
+    def export_graph(self):
+        '''
+            Returns:
+                neighbors: the neighbors of every question(KC) with the \
+                    size of [num_q, num_neighbors]
+                A_out: the weights of the edges from every question(KC) \
+                    to its neighbors
+                A_in: the weights of the edges from the neighbors to every \
+                    question(KC)
+        '''
+        with torch.no_grad():
+            return self.edges(
+                torch.arange(self.num_q, device=self.q_emb.device)
+            )
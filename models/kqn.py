@@ -1,20 +1,20 @@
-import os
-
-import numpy as np
 import torch
 
 from torch.nn import Module, Embedding, LSTM, Linear, Dropout, Sequential, ReLU
-from torch.nn.functional import binary_cross_entropy
-from sklearn import metrics
+from torch.nn.functional import normalize
+
+from models.utils import bce_loss, run_rnn
 
 
 class KQN(Module):
-    def __init__(self, num_q, dim_v, dim_s, hidden_size):
+    def __init__(self, num_q, dim_v, dim_s, hidden_size, packed=False):
         super().__init__()
         self.num_q = num_q
         self.dim_v = dim_v
         self.dim_s = dim_s
         self.hidden_size = hidden_size
+        # Packs the sequences with the mask lengths in the knowledge encoder
+        self.packed = packed
 
         self.x_emb = Embedding(self.num_q * 2, self.dim_v)
         self.knowledge_encoder = LSTM(self.dim_v, self.dim_v, batch_first=True)
@@ -29,89 +29,45 @@ class KQN(Module):
             ReLU()
         )
 
-    def forward(self, q, r, qry):
+    def forward(self, q, r, qry, m=None):
         # Knowledge State Encoding
         x = q + self.num_q * r
         x = self.x_emb(x)
-        h, _ = self.knowledge_encoder(x)
+        h = run_rnn(self.knowledge_encoder, x, m if self.packed else None)
         ks = self.out_layer(h)
         ks = self.dropout_layer(ks)
 
         # Skill Encoding
         e = self.q_emb(qry)
         o = self.skill_encoder(e)
-        s = o / torch.norm(o, p=2)
+        # The skill vector of every query has a unit norm
+        s = normalize(o, p=2, dim=-1)
 
         p = torch.sigmoid((ks * s).sum(-1))
 
         return p
 
-    def train_model(
-        self, train_loader, test_loader, num_epochs, opt, ckpt_path
-    ):
+    def compute_loss(self, batch):
         '''
             Args:
-                train_loader: the PyTorch DataLoader instance for training
-                test_loader: the PyTorch DataLoader instance for test
-                num_epochs: the number of epochs
-                opt: the optimization to train this model
-                ckpt_path: the path to save this model's parameters
-        '''
-        aucs = []
-        loss_means = []
-
-        max_auc = 0
-
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
-
-            for data in train_loader:
-                q, r, qshft, rshft, m = data
-
-                self.train()
-
-                p = self(q.long(), r.long(), qshft.long())
-                p = torch.masked_select(p, m)
-                t = torch.masked_select(rshft, m)
-
-                opt.zero_grad()
-                loss = binary_cross_entropy(p, t)
-                loss.backward()
-                opt.step()
+                batch: the batch from collate_fn on the device of the model
 
-                loss_mean.append(loss.detach().cpu().numpy())
-
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, qshft, rshft, m = data
-
-                    self.eval()
-
-                    p = self(q.long(), r.long(), qshft.long())
-                    p = torch.masked_select(p, m).detach().cpu()
-                    t = torch.masked_select(rshft, m).detach().cpu()
-
-                    auc = metrics.roc_auc_score(
-                        y_true=t.numpy(), y_score=p.numpy()
-                    )
-
-                    loss_mean = np.mean(loss_mean)
+            Returns:
+                loss: the training loss of the batch
+        '''
+        return bce_loss(*self.predict_targets(batch))
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    if auc > max_auc:
-                        torch.save(
-                            self.state_dict(),
-                            os.path.join(
-                                ckpt_path, "model.ckpt"
-                            )
-                        )
-                        max_auc = auc
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, qshft, rshft, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        p = self(q, r, qshft, m)
 
-        return aucs, loss_means
+        return torch.masked_select(p, m), torch.masked_select(rshft, m)
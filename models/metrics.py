@@ -0,0 +1,227 @@
+import torch
+
+from models.distributed import get_world_size, all_gather_objects, \
+    all_reduce
+
+
+def auc(p, t):
+    '''
+        The exact area under the ROC curve, computed on the device of p with
+        one sort: the Mann-Whitney statistic of the ranks of the positive
+        targets, with the average rank for the tied predictions, as
+        sklearn.metrics.roc_auc_score.
+
+        Args:
+            p: the predictions
+            t: the binary targets of p
+
+        Returns:
+            auc: the AUC as a float
+    '''
+    p = p.flatten()
+    t = t.flatten().double()
+
+    order = torch.argsort(p)
+    p = p[order]
+    t = t[order]
+
+    # The tied predictions share the average of their 1-based ranks
+    _, counts = torch.unique_consecutive(p, return_counts=True)
+    ends = counts.cumsum(0).double()
+    ranks = (ends - (counts - 1) / 2).repeat_interleave(counts)
+
+    num_pos = t.sum()
+    num_neg = t.shape[0] - num_pos
+    check_classes(num_pos, num_neg)
+
+    return (
+        ((ranks * t).sum() - num_pos * (num_pos + 1) / 2) /
+        (num_pos * num_neg)
+    ).item()
+
+
+def binned_auc(pos_counts, neg_counts):
+    '''
+        The AUC of the histograms of the predictions of the positive and the
+        negative targets over the same bins, where the pairs in the same bin
+        count as ties, so that the error is bounded by the share of the
+        pairs sharing a bin.
+
+        Args:
+            pos_counts: the number of the positive targets in every bin
+            neg_counts: the number of the negative targets in every bin
+
+        Returns:
+            auc: the AUC as a float
+    '''
+    pos_counts = pos_counts.double()
+    neg_counts = neg_counts.double()
+
+    num_pos = pos_counts.sum()
+    num_neg = neg_counts.sum()
+    check_classes(num_pos, num_neg)
+
+    neg_below = neg_counts.cumsum(0) - neg_counts
+
+    return (
+        (pos_counts * (neg_below + neg_counts / 2)).sum() /
+        (num_pos * num_neg)
+    ).item()
+
+
+def check_classes(num_pos, num_neg):
+    if num_pos == 0 or num_neg == 0:
+        raise ValueError(
+            "Only one class is present in the targets, the AUC is not defined"
+        )
+
+
+def accuracy(p, t, threshold=0.5):
+    return ((p >= threshold) == t.bool()).double().mean().item()
+
+
+def log_loss(p, t, eps=1e-7):
+    p = p.double().clamp(eps, 1 - eps)
+    t = t.double()
+
+    return -(t * p.log() + (1 - t) * (1 - p).log()).mean().item()
+
+
+def expected_calibration_error(p, t, num_bins=15):
+    '''
+        The expected calibration error (ECE): the gap between the mean
+        prediction and the accuracy of every equal-width bin of the
+        predictions, weighted by the share of the predictions in the bin.
+        It is sum(|p_sum - t_sum|) / count over the bins.
+    '''
+    p = p.flatten().double()
+    t = t.flatten().double()
+    bins = bin_indices(p, num_bins)
+
+    return (
+        (torch.bincount(bins, p, num_bins) -
+         torch.bincount(bins, t, num_bins)).abs().sum() / p.shape[0]
+    ).item()
+
+
+def bin_indices(p, num_bins):
+    return (p * num_bins).long().clamp(0, num_bins - 1)
+
+
+class BinaryMetrics:
+    '''
+        Accumulates the predictions of an evaluation batch by batch on their
+        device, and computes the AUC, the accuracy, the log-loss and the
+        expected calibration error (ECE) at the end without copying the
+        predictions to numpy. In a data-parallel evaluation the metrics are
+        computed over the predictions of all the ranks.
+
+        Args:
+            auc_bins: the number of the equal-width bins of the histograms \
+                of the binned AUC, which needs a constant memory, None to \
+                keep the predictions for the exact AUC
+            ece_bins: the number of the equal-width bins of the ECE
+            threshold: the threshold of the accuracy
+            device: the device of the predictions
+
+        A rank without predictions still joins the reductions of compute,
+        so that the other ranks do not wait for it.
+    '''
+    def __init__(self, auc_bins=None, ece_bins=15, threshold=0.5,
+                 device="cpu"):
+        self.auc_bins = auc_bins
+        self.ece_bins = ece_bins
+        self.threshold = threshold
+        self.device = device
+
+        self.reset()
+
+    def reset(self):
+        self.ps = []
+        self.ts = []
+
+        # The histograms of the binned AUC, the sums of the predictions and
+        # of the targets in every ECE bin, then the number of the
+        # predictions, the number of the correct ones and the sum of the
+        # log-losses, accumulated in float64 on the device.
+        self.sums = torch.zeros(
+            2 * (self.auc_bins or 0) + 2 * self.ece_bins + 3,
+            dtype=torch.float64, device=self.device
+        )
+
+    def update(self, p, t):
+        '''
+            Args:
+                p: the predictions of a batch
+                t: the binary targets of p
+        '''
+        p = p.detach().flatten().double()
+        t = t.detach().flatten().double()
+
+        parts = []
+        if self.auc_bins is None:
+            self.ps.append(p.float())
+            self.ts.append(t.float())
+        else:
+            bins = bin_indices(p, self.auc_bins)
+            parts += [
+                torch.bincount(bins, t, self.auc_bins),
+                torch.bincount(bins, 1 - t, self.auc_bins),
+            ]
+
+        bins = bin_indices(p, self.ece_bins)
+        clamped = p.clamp(1e-7, 1 - 1e-7)
+        parts += [
+            torch.bincount(bins, p, self.ece_bins),
+            torch.bincount(bins, t, self.ece_bins),
+            torch.stack([
+                torch.ones_like(p).sum(),
+                ((p >= self.threshold) == t.bool()).double().sum(),
+                -(t * clamped.log() + (1 - t) * (1 - clamped).log()).sum(),
+            ]),
+        ]
+
+        self.sums += torch.cat(parts)
+
+    def compute(self):
+        '''
+            Returns:
+                metrics: the auc, accuracy, log_loss and ece of all the \
+                    accumulated predictions, and their count
+        '''
+        sums = self.sums
+        if get_world_size() > 1:
+            sums = torch.tensor(all_reduce(sums.tolist()), dtype=sums.dtype)
+
+        n = 2 * (self.auc_bins or 0)
+        p_sums = sums[n:n + self.ece_bins]
+        t_sums = sums[n + self.ece_bins:n + 2 * self.ece_bins]
+        count, num_correct, loss_sum = sums[-3:].tolist()
+
+        if self.auc_bins is None:
+            p = torch.cat(self.ps) if self.ps else torch.zeros(0)
+            t = torch.cat(self.ts) if self.ts else torch.zeros(0)
+
+            if get_world_size() > 1:
+                p, t = zip(*all_gather_objects((p.cpu(), t.cpu())))
+                p = torch.cat(p)
+                t = torch.cat(t)
+
+        # Only raised once every rank went through the reductions
+        if count == 0:
+            raise ValueError("No predictions were accumulated")
+
+        if self.auc_bins is None:
+            auc_value = auc(p, t)
+        else:
+            auc_value = binned_auc(
+                sums[:self.auc_bins], sums[self.auc_bins:n]
+            )
+
+        return {
+            "auc": auc_value,
+            "accuracy": num_correct / count,
+            "log_loss": loss_sum / count,
+            "ece": (p_sums - t_sums).abs().sum().item() / count,
+            "count": int(count),
+        }
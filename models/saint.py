@@ -1,10 +1,9 @@
-import numpy as np
 import torch
 
 from torch.nn import Module, Parameter, Embedding, Linear, Transformer
 from torch.nn.init import normal_
-from torch.nn.functional import binary_cross_entropy
-from sklearn import metrics
+
+from models.utils import bce_loss
 
 
 class SAINT(Module):
@@ -33,28 +32,39 @@ class SAINT(Module):
             num_encoder_layers=self.num_tr_layers,
             num_decoder_layers=self.num_tr_layers,
             dropout=self.dropout,
+            batch_first=True,
         )
 
         self.pred = Linear(self.d, 1)
 
+        # The causal mask of the longest sequences, sliced for the shorter
+        # ones, so that it is not rebuilt at every call
+        self.register_buffer(
+            "causal_mask",
+            Transformer.generate_square_subsequent_mask(self.n),
+            persistent=False
+        )
+
     def forward(self, q, r):
         batch_size = r.shape[0]
 
-        E = self.E(q).permute(1, 0, 2)
+        E = self.E(q)
 
-        R = self.R(r[:, :-1]).permute(1, 0, 2)
-        S = self.S.repeat(batch_size, 1).unsqueeze(0)
-        R = torch.cat([S, R], dim=0)
+        R = self.R(r[:, :-1])
+        S = self.S.expand(batch_size, 1, -1)
+        R = torch.cat([S, R], dim=1)
 
-        P = self.P.unsqueeze(1)
+        # The batches can be shorter than n when they are length-bucketed
+        n = E.shape[1]
+        P = self.P[:n]
 
-        mask = self.transformer.generate_square_subsequent_mask(self.n)
+        mask = self.causal_mask[:n, :n]
         R = self.transformer(
-            E + P, R + P, mask, mask, mask
+            E + P, R + P, mask, mask, mask,
+            src_is_causal=True, tgt_is_causal=True, memory_is_causal=True
         )
-        R = R.permute(1, 0, 2)
 
-        p = torch.sigmoid(self.pred(R)).squeeze()
+        p = torch.sigmoid(self.pred(R)).squeeze(-1)
 
         return p
 
@@ -90,51 +100,27 @@ class SAINT(Module):
 
         return p, attn_weights
 
-    def train_model(self, train_loader, test_loader, num_epochs, opt):
-        aucs = []
-        loss_means = []
-
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
-
-            for data in train_loader:
-                q, r, _, _, m = data
-
-                self.train()
-
-                p = self(q, r)
-                p = torch.masked_select(p, m)
-                t = torch.masked_select(r, m).float()
-
-                opt.zero_grad()
-                loss = binary_cross_entropy(p, t)
-                loss.backward()
-                opt.step()
-
-                loss_mean.append(loss.detach().cpu().numpy())
-
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, _, _, m = data
-
-                    self.eval()
-
-                    p = self(q, r)
-                    p = torch.masked_select(p, m).detach().cpu()
-                    t = torch.masked_select(r, m).float().detach().cpu()
+    def compute_loss(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    auc = metrics.roc_auc_score(
-                        y_true=t.numpy(), y_score=p.numpy()
-                    )
+            Returns:
+                loss: the training loss of the batch
+        '''
+        return bce_loss(*self.predict_targets(batch))
 
-                    loss_mean = np.mean(loss_mean)
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, _, _, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        p = self(q, r)
 
-        return aucs, loss_means
+        return torch.masked_select(p, m), torch.masked_select(r, m)
@@ -1,13 +1,11 @@
-import os
-
-import numpy as np
 import torch
 
 from torch.nn import Module, Parameter, Embedding, Sequential, Linear, ReLU, \
     MultiheadAttention, LayerNorm, Dropout
 from torch.nn.init import kaiming_normal_
-from torch.nn.functional import binary_cross_entropy
-from sklearn import metrics
+from torch.nn.functional import linear, scaled_dot_product_attention
+
+from models.utils import bce_loss
 
 
 class SAKT(Module):
@@ -54,7 +52,15 @@ class SAKT(Module):
 
         self.pred = Linear(self.d, 1)
 
-    def forward(self, q, r, qry):
+        # The causal mask of the longest sequences, sliced for the shorter
+        # ones, so that it is not rebuilt at every call
+        self.register_buffer(
+            "causal_mask",
+            torch.triu(torch.ones(self.n, self.n, dtype=torch.bool), 1),
+            persistent=False
+        )
+
+    def forward(self, q, r, qry, need_weights=False):
         '''
             Args:
                 q: the question(KC) sequence with the size of [batch_size, n]
@@ -62,105 +68,99 @@ class SAKT(Module):
                 qry: the query sequence with the size of [batch_size, m], \
                     where the query is the question(KC) what the user wants \
                     to check the knowledge level of
+                need_weights: whether to compute the attention weights, \
+                    which the training does not need
 
             Returns:
                 p: the knowledge level about the query
                 attn_weights: the attention weights from the multi-head \
-                    attention module
+                    attention module, or None without need_weights
         '''
         x = q + self.num_q * r
 
-        M = self.M(x).permute(1, 0, 2)
-        E = self.E(qry).permute(1, 0, 2)
-        P = self.P.unsqueeze(1)
+        M = self.M(x)
+        E = self.E(qry)
+        # The batches can be shorter than n when they are length-bucketed
+        M = M + self.P[:M.shape[1]]
+
+        if need_weights:
+            S, attn_weights = self.attn(
+                E.transpose(0, 1), M.transpose(0, 1), M.transpose(0, 1),
+                attn_mask=self.causal_mask[:E.shape[1], :M.shape[1]]
+            )
+            S = S.transpose(0, 1)
+        else:
+            S = self.attention(E, M)
+            attn_weights = None
 
-        causal_mask = torch.triu(
-            torch.ones([E.shape[0], M.shape[0]]), diagonal=1
-        ).bool()
-
-        M = M + P
-
-        S, attn_weights = self.attn(E, M, M, attn_mask=causal_mask)
         S = self.attn_dropout(S)
-        S = S.permute(1, 0, 2)
-        M = M.permute(1, 0, 2)
-        E = E.permute(1, 0, 2)
 
         S = self.attn_layer_norm(S + M + E)
 
         F = self.FFN(S)
         F = self.FFN_layer_norm(F + S)
 
-        p = torch.sigmoid(self.pred(F)).squeeze()
+        p = torch.sigmoid(self.pred(F)).squeeze(-1)
 
         return p, attn_weights
 
-    def train_model(
-        self, train_loader, test_loader, num_epochs, opt, ckpt_path
-    ):
+    def attention(self, E, M):
         '''
-            Args:
-                train_loader: the PyTorch DataLoader instance for training
-                test_loader: the PyTorch DataLoader instance for test
-                num_epochs: the number of epochs
-                opt: the optimization to train this model
-                ckpt_path: the path to save this model's parameters
-        '''
-        aucs = []
-        loss_means = []
-
-        max_auc = 0
-
-        for i in range(1, num_epochs + 1):
-            loss_mean = []
+            Computes the output of self.attn, batch-first and without the
+            attention weights, with scaled_dot_product_attention, which can
+            run a fused kernel.
 
-            for data in train_loader:
-                q, r, qshft, rshft, m = data
-
-                self.train()
-
-                p, _ = self(q.long(), r.long(), qshft.long())
-                p = torch.masked_select(p, m)
-                t = torch.masked_select(rshft, m)
+            Args:
+                E: the queries with the size of [batch_size, m, d]
+                M: the keys and values with the size of [batch_size, n, d]
 
-                opt.zero_grad()
-                loss = binary_cross_entropy(p, t)
-                loss.backward()
-                opt.step()
+            Returns:
+                S: the attention output with the size of [batch_size, m, d]
+        '''
+        batch_size = E.shape[0]
+        head_size = self.d // self.num_attn_heads
 
-                loss_mean.append(loss.detach().cpu().numpy())
+        w_q, w_k, w_v = self.attn.in_proj_weight.chunk(3)
+        b_q, b_k, b_v = self.attn.in_proj_bias.chunk(3)
 
-            with torch.no_grad():
-                for data in test_loader:
-                    q, r, qshft, rshft, m = data
+        q, k, v = (
+            linear(x, w, b)
+            .view(batch_size, -1, self.num_attn_heads, head_size)
+            .transpose(1, 2)
+            for x, w, b in [(E, w_q, b_q), (M, w_k, b_k), (M, w_v, b_v)]
+        )
 
-                    self.eval()
+        # The same mask as causal_mask, the query i only attends to the
+        # interactions up to i
+        S = scaled_dot_product_attention(
+            q, k, v, dropout_p=self.dropout if self.training else 0.,
+            is_causal=True
+        )
+        S = S.transpose(1, 2).reshape(batch_size, -1, self.d)
 
-                    p, _ = self(q.long(), r.long(), qshft.long())
-                    p = torch.masked_select(p, m).detach().cpu()
-                    t = torch.masked_select(rshft, m).detach().cpu()
+        return self.attn.out_proj(S)
 
-                    auc = metrics.roc_auc_score(
-                        y_true=t.numpy(), y_score=p.numpy()
-                    )
+    def compute_loss(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    loss_mean = np.mean(loss_mean)
+            Returns:
+                loss: the training loss of the batch
+        '''
+        return bce_loss(*self.predict_targets(batch))
 
-                    print(
-                        "Epoch: {},   AUC: {},   Loss Mean: {}"
-                        .format(i, auc, loss_mean)
-                    )
+    def predict_targets(self, batch):
+        '''
+            Args:
+                batch: the batch from collate_fn on the device of the model
 
-                    if auc > max_auc:
-                        torch.save(
-                            self.state_dict(),
-                            os.path.join(
-                                ckpt_path, "model.ckpt"
-                            )
-                        )
-                        max_auc = auc
+            Returns:
+                p: the predictions without the padded entries
+                t: the targets of p
+        '''
+        q, r, qshft, rshft, m = batch
 
-                    aucs.append(auc)
-                    loss_means.append(loss_mean)
+        p, _ = self(q, r, qshft)
 
-        return aucs, loss_means
+        return torch.masked_select(p, m), torch.masked_select(rshft, m)
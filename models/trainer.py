@@ -0,0 +1,511 @@
+import os
+
+import json
+import random
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+from torch.nn import Module
+from torch.profiler import profile, ProfilerActivity
+from torch.nn.parallel import DistributedDataParallel
+
+from models.distributed import get_rank, get_world_size, \
+    all_gather_objects, all_reduce, broadcast_object
+from models.metrics import BinaryMetrics
+from models.utils import to_device
+
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+# The checkpoint of the last epoch, to resume an interrupted training
+LAST_CKPT = "last.ckpt"
+
+# The structured metrics of a run, rewritten after every epoch
+METRICS_FILE = "metrics.json"
+
+# The Chrome trace of the profiled steps
+TRACE_FILE = "trace.json"
+
+# The phases of a training step timed with profile
+PHASES = ["data", "forward", "backward", "optimizer"]
+
+# The autocast dtype of every precision, None to train in float32
+PRECISIONS = {
+    "fp32": None,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+
+
+def peak_rss_mb():
+    '''
+        Returns the peak resident memory of the process in MB, None when it
+        can not be measured.
+    '''
+    if resource is None:
+        return None
+
+    # In kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LossModule(Module):
+    '''
+        Makes compute_loss of a model its forward, so that a training step
+        goes through the forward of DistributedDataParallel.
+    '''
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, batch):
+        return self.model.compute_loss(batch)
+
+
+class Trainer:
+    '''
+        The training and evaluation loop shared by all the models. The
+        models plug into it with two methods, which take a batch of
+        collate_fn already on the device of the model:
+
+            compute_loss(batch): returns the training loss of the batch
+            predict_targets(batch): returns the predictions and the targets \
+                of the batch without the padded entries, for evaluation
+
+        Args:
+            model: the model to train, already on its device
+            opt: the optimization to train the model
+            precision: "fp32", "bf16" for bfloat16 autocast on CPU or GPU, \
+                or "fp16" for float16 autocast with gradient scaling on GPU
+            compile: whether to compile the model with torch.compile
+            find_unused_parameters: whether some parameters of the model \
+                can get no gradient in a step, for the data-parallel training
+            profile: whether to time the phases of the training steps, \
+                which synchronizes the device between them
+            trace_steps: the (start, end) training steps, counted over all \
+                the epochs, to record in a Chrome trace of torch.profiler \
+                when profile is set
+            auc_bins: the number of the bins of the binned test AUC, which \
+                needs a constant memory, None for the exact AUC
+
+        In a data-parallel training launched with torchrun, the gradients
+        are averaged over the ranks, the test metrics are computed over the
+        predictions of all the ranks, and only the rank 0 prints
+        and writes the checkpoints.
+    '''
+    def __init__(
+        self, model, opt, precision="fp32", compile=False,
+        find_unused_parameters=False, profile=False, trace_steps=None,
+        auc_bins=None
+    ):
+        if precision not in PRECISIONS:
+            raise ValueError(
+                "The precision should be in {}, got {}"
+                .format(list(PRECISIONS), precision)
+            )
+
+        self.model = model
+        self.opt = opt
+        self.device = next(model.parameters()).device
+        self.precision = precision
+        self.dtype = PRECISIONS[precision]
+
+        if precision == "fp16" and self.device.type != "cuda":
+            raise ValueError(
+                "The fp16 precision needs a CUDA device, use bf16 on CPU"
+            )
+
+        # The float16 gradients underflow without loss scaling
+        self.scaler = torch.amp.GradScaler(
+            self.device.type, enabled=precision == "fp16"
+        )
+
+        if compile:
+            # Compiles the forward of the model in place, so that the
+            # parameter names of the checkpoints do not change.
+            self.model.compile()
+
+        self.rank = get_rank()
+        self.world_size = get_world_size()
+
+        self.loss_module = LossModule(self.model)
+        if self.world_size > 1:
+            self.loss_module = DistributedDataParallel(
+                self.loss_module,
+                find_unused_parameters=find_unused_parameters
+            )
+
+        self.profile = profile
+        self.trace_steps = trace_steps if profile else None
+        self.profiler = None
+        self.step = 0
+        self.phase_seconds = dict.fromkeys(PHASES, 0.)
+
+        self.auc_bins = auc_bins
+
+        self.throughputs = []
+
+    def autocast(self):
+        return torch.autocast(
+            self.device.type, dtype=self.dtype, enabled=self.dtype is not None
+        )
+
+    def synchronize(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    @contextmanager
+    def phase(self, name):
+        '''
+            Adds the time spent in the block to the phase name when profile
+            is set.
+        '''
+        if not self.profile:
+            yield
+            return
+
+        self.synchronize()
+        start = time.perf_counter()
+        yield
+        self.synchronize()
+        self.phase_seconds[name] += time.perf_counter() - start
+
+    def trace(self, trace_path):
+        '''
+            Starts or stops the torch.profiler trace around the current
+            training step, within trace_steps.
+        '''
+        if self.trace_steps is None:
+            return
+
+        start, end = self.trace_steps
+
+        if self.step == start and self.profiler is None:
+            activities = [ProfilerActivity.CPU]
+            if self.device.type == "cuda":
+                activities.append(ProfilerActivity.CUDA)
+
+            self.profiler = profile(
+                activities=activities, record_shapes=True,
+                profile_memory=True
+            )
+            self.profiler.start()
+
+        elif self.step == end and self.profiler is not None:
+            self.profiler.stop()
+            if self.rank == 0:
+                self.profiler.export_chrome_trace(trace_path)
+            self.profiler = None
+
+    def train_epoch(self, train_loader, epoch=0, trace_path=TRACE_FILE):
+        '''
+            Returns:
+                loss_mean: the mean of the losses of the batches of all the \
+                    ranks
+                throughput: the number of the interactions trained by all \
+                    the ranks per second
+        '''
+        self.model.train()
+
+        # The shuffling of DistributedSampler changes with the epoch
+        if hasattr(train_loader.sampler, "set_epoch"):
+            train_loader.sampler.set_epoch(epoch)
+
+        losses = []
+        num_interactions = 0
+
+        self.phase_seconds = dict.fromkeys(PHASES, 0.)
+
+        start = time.perf_counter()
+        loader_iter = iter(train_loader)
+        while True:
+            self.trace(trace_path)
+
+            with self.phase("data"):
+                data = next(loader_iter, None)
+                if data is not None:
+                    batch = to_device(data, self.device)
+            if data is None:
+                break
+
+            with self.phase("forward"), self.autocast():
+                loss = self.loss_module(batch)
+
+            with self.phase("backward"):
+                self.opt.zero_grad()
+                self.scaler.scale(loss).backward()
+
+            with self.phase("optimizer"):
+                self.scaler.step(self.opt)
+                self.scaler.update()
+
+            # Kept on the device, so that the steps do not wait for it
+            losses.append(loss.detach())
+            num_interactions += batch[-1].sum()
+
+            self.step += 1
+
+        # A rank without batches still joins the reductions below
+        loss_sum = torch.stack(losses).float().sum().item() if losses else 0.
+        num_interactions = int(num_interactions)
+        elapsed = time.perf_counter() - start
+
+        loss_sum, num_batches, num_interactions = all_reduce(
+            [loss_sum, len(losses), num_interactions]
+        )
+        elapsed, = all_reduce([elapsed], op=dist.ReduceOp.MAX)
+
+        if num_batches == 0:
+            raise ValueError("No training batches were loaded")
+
+        return loss_sum / num_batches, num_interactions / elapsed
+
+    def evaluate(self, test_loader):
+        '''
+            Returns:
+                metrics: the auc, accuracy, log_loss, ece and count of the \
+                    predictions of the whole test_loader, see \
+                    models/metrics.py. The test_loader is evaluated batch by \
+                    batch on the device, and over all the ranks in a \
+                    data-parallel training.
+        '''
+        self.model.eval()
+
+        metrics = BinaryMetrics(auc_bins=self.auc_bins, device=self.device)
+
+        with torch.no_grad(), self.autocast():
+            for data in test_loader:
+                p, t = self.model.predict_targets(
+                    to_device(data, self.device)
+                )
+
+                metrics.update(p, t)
+
+        return metrics.compute()
+
+    def fit(
+        self, train_loader, test_loader, num_epochs, ckpt_path,
+        patience=None, resume=False
+    ):
+        '''
+            Args:
+                train_loader: the PyTorch DataLoader instance for training
+                test_loader: the PyTorch DataLoader instance for test
+                num_epochs: the number of epochs
+                ckpt_path: the path to save the model's parameters
+                patience: the number of epochs without a better test AUC \
+                    after which the training stops, None to never stop early
+                resume: whether to resume from the last.ckpt of ckpt_path
+
+            Returns:
+                aucs: the test AUC of every epoch
+                loss_means: the mean training loss of every epoch
+        '''
+        state = {
+            "epoch": 0,
+            "aucs": [],
+            "loss_means": [],
+            "throughputs": [],
+            "epochs": [],
+            "max_auc": 0,
+            "bad_epochs": 0,
+            "stopped": False,
+        }
+
+        # Only the rank 0 writes the checkpoints, so it decides whether to
+        # resume for all the ranks, which may not share its filesystem
+        last_ckpt_path = os.path.join(ckpt_path, LAST_CKPT)
+        found = None
+        if self.rank == 0:
+            found = resume and os.path.exists(last_ckpt_path)
+        if broadcast_object(found):
+            state = self.load_checkpoint(last_ckpt_path, train_loader)
+            if self.rank == 0:
+                print("Resuming after epoch {}".format(state["epoch"]))
+
+        metrics_path = os.path.join(ckpt_path, METRICS_FILE)
+        trace_path = os.path.join(ckpt_path, TRACE_FILE)
+
+        # Reported when the batches are length-bucketed
+        padding_ratios = getattr(
+            train_loader.batch_sampler, "padding_ratios", None
+        )
+
+        for i in range(state["epoch"] + 1, num_epochs + 1):
+            if state["stopped"]:
+                break
+
+            train_start = time.perf_counter()
+            loss_mean, throughput = self.train_epoch(
+                train_loader, i, trace_path
+            )
+            eval_start = time.perf_counter()
+            test_metrics = self.evaluate(test_loader)
+            auc = test_metrics["auc"]
+            eval_end = time.perf_counter()
+
+            log = "Epoch: {},   AUC: {},   Loss Mean: {},   " \
+                "Interactions/s: {:.0f}".format(i, auc, loss_mean, throughput)
+            if padding_ratios:
+                log += ",   Padding Ratio: {:.4f}".format(padding_ratios[-1])
+            if self.profile:
+                log += ",   " + ",   ".join(
+                    "{}: {:.2f}s".format(name.capitalize(), seconds)
+                    for name, seconds in self.phase_seconds.items()
+                )
+            if self.rank == 0:
+                print(log)
+
+            if auc > state["max_auc"]:
+                if self.rank == 0:
+                    torch.save(
+                        self.model.state_dict(),
+                        os.path.join(ckpt_path, "model.ckpt")
+                    )
+                state["max_auc"] = auc
+                state["bad_epochs"] = 0
+            else:
+                state["bad_epochs"] += 1
+
+            state["epoch"] = i
+            state["aucs"].append(auc)
+            state["loss_means"].append(loss_mean)
+            state["throughputs"].append(throughput)
+
+            record = {
+                "epoch": i,
+                "auc": auc,
+                "accuracy": test_metrics["accuracy"],
+                "log_loss": test_metrics["log_loss"],
+                "ece": test_metrics["ece"],
+                "loss_mean": loss_mean,
+                "interactions_per_second": throughput,
+                "train_seconds": eval_start - train_start,
+                "eval_seconds": eval_end - eval_start,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            if padding_ratios:
+                record["padding_ratio"] = padding_ratios[-1]
+            if self.profile:
+                record["phase_seconds"] = dict(self.phase_seconds)
+            state["epochs"].append(record)
+
+            if patience is not None and state["bad_epochs"] >= patience:
+                if self.rank == 0:
+                    print(
+                        "Early stopping: no better AUC in the last {} epochs"
+                        .format(patience)
+                    )
+                state["stopped"] = True
+
+            self.save_checkpoint(last_ckpt_path, train_loader, state)
+            self.save_metrics(metrics_path, state)
+
+        # The trace window went past the last step
+        if self.profiler is not None:
+            self.trace_steps = (self.trace_steps[0], self.step)
+            self.trace(trace_path)
+
+        self.throughputs = state["throughputs"]
+
+        return state["aucs"], state["loss_means"]
+
+    def save_metrics(self, path, state):
+        '''
+            Writes the metrics of every epoch and the best AUC to the
+            metrics.json of the run, on the rank 0.
+        '''
+        if self.rank != 0:
+            return
+
+        aucs = state["aucs"]
+        metrics = {
+            "precision": self.precision,
+            "world_size": self.world_size,
+            "profile": self.profile,
+            "best_auc": max(aucs) if aucs else None,
+            "best_epoch": aucs.index(max(aucs)) + 1 if aucs else None,
+            "stopped_early": state["stopped"],
+            "epochs": state["epochs"],
+        }
+
+        with open(path + ".tmp", "w") as f:
+            json.dump(metrics, f, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def save_checkpoint(self, path, train_loader, state):
+        '''
+            Saves everything needed to resume the training after the last
+            epoch: the model, the optimizer, the RNG states, the history of
+            the metrics and the state of the batch sampler. All the ranks
+            have to call it, but only the rank 0 writes the checkpoint.
+        '''
+        # The RNG states of every rank
+        rng = all_gather_objects({
+            "torch": torch.get_rng_state(),
+            "cuda": torch.cuda.get_rng_state_all()
+            if torch.cuda.is_available() else None,
+            "numpy": np.random.get_state(),
+            "random": random.getstate(),
+        })
+
+        if self.rank != 0:
+            return
+
+        ckpt = {
+            **state,
+            "model": self.model.state_dict(),
+            "opt": self.opt.state_dict(),
+            "scaler": self.scaler.state_dict(),
+            "rng": rng,
+        }
+
+        sampler = train_loader.batch_sampler
+        if hasattr(sampler, "state_dict"):
+            ckpt["sampler"] = sampler.state_dict()
+
+        # Written to a temporary file first so that an interruption while
+        # saving never corrupts the previous checkpoint.
+        torch.save(ckpt, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, path, train_loader):
+        '''
+            Restores a checkpoint of save_checkpoint and returns its state.
+            All the ranks have to call it, but only the rank 0 reads the
+            checkpoint, which it sends to the other ranks.
+        '''
+        # Loaded on the CPU, so that it can be sent to the other hosts and
+        # the RNG states stay CPU tensors
+        ckpt = None
+        if self.rank == 0:
+            ckpt = torch.load(path, map_location="cpu", weights_only=False)
+        ckpt = broadcast_object(ckpt)
+        ckpt.setdefault("epochs", [])
+
+        self.model.load_state_dict(ckpt.pop("model"))
+        self.opt.load_state_dict(ckpt.pop("opt"))
+        self.scaler.load_state_dict(ckpt.pop("scaler"))
+
+        rng = ckpt.pop("rng")
+        rng = rng[self.rank] if self.rank < len(rng) else rng[0]
+        torch.set_rng_state(rng["torch"])
+        if rng["cuda"] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng["cuda"])
+        np.random.set_state(rng["numpy"])
+        random.setstate(rng["random"])
+
+        sampler_state = ckpt.pop("sampler", None)
+        if sampler_state is not None:
+            train_loader.batch_sampler.load_state_dict(sampler_state)
+
+        return ckpt
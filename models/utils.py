@@ -1,73 +1,80 @@
 import numpy as np
 import torch
 
-from torch.nn.utils.rnn import pad_sequence
+from torch.nn.functional import binary_cross_entropy
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from torch.utils.data import Sampler
 
-if torch.cuda.is_available():
-    from torch.cuda import FloatTensor
-    torch.set_default_tensor_type(torch.cuda.FloatTensor)
-else:
-    from torch import FloatTensor
 
-
-def match_seq_len(q_seqs, r_seqs, seq_len, pad_val=-1):
+def window_indices(seq_offsets, seq_len, stride=None):
     '''
         Args:
-            q_seqs: the question(KC) sequences with the size of \
-                [batch_size, some_sequence_length]
-            r_seqs: the response sequences with the size of \
-                [batch_size, some_sequence_length]
-
-            Note that the "some_sequence_length" is not uniform over \
-                the whole batch of q_seqs and r_seqs
-
-            seq_len: the sequence length to match the q_seqs, r_seqs \
-                to same length
-            pad_val: the padding value for the sequence with the length \
-                longer than seq_len
+            seq_offsets: the offsets of the sequence of every user in the \
+                concatenated sequences with the size of [num_users + 1]
+            seq_len: the sequence length to split the sequences into \
+                windows of seq_len + 1 interactions, None to keep the \
+                whole sequence of every user
+            stride: the distance between the starts of two consecutive \
+                windows of a user, by default seq_len + 1 so that the \
+                windows do not overlap. A smaller stride gives overlapping \
+                windows without copying any sequence.
 
         Returns:
-            proc_q_seqs: the processed q_seqs with the size of \
-                [batch_size, seq_len + 1]
-            proc_r_seqs: the processed r_seqs with the size of \
-                [batch_size, seq_len + 1]
+            windows: the (user, start, length) of every window with the \
+                size of [num_windows, 3], where start is relative to the \
+                sequence of the user and length is at most seq_len + 1. \
+                The last window of every user is shorter when the \
+                sequence does not fill it, and is padded at collate time.
     '''
-    proc_q_seqs = []
-    proc_r_seqs = []
-
-    for q_seq, r_seq in zip(q_seqs, r_seqs):
-        i = 0
-        while i + seq_len + 1 < len(q_seq):
-            proc_q_seqs.append(q_seq[i:i + seq_len + 1])
-            proc_r_seqs.append(r_seq[i:i + seq_len + 1])
-
-            i += seq_len + 1
-
-        proc_q_seqs.append(
-            np.concatenate(
-                [
-                    q_seq[i:],
-                    np.array([pad_val] * (i + seq_len + 1 - len(q_seq)))
-                ]
-            )
-        )
-        proc_r_seqs.append(
-            np.concatenate(
-                [
-                    r_seq[i:],
-                    np.array([pad_val] * (i + seq_len + 1 - len(q_seq)))
-                ]
-            )
-        )
+    seq_lens = np.diff(seq_offsets)
+    num_u = len(seq_lens)
+
+    if not seq_len:
+        return np.stack(
+            [np.arange(num_u), np.zeros(num_u, dtype=np.int64), seq_lens],
+            axis=-1
+        ).astype(np.int64)
 
-    return proc_q_seqs, proc_r_seqs
+    window_len = seq_len + 1
+    stride = stride or window_len
+
+    # A new window starts as long as the previous one does not reach the end
+    # of the sequence.
+    num_windows = 1 + np.maximum(
+        0, -(-(seq_lens - window_len) // stride)
+    )
 
+    u = np.repeat(np.arange(num_u), num_windows)
+    first = np.repeat(np.cumsum(num_windows) - num_windows, num_windows)
+    start = (np.arange(len(u)) - first) * stride
+    length = np.minimum(window_len, seq_lens[u] - start)
 
-def collate_fn(batch, pad_val=-1):
+    return np.stack([u, start, length], axis=-1).astype(np.int64)
+
+
+def collate_fn(batch, seq_len=None, pin_memory=False):
     '''
         The collate function for torch.utils.data.DataLoader
 
+        The windows are scattered into zero-filled buffers with one
+        vectorized assignment per sequence type, and no tensor is created
+        per window, so the function is cheap enough to run in the DataLoader
+        workers. With pin_memory, the buffers are allocated in pinned memory
+        so that the batch can be copied to the GPU asynchronously.
+
+        Args:
+            batch: the list of the (q_seq, r_seq) windows of the batch
+            seq_len: the minimum length to pad the batch to, so that the \
+                models with a fixed sequence length get [batch_size, seq_len]
+            pin_memory: whether to allocate the batch in pinned memory, \
+                which should only be used in the main process
+
         Returns:
+            The question(KC) and response sequences are int64 index \
+            tensors, only rshft_seqs is a float tensor as the target of \
+            the binary cross entropy, and mask_seqs is a bool tensor. \
+            The padded entries are 0 in all of them.
+
             q_seqs: the question(KC) sequences with the size of \
                 [batch_size, maximum_sequence_length_in_the_batch]
             r_seqs: the response sequences with the size of \
@@ -82,34 +89,206 @@ def collate_fn(batch, pad_val=-1):
                 the padded entry is with the size of \
                 [batch_size, maximum_sequence_length_in_the_batch]
     '''
-    q_seqs = []
-    r_seqs = []
-    qshft_seqs = []
-    rshft_seqs = []
-
-    for q_seq, r_seq in batch:
-        q_seqs.append(FloatTensor(q_seq[:-1]))
-        r_seqs.append(FloatTensor(r_seq[:-1]))
-        qshft_seqs.append(FloatTensor(q_seq[1:]))
-        rshft_seqs.append(FloatTensor(r_seq[1:]))
-
-    q_seqs = pad_sequence(
-        q_seqs, batch_first=True, padding_value=pad_val
+    batch_size = len(batch)
+    lengths = np.fromiter(
+        (len(q_seq) for q_seq, _ in batch), dtype=np.int64, count=batch_size
     )
-    r_seqs = pad_sequence(
-        r_seqs, batch_first=True, padding_value=pad_val
+    n = max(int(lengths.max()) - 1, seq_len or 0, 0)
+
+    q_flat = np.concatenate([q_seq for q_seq, _ in batch])
+    r_flat = np.concatenate([r_seq for _, r_seq in batch])
+
+    # Every window gives len - 1 (current, next) pairs: the current entries
+    # drop the last interaction of the window and the next entries the first.
+    ends = np.cumsum(lengths)
+    is_last = np.zeros(len(q_flat), dtype=bool)
+    is_first = np.zeros(len(q_flat), dtype=bool)
+    is_last[ends[lengths > 0] - 1] = True
+    is_first[(ends - lengths)[lengths > 0]] = True
+
+    num_pairs = np.maximum(lengths - 1, 0)
+    rows = np.repeat(np.arange(batch_size), num_pairs)
+    cols = np.arange(len(rows)) - \
+        np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+
+    seqs = torch.zeros(
+        [3, batch_size, n], dtype=torch.long, pin_memory=pin_memory
     )
-    qshft_seqs = pad_sequence(
-        qshft_seqs, batch_first=True, padding_value=pad_val
+    rshft_seqs = torch.zeros(
+        [batch_size, n], dtype=torch.float, pin_memory=pin_memory
     )
-    rshft_seqs = pad_sequence(
-        rshft_seqs, batch_first=True, padding_value=pad_val
+    mask_seqs = torch.zeros(
+        [batch_size, n], dtype=torch.bool, pin_memory=pin_memory
     )
 
-    mask_seqs = (q_seqs != pad_val) * (qshft_seqs != pad_val)
+    seqs_np = seqs.numpy()
+    seqs_np[0, rows, cols] = q_flat[~is_last]
+    seqs_np[1, rows, cols] = r_flat[~is_last]
+    seqs_np[2, rows, cols] = q_flat[~is_first]
+    rshft_seqs.numpy()[rows, cols] = r_flat[~is_first]
+    mask_seqs.numpy()[rows, cols] = True
 
-    q_seqs, r_seqs, qshft_seqs, rshft_seqs = \
-        q_seqs * mask_seqs, r_seqs * mask_seqs, qshft_seqs * mask_seqs, \
-        rshft_seqs * mask_seqs
+    q_seqs, r_seqs, qshft_seqs = seqs
 
     return q_seqs, r_seqs, qshft_seqs, rshft_seqs, mask_seqs
+
+
+def to_device(batch, device):
+    '''
+        Moves the tensors of a batch to device. The copy is asynchronous
+        when the batch is in pinned memory.
+    '''
+    return [t.to(device, non_blocking=True) for t in batch]
+
+
+def bce_loss(p, t):
+    '''
+        The binary cross entropy of the predictions p and the targets t,
+        computed in float32 outside of autocast, where it is not safe.
+    '''
+    with torch.autocast(p.device.type, enabled=False):
+        return binary_cross_entropy(p.float(), t.float())
+
+
+def select_targets(y, q):
+    '''
+        Reads the prediction of every timestep for its question(KC) with a
+        gather, instead of multiplying y with a dense one-hot tensor of q.
+
+        Args:
+            y: the predictions for all the questions(KCs) with the size of \
+                [batch_size, n, num_q]
+            q: the question(KC) sequences with the size of [batch_size, n]
+
+        Returns:
+            y: the predictions for q with the size of [batch_size, n]
+    '''
+    return torch.gather(y, -1, q.unsqueeze(-1)).squeeze(-1)
+
+
+def run_rnn(rnn, x, m=None):
+    '''
+        Runs a batch-first RNN module over the padded sequences x.
+
+        With the mask m, the sequences are packed with their true lengths so
+        that the padded timesteps are never computed. The outputs of the
+        padded timesteps are then 0, which the masked losses and metrics
+        never read.
+
+        Args:
+            rnn: the RNN module, e.g. torch.nn.LSTM with batch_first=True
+            x: the input sequences with the size of [batch_size, n, *]
+            m: the mask sequences from collate_fn with the size of \
+                [batch_size, n], None to run over the padded timesteps
+
+        Returns:
+            h: the output sequences with the size of [batch_size, n, *]
+    '''
+    if m is None:
+        h, _ = rnn(x)
+        return h
+
+    # The mask of every window is a prefix, and an empty window still needs
+    # one timestep to be packed.
+    lengths = m.sum(-1).clamp(min=1).cpu()
+
+    packed = pack_padded_sequence(
+        x, lengths, batch_first=True, enforce_sorted=False
+    )
+    h, _ = rnn(packed)
+    h, _ = pad_packed_sequence(h, batch_first=True, total_length=x.shape[1])
+
+    return h
+
+
+class BucketBatchSampler(Sampler):
+    '''
+        A batch sampler grouping the windows of similar lengths, so that
+        every batch is only padded to its own maximum length.
+
+        The indices are shuffled and split into pools of pool_size batches.
+        Every pool is sorted by length and cut into batches, and the order
+        of the batches is shuffled.
+
+        Args:
+            lengths: the length of every window of the dataset
+            batch_size: the number of windows per batch
+            pool_size: the number of batches sorted together, a larger \
+                pool gives less padding but less random batches
+            seed: the seed of the shuffling, the epoch e uses seed + e so \
+                that the batches are reproducible. None for random batches.
+            num_replicas: the number of the data-parallel ranks sharing \
+                the batches, which need the same seed
+            rank: the rank of the process, which gets every num_replicas-th \
+                batch. The batches are repeated so that every rank makes \
+                the same number of steps.
+    '''
+    def __init__(
+        self, lengths, batch_size, pool_size=50, seed=None, num_replicas=1,
+        rank=0
+    ):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.pool_size = pool_size
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+        if num_replicas > 1 and seed is None:
+            raise ValueError("The ranks need a seed to share the batches")
+
+        self.epoch = 0
+        # The ratio of the padded entries in the batches of every epoch
+        self.padding_ratios = []
+
+    def __iter__(self):
+        if self.seed is None:
+            rng = np.random.default_rng()
+        else:
+            rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+
+        indices = rng.permutation(len(self.lengths))
+        pool_len = self.batch_size * self.pool_size
+
+        batches = []
+        for i in range(0, len(indices), pool_len):
+            pool = indices[i:i + pool_len]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            batches.extend(
+                pool[j:j + self.batch_size]
+                for j in range(0, len(pool), self.batch_size)
+            )
+
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        self.padding_ratios.append(self.padding_ratio(batches))
+
+        num_padded = len(self) * self.num_replicas - len(batches)
+        batches = batches + batches[:num_padded]
+
+        for batch in batches[self.rank::self.num_replicas]:
+            yield batch.tolist()
+
+    def __len__(self):
+        num_batches = -(-len(self.lengths) // self.batch_size)
+
+        return -(-num_batches // self.num_replicas)
+
+    def state_dict(self):
+        return {"epoch": self.epoch, "padding_ratios": self.padding_ratios}
+
+    def load_state_dict(self, state_dict):
+        self.epoch = state_dict["epoch"]
+        self.padding_ratios = state_dict["padding_ratios"]
+
+    def padding_ratio(self, batches):
+        '''
+            Returns the ratio of the padded (current, next) pairs in batches.
+        '''
+        num_pairs = np.maximum(self.lengths - 1, 0)
+
+        total = sum(len(b) * num_pairs[b].max() for b in batches if len(b))
+        real = num_pairs.sum()
+
+        return float(1 - real / total) if total else 0.
@@ -0,0 +1,183 @@
+"""Compare the former and fast attention paths of SAKT and SAINT.
+
+The former SAKT forward built a new causal mask at every call, ran its
+``MultiheadAttention`` sequence-first and always averaged the attention
+weights; the former SAINT forward generated its causal mask at every call.
+Both are kept here as references. For every sequence length, the script
+fails when the former and fast paths give predictions further apart than
+``--tolerance`` with the same weights, and reports the training throughput of both in interactions per
+second.
+
+Run from repository root:
+    python scripts/benchmark_attention.py --seq-lens 100 200 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn.functional import binary_cross_entropy  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+
+from models.saint import SAINT  # noqa: E402
+from models.sakt import SAKT  # noqa: E402
+
+
+def reference_sakt(model: SAKT, q, r, qry) -> torch.Tensor:
+    """The former SAKT.forward, returning the predictions only."""
+    x = q + model.num_q * r
+
+    M = model.M(x).permute(1, 0, 2)
+    E = model.E(qry).permute(1, 0, 2)
+    P = model.P[:M.shape[0]].unsqueeze(1)
+
+    causal_mask = torch.triu(
+        torch.ones([E.shape[0], M.shape[0]], device=M.device), diagonal=1
+    ).bool()
+
+    M = M + P
+
+    S, _ = model.attn(E, M, M, attn_mask=causal_mask)
+    S = model.attn_dropout(S)
+    S = S.permute(1, 0, 2)
+    M = M.permute(1, 0, 2)
+    E = E.permute(1, 0, 2)
+
+    S = model.attn_layer_norm(S + M + E)
+
+    F = model.FFN(S)
+    F = model.FFN_layer_norm(F + S)
+
+    return torch.sigmoid(model.pred(F)).squeeze(-1)
+
+
+def reference_saint(model: SAINT, q, r, qry) -> torch.Tensor:
+    """The SAINT.forward with the causal mask generated at every call."""
+    E = model.E(q)
+    R = torch.cat(
+        [model.S.expand(r.shape[0], 1, -1), model.R(r[:, :-1])], dim=1
+    )
+    P = model.P[:E.shape[1]]
+
+    mask = model.transformer.generate_square_subsequent_mask(
+        E.shape[1], device=E.device
+    )
+    R = model.transformer(E + P, R + P, mask, mask, mask)
+
+    return torch.sigmoid(model.pred(R)).squeeze(-1)
+
+
+def fast_sakt(model: SAKT, q, r, qry) -> torch.Tensor:
+    return model(q, r, qry)[0]
+
+
+def fast_saint(model: SAINT, q, r, qry) -> torch.Tensor:
+    return model(q, r)
+
+
+MODELS = {
+    "sakt": (
+        lambda num_q, n: SAKT(num_q, n, 100, 5, 0.2),
+        reference_sakt, fast_sakt,
+    ),
+    "saint": (
+        lambda num_q, n: SAINT(num_q, n, 100, 5, 0.2),
+        reference_saint, fast_saint,
+    ),
+}
+
+
+def throughput(model, forward: Callable, batch, repeats: int) -> float:
+    q, r, qry, t = batch
+    opt = Adam(model.parameters(), 1e-3)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        opt.zero_grad()
+        loss = binary_cross_entropy(forward(model, q, r, qry), t)
+        loss.backward()
+        opt.step()
+
+    return repeats * q.numel() / (time.perf_counter() - start)
+
+
+def max_output_diff(model, reference: Callable, fast: Callable,
+                    batch) -> float:
+    q, r, qry, _ = batch
+
+    model.eval()
+    with torch.no_grad():
+        diff = (reference(model, q, r, qry) -
+                fast(model, q, r, qry)).abs().max().item()
+    model.train()
+
+    return diff
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the former and fast SAKT and SAINT attention."
+    )
+    parser.add_argument("--models", nargs="+", default=list(MODELS),
+                        choices=list(MODELS))
+    parser.add_argument("--seq-lens", type=int, nargs="+",
+                        default=[100, 200, 500])
+    parser.add_argument("--num-q", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    print("{:<6} {:>8} {:>12} {:>12} {:>8} {:>10}".format(
+        "", "seq_len", "former it/s", "fast it/s", "speedup", "max diff"
+    ))
+
+    failed = []
+    for name in args.models:
+        build, reference, fast = MODELS[name]
+
+        for seq_len in args.seq_lens:
+            size = (args.batch_size, seq_len)
+            g = torch.Generator().manual_seed(args.seed)
+            batch = (
+                torch.randint(args.num_q, size, generator=g),
+                torch.randint(2, size, generator=g),
+                torch.randint(args.num_q, size, generator=g),
+                torch.randint(2, size, generator=g).float(),
+            )
+
+            torch.manual_seed(args.seed)
+            model = build(args.num_q, seq_len)
+
+            diff = max_output_diff(model, reference, fast, batch)
+            if not diff <= args.tolerance:
+                failed.append(f"{name} at seq_len {seq_len}")
+
+            former = throughput(model, reference, batch, args.repeats)
+            new = throughput(model, fast, batch, args.repeats)
+
+            print("{:<6} {:>8} {:>12.0f} {:>12.0f} {:>7.2f}x {:>10.2e}"
+                  .format(name, seq_len, former, new, new / former, diff))
+
+    if failed:
+        print(f"The fast path predicts differently: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
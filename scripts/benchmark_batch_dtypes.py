@@ -0,0 +1,180 @@
+"""Report the memory and time the integer batch format saves per DKT epoch.
+
+Compares the former pipeline (int64 sequences, float32 batches cast back
+with ``.long()`` on every step) with the current one (int16/int8 cache,
+int64 index tensors, a bool mask and float targets only).
+
+Without the raw ASSIST2009 file, ``--synthetic`` generates a log of its size
+(4151 users, 110 KCs, about 325k interactions) with
+``data_loaders/synthetic.py`` instead.
+
+Run from repository root:
+    python scripts/benchmark_batch_dtypes.py --dataset-dir datasets/ASSIST2009/
+    python scripts/benchmark_batch_dtypes.py --synthetic
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn.functional import binary_cross_entropy, one_hot  # noqa: E402
+from torch.nn.utils.rnn import pad_sequence  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+from torch.utils.data import DataLoader  # noqa: E402
+
+from data_loaders.assist2009 import ASSIST2009  # noqa: E402
+from data_loaders.synthetic import Synthetic  # noqa: E402
+from models.dkt import DKT  # noqa: E402
+from models.utils import collate_fn  # noqa: E402
+
+
+def legacy_collate_fn(batch, pad_val=-1, seq_len=None):
+    """The float32 collate function used before the integer batches."""
+    seqs = [[], [], [], []]
+    for q_seq, r_seq in batch:
+        q_seq = np.asarray(q_seq, dtype=np.float32)
+        r_seq = np.asarray(r_seq, dtype=np.float32)
+        for out, seq in zip(
+            seqs, [q_seq[:-1], r_seq[:-1], q_seq[1:], r_seq[1:]]
+        ):
+            out.append(torch.from_numpy(seq.copy()))
+
+    q, r, qshft, rshft = [
+        pad_sequence(s, batch_first=True, padding_value=pad_val)
+        for s in seqs
+    ]
+    if seq_len and q.shape[1] < seq_len:
+        q, r, qshft, rshft = [
+            torch.nn.functional.pad(s, (0, seq_len - s.shape[1]),
+                                    value=pad_val)
+            for s in [q, r, qshft, rshft]
+        ]
+    m = (q != pad_val) * (qshft != pad_val)
+
+    return q * m, r * m, qshft * m, rshft * m, m
+
+
+def legacy_step(model: DKT, batch) -> torch.Tensor:
+    q, r, qshft, rshft, m = batch
+    y = model(q.long(), r.long())
+    y = (y * one_hot(qshft.long(), model.num_q)).sum(-1)
+
+    return binary_cross_entropy(
+        torch.masked_select(y, m), torch.masked_select(rshft, m)
+    )
+
+
+def current_step(model: DKT, batch) -> torch.Tensor:
+    q, r, qshft, rshft, m = batch
+    y = model(q, r)
+    y = (y * one_hot(qshft, model.num_q)).sum(-1)
+
+    return binary_cross_entropy(
+        torch.masked_select(y, m), torch.masked_select(rshft, m)
+    )
+
+
+def batch_bytes(batch, legacy: bool) -> int:
+    total = sum(t.nbytes for t in batch)
+    if legacy:
+        # q.long(), r.long() and qshft.long() copies made on every step
+        total += sum(t.numel() * 8 for t in batch[:3])
+
+    return total
+
+
+def run_epoch(dataset, collate: Callable, step: Callable, legacy: bool,
+              batch_size: int, seed: int) -> Tuple[float, int]:
+    torch.manual_seed(seed)
+    model = DKT(dataset.num_q, emb_size=100, hidden_size=100)
+    opt = Adam(model.parameters(), 1e-3)
+    loader = DataLoader(
+        dataset, batch_size=batch_size, shuffle=True, collate_fn=collate
+    )
+
+    total_bytes = 0
+    start = time.perf_counter()
+    for batch in loader:
+        total_bytes += batch_bytes(batch, legacy)
+
+        opt.zero_grad()
+        loss = step(model, batch)
+        loss.backward()
+        opt.step()
+
+    return time.perf_counter() - start, total_bytes
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the float and integer batch formats of DKT."
+    )
+    parser.add_argument("--dataset-dir", type=str,
+                        default="datasets/ASSIST2009/")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Generate a log of the size of ASSIST2009 "
+                        "instead of reading --dataset-dir")
+    parser.add_argument("--seq-len", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            dataset = Synthetic(
+                args.seq_len, dataset_dir, num_users=4151, num_q=110,
+                mean_seq_len=78, seed=args.seed
+            )
+            report(args, dataset)
+    else:
+        report(args, ASSIST2009(args.seq_len, args.dataset_dir))
+
+
+def report(args, dataset) -> None:
+    seq_len = args.seq_len
+
+    num_interactions = len(dataset.q_seqs)
+    legacy_seq_bytes = num_interactions * 2 * np.dtype(np.int64).itemsize
+    current_seq_bytes = dataset.q_seqs.nbytes + dataset.r_seqs.nbytes
+
+    legacy_time, legacy_bytes = run_epoch(
+        dataset, lambda b: legacy_collate_fn(b, seq_len=seq_len),
+        legacy_step, True, args.batch_size, args.seed
+    )
+    current_time, current_bytes = run_epoch(
+        dataset, lambda b: collate_fn(b, seq_len=seq_len),
+        current_step, False, args.batch_size, args.seed
+    )
+
+    mib = 2 ** 20
+    print(f"Interactions: {num_interactions}   Windows: {len(dataset)}")
+    print("{:<28} {:>12} {:>12}".format("", "float/int64", "integer"))
+    print("{:<28} {:>10.1f}MB {:>10.1f}MB".format(
+        "Sequence storage", legacy_seq_bytes / mib, current_seq_bytes / mib
+    ))
+    print("{:<28} {:>10.1f}MB {:>10.1f}MB".format(
+        "Batch tensors per epoch", legacy_bytes / mib, current_bytes / mib
+    ))
+    print("{:<28} {:>11.2f}s {:>11.2f}s".format(
+        "DKT epoch time", legacy_time, current_time
+    ))
+
+
+if __name__ == "__main__":
+    main()
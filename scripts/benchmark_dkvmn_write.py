@@ -0,0 +1,151 @@
+"""Compare the loop and scan write processes of DKVMN.
+
+The loop write applies ``Mvt = Mvt-1 * (1 - w e) + w a`` timestep by
+timestep and reads the value memory on the fly, the scan write composes the
+timesteps with a parallel prefix scan in ``log2(seq_len)`` steps. For every
+sequence length, both get the same weights and batch: the script fails when
+their predictions or value memories differ from the loop, which is the
+reference, by more than ``--tolerance``, and reports the training step time, the inference time and the memory
+allocated by a training step (forward and backward) of both.
+
+Run from repository root:
+    python scripts/benchmark_dkvmn_write.py --seq-lens 100 500 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn.functional import binary_cross_entropy  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+from torch.profiler import ProfilerActivity, profile  # noqa: E402
+
+from models.dkvmn import DKVMN, WRITES  # noqa: E402
+
+
+def step_loss(model: DKVMN, batch) -> torch.Tensor:
+    q, r = batch
+    p, _ = model(q, r)
+
+    return binary_cross_entropy(p, r.float())
+
+
+def step_bytes(model: DKVMN, batch) -> int:
+    """Bytes allocated by a training step, forward and backward."""
+    with profile(activities=[ProfilerActivity.CPU],
+                 profile_memory=True) as prof:
+        step_loss(model, batch).backward()
+    model.zero_grad()
+
+    return sum(
+        max(0, e.self_cpu_memory_usage) for e in prof.key_averages()
+    )
+
+
+def train_time(model: DKVMN, batch, repeats: int) -> float:
+    opt = Adam(model.parameters(), 1e-3)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        opt.zero_grad()
+        loss = step_loss(model, batch)
+        loss.backward()
+        opt.step()
+
+    return (time.perf_counter() - start) / repeats
+
+
+def inference_time(model: DKVMN, batch, repeats: int) -> float:
+    with torch.no_grad():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(*batch)
+
+    return (time.perf_counter() - start) / repeats
+
+
+def max_diffs(reference: DKVMN, model: DKVMN, batch) -> tuple:
+    """The largest differences of the predictions and value memories."""
+    with torch.no_grad():
+        p_ref, Mv_ref = reference(*batch, return_memory=True)
+        p, Mv = model(*batch, return_memory=True)
+
+    return (p - p_ref).abs().max().item(), (Mv - Mv_ref).abs().max().item()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the loop and scan DKVMN write processes."
+    )
+    parser.add_argument("--seq-lens", type=int, nargs="+",
+                        default=[100, 500, 2000])
+    parser.add_argument("--num-q", type=int, default=100)
+    parser.add_argument("--dim-s", type=int, default=50)
+    parser.add_argument("--size-m", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    print("{:>8} {:<5} {:>9} {:>9} {:>9} {:>10} {:>10}".format(
+        "seq_len", "write", "train s", "infer s", "train MB", "p diff",
+        "Mv diff"
+    ))
+
+    failed = []
+    for seq_len in args.seq_lens:
+        g = torch.Generator().manual_seed(args.seed)
+        batch = (
+            torch.randint(args.num_q, (args.batch_size, seq_len),
+                          generator=g),
+            torch.randint(2, (args.batch_size, seq_len), generator=g),
+        )
+
+        models = {}
+        for write in WRITES:
+            torch.manual_seed(args.seed)
+            models[write] = DKVMN(
+                args.num_q, args.dim_s, args.size_m, write=write
+            )
+
+        # Before any training step, while the models share their weights
+        diffs = {
+            write: max_diffs(models["loop"], model, batch)
+            for write, model in models.items()
+        }
+
+        for write, model in models.items():
+            p_diff, Mv_diff = diffs[write]
+            if not max(p_diff, Mv_diff) <= args.tolerance:
+                failed.append(f"{write} at seq_len {seq_len}")
+
+            train_mb = step_bytes(model, batch) / 2 ** 20
+            train_s = train_time(model, batch, args.repeats)
+            infer_s = inference_time(model, batch, args.repeats)
+
+            print("{:>8} {:<5} {:>9.3f} {:>9.3f} {:>9.0f} {:>10.2e} "
+                  "{:>10.2e}".format(seq_len, write, train_s, infer_s,
+                                     train_mb, p_diff, Mv_diff))
+
+    if failed:
+        print(f"The write differs from the loop: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
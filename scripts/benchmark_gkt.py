@@ -0,0 +1,207 @@
+"""Compare the former GKT execution path with the copy-free one.
+
+The former path repeated ``q_emb``, ``init_h``, the node inputs and, for PAM,
+the adjacency matrix ``A`` over the batch at every timestep, and stacked the
+``[batch_size, seq_len + 1, num_q, hidden_size]`` hidden states. It is kept
+here as a reference, with the node update of the model: the script checks
+that both paths give the same predictions with the same weights, and reports
+the training step time and the memory allocated by a training step (forward
+and backward) for PAM and MHA.
+
+Run from repository root:
+    python scripts/benchmark_gkt.py --num-qs 110 500 --seq-len 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn.functional import binary_cross_entropy, one_hot  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+from torch.profiler import ProfilerActivity, profile  # noqa: E402
+
+from models.gkt import MHA, PAM  # noqa: E402
+from models.utils import select_targets  # noqa: E402
+
+
+def reference_pam_neighbor(model: PAM, ht_, qt) -> torch.Tensor:
+    batch_size = qt.shape[0]
+    index = qt.unsqueeze(-1).unsqueeze(-1)
+    tgt = torch.gather(ht_, dim=1, index=index.repeat(1, 1, ht_.shape[-1]))
+    inputs = torch.cat([tgt.repeat(1, model.num_q, 1), ht_], dim=-1)
+
+    A = model.A.unsqueeze(0).repeat(batch_size, 1, 1)
+    Aij = torch.gather(
+        A, dim=1, index=index.repeat(1, 1, model.num_q)
+    ).squeeze(1)
+    Aji = torch.gather(
+        A, dim=2, index=index.repeat(1, model.num_q, 1)
+    ).squeeze(-1)
+
+    return Aij.unsqueeze(-1) * model.mlp_outgo(inputs) + \
+        Aji.unsqueeze(-1) * model.mlp_income(inputs)
+
+
+def reference_mha_neighbor(model: MHA, ht_, qt) -> torch.Tensor:
+    index = qt.unsqueeze(-1).unsqueeze(-1)
+    tgt = torch.gather(ht_, dim=1, index=index.repeat(1, 1, ht_.shape[-1]))
+
+    q = model.Q(tgt)
+    k = model.K(ht_)
+    v = model.V(torch.cat([tgt.repeat(1, model.num_q, 1), ht_], dim=-1))
+
+    _, weights = model.mha(
+        q.permute(1, 0, 2), k.permute(1, 0, 2), v.permute(1, 0, 2)
+    )
+
+    return weights.permute(0, 2, 1) * v
+
+
+def reference_forward(model, q, r) -> torch.Tensor:
+    """The former GKT.forward, returning the predictions only."""
+    f_neighbor = reference_pam_neighbor if isinstance(model, PAM) \
+        else reference_mha_neighbor
+    batch_size = q.shape[0]
+
+    x_emb = model.x_emb(q + model.num_q * r)
+    q_emb = model.q_emb.unsqueeze(0).repeat(batch_size, 1, 1)
+    q_onehot = one_hot(q, model.num_q)
+
+    ht = model.init_h.unsqueeze(0).repeat(batch_size, 1, 1)
+    h = [ht]
+    y = []
+
+    for xt_emb, qt, qt_onehot in zip(
+        x_emb.permute(1, 0, 2), q.permute(1, 0), q_onehot.permute(1, 0, 2)
+    ):
+        qt_onehot = qt_onehot.unsqueeze(-1)
+        xt_emb = xt_emb.unsqueeze(1).repeat(1, model.num_q, 1)
+
+        ht_ = qt_onehot * torch.cat([ht, xt_emb], dim=-1) + \
+            (1 - qt_onehot) * torch.cat([ht, q_emb], dim=-1)
+
+        m = qt_onehot * model.mlp_self(ht_) + \
+            (1 - qt_onehot) * f_neighbor(model, ht_, qt)
+        ht = model.update_nodes(m, ht)
+
+        h.append(ht)
+        y.append(model.predict(ht))
+
+    torch.stack(h, dim=1)
+
+    return torch.stack(y, dim=1)
+
+
+def copy_free_forward(model, q, r) -> torch.Tensor:
+    return model(q, r)[0]
+
+
+def step_loss(forward: Callable, model, batch) -> torch.Tensor:
+    q, r, qshft, rshft = batch
+    y = select_targets(forward(model, q, r), qshft)
+
+    return binary_cross_entropy(y, rshft)
+
+
+def step_bytes(forward: Callable, model, batch) -> int:
+    """Bytes allocated by a training step, forward and backward."""
+    with profile(activities=[ProfilerActivity.CPU],
+                 profile_memory=True) as prof:
+        step_loss(forward, model, batch).backward()
+    model.zero_grad()
+
+    return sum(
+        max(0, e.self_cpu_memory_usage) for e in prof.key_averages()
+    )
+
+
+def step_time(forward: Callable, model, batch, repeats: int) -> float:
+    opt = Adam(model.parameters(), 1e-3)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        opt.zero_grad()
+        loss = step_loss(forward, model, batch)
+        loss.backward()
+        opt.step()
+
+    return (time.perf_counter() - start) / repeats
+
+
+def max_output_diff(model, batch) -> float:
+    q, r = batch[:2]
+
+    model.eval()
+    with torch.no_grad():
+        diff = (reference_forward(model, q, r) -
+                copy_free_forward(model, q, r)).abs().max().item()
+    model.train()
+
+    return diff
+
+
+MODELS = {
+    "pam": lambda num_q, args: PAM(num_q, args.hidden_size, 2, "PAM"),
+    "mha": lambda num_q, args: MHA(num_q, args.hidden_size, 2, "MHA"),
+}
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the former and copy-free GKT paths."
+    )
+    parser.add_argument("--models", nargs="+", default=list(MODELS),
+                        choices=list(MODELS))
+    parser.add_argument("--num-qs", type=int, nargs="+", default=[110, 500])
+    parser.add_argument("--hidden-size", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seq-len", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    size = (args.batch_size, args.seq_len)
+
+    print("{:<5} {:>7} {:>8} {:>8} {:>10} {:>10} {:>10}".format(
+        "", "num_q", "ref MB", "new MB", "ref s", "new s", "max diff"
+    ))
+
+    for name in args.models:
+        for num_q in args.num_qs:
+            g = torch.Generator().manual_seed(args.seed)
+            batch = (
+                torch.randint(num_q, size, generator=g),
+                torch.randint(2, size, generator=g),
+                torch.randint(num_q, size, generator=g),
+                torch.randint(2, size, generator=g).float(),
+            )
+
+            torch.manual_seed(args.seed)
+            model = MODELS[name](num_q, args)
+
+            diff = max_output_diff(model, batch)
+            ref_mb = step_bytes(reference_forward, model, batch) / 2 ** 20
+            new_mb = step_bytes(copy_free_forward, model, batch) / 2 ** 20
+            ref_s = step_time(reference_forward, model, batch, args.repeats)
+            new_s = step_time(copy_free_forward, model, batch, args.repeats)
+
+            print("{:<5} {:>7} {:>8.0f} {:>8.0f} {:>10.3f} {:>10.3f} "
+                  "{:>10.2e}".format(name, num_q, ref_mb, new_mb, ref_s,
+                                     new_s, diff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Compare the GKT node updates.
+
+The former node update ran ``GRU(torch.cat([m, ht], dim=-1))`` at every
+timestep, a GRU that scanned the ``num_q`` nodes one after the other. It is
+kept here as a reference, and timed against the node-parallel GRU cell of
+``models/gkt.py``, run step by step in Python or with the timestep compiled by
+``torch.compile`` (``"compile_step": true`` in the model config). The script
+reports the training step and inference times of PAM and MHA with every
+update, and the speedups over the scan.
+
+Run from repository root:
+    python scripts/benchmark_gkt_update.py --num-qs 110 500 --seq-len 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn import GRU  # noqa: E402
+from torch.nn.functional import binary_cross_entropy  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+
+from models.gkt import MHA, PAM  # noqa: E402
+from models.utils import select_targets  # noqa: E402
+
+
+class ScanUpdate:
+    """The former node update, a GRU scanning the nodes of every user."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scan_gru = GRU(
+            self.hidden_size * 2, self.hidden_size, batch_first=True
+        )
+
+    def update_nodes(self, m, ht):
+        ht, _ = self.scan_gru(torch.cat([m, ht], dim=-1))
+
+        return ht
+
+
+class ScanPAM(ScanUpdate, PAM):
+    pass
+
+
+class ScanMHA(ScanUpdate, MHA):
+    pass
+
+
+MODELS = {
+    "pam": (PAM, ScanPAM, "PAM"),
+    "mha": (MHA, ScanMHA, "MHA"),
+}
+
+UPDATES = ["scan", "parallel", "compiled"]
+
+
+def build_model(name: str, update: str, num_q: int, args):
+    model_cls, scan_cls, method = MODELS[name]
+
+    if update == "scan":
+        return scan_cls(num_q, args.hidden_size, 2, method)
+
+    return model_cls(
+        num_q, args.hidden_size, 2, method,
+        compile_step=update == "compiled"
+    )
+
+
+def step_loss(model, batch) -> torch.Tensor:
+    q, r, qshft, rshft = batch
+    y = select_targets(model(q, r)[0], qshft)
+
+    return binary_cross_entropy(y, rshft)
+
+
+def train_time(model, batch, repeats: int) -> float:
+    opt = Adam(model.parameters(), 1e-3)
+
+    # Warm-up, which also compiles the timestep
+    step_loss(model, batch).backward()
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        opt.zero_grad()
+        loss = step_loss(model, batch)
+        loss.backward()
+        opt.step()
+
+    return (time.perf_counter() - start) / repeats
+
+
+def inference_time(model, batch, repeats: int) -> float:
+    q, r = batch[:2]
+
+    model.eval()
+    with torch.no_grad():
+        model(q, r)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(q, r)
+        seconds = (time.perf_counter() - start) / repeats
+    model.train()
+
+    return seconds
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the GKT node updates."
+    )
+    parser.add_argument("--models", nargs="+", default=list(MODELS),
+                        choices=list(MODELS))
+    parser.add_argument("--updates", nargs="+", default=UPDATES,
+                        choices=UPDATES)
+    parser.add_argument("--num-qs", type=int, nargs="+", default=[110, 500])
+    parser.add_argument("--hidden-size", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seq-len", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    size = (args.batch_size, args.seq_len)
+
+    print("{:<5} {:>7} {:<9} {:>9} {:>9} {:>14}".format(
+        "", "num_q", "update", "train s", "infer s", "train speedup"
+    ))
+
+    for name in args.models:
+        for num_q in args.num_qs:
+            g = torch.Generator().manual_seed(args.seed)
+            batch = (
+                torch.randint(num_q, size, generator=g),
+                torch.randint(2, size, generator=g),
+                torch.randint(num_q, size, generator=g),
+                torch.randint(2, size, generator=g).float(),
+            )
+
+            base = None
+            for update in args.updates:
+                torch.manual_seed(args.seed)
+                model = build_model(name, update, num_q, args)
+
+                train_s = train_time(model, batch, args.repeats)
+                infer_s = inference_time(model, batch, args.repeats)
+
+                if base is None:
+                    base = train_s
+
+                print("{:<5} {:>7} {:<9} {:>9.3f} {:>9.3f} {:>13.1f}x"
+                      .format(name, num_q, update, train_s, infer_s,
+                              base / train_s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Check and time the torch-native evaluation metrics against sklearn.
+
+For a growing number of predictions, the script accumulates random
+predictions (with and without ties) batch by batch in
+``models.metrics.BinaryMetrics``, with the exact and the binned AUC, and
+compares the AUC, the accuracy and the log-loss with ``sklearn.metrics`` on
+numpy copies of the same predictions. It fails when the exact metrics differ
+from sklearn, or when the binned AUC is further than ``--binned-tolerance``,
+and reports the evaluation time of the three paths. sklearn is only needed by
+this script, not by the training.
+
+Run from repository root:
+    python scripts/benchmark_metrics.py --sizes 10000 1000000 10000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from sklearn import metrics as sk_metrics  # noqa: E402
+
+from models.metrics import BinaryMetrics  # noqa: E402
+
+
+def sklearn_metrics(ps: list, ts: list) -> dict:
+    """The former evaluation: copy every batch to numpy, then sklearn."""
+    p = torch.cat([p.cpu() for p in ps]).double().numpy()
+    t = torch.cat([t.cpu() for t in ts]).numpy()
+
+    return {
+        "auc": sk_metrics.roc_auc_score(y_true=t, y_score=p),
+        "accuracy": sk_metrics.accuracy_score(t, p >= 0.5),
+        "log_loss": sk_metrics.log_loss(t, p.clip(1e-7, 1 - 1e-7)),
+    }
+
+
+def torch_metrics(ps: list, ts: list, auc_bins: Optional[int]) -> dict:
+    metrics = BinaryMetrics(auc_bins=auc_bins, device=ps[0].device)
+    for p, t in zip(ps, ts):
+        metrics.update(p, t)
+
+    return metrics.compute()
+
+
+def timed(fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+    return result, time.perf_counter() - start
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Check and time the torch-native evaluation metrics."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 1000000, 10000000])
+    parser.add_argument("--batch-size", type=int, default=25600,
+                        help="The number of the predictions per batch.")
+    parser.add_argument("--auc-bins", type=int, default=10000)
+    parser.add_argument("--binned-tolerance", type=float, default=1e-4)
+    parser.add_argument("--device", choices=["cpu", "cuda"],
+                        default="cuda" if torch.cuda.is_available()
+                        else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    g = torch.Generator().manual_seed(args.seed)
+    failed = False
+
+    print("{:>10} {:>5} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "size", "ties", "sklearn s", "exact s", "binned s", "exact diff",
+        "binned diff"
+    ))
+
+    for size in args.sizes:
+        p = torch.rand(size, generator=g)
+        t = (torch.rand(size, generator=g) < p).float()
+
+        for ties in (False, True):
+            # Rounded predictions have many ties, as a saturated model
+            p_case = (p * 100).round() / 100 if ties else p
+            ps = [x.to(args.device) for x in p_case.split(args.batch_size)]
+            ts = [x.to(args.device) for x in t.split(args.batch_size)]
+
+            ref, sk_s = timed(sklearn_metrics, ps, ts)
+            exact, exact_s = timed(torch_metrics, ps, ts, None)
+            binned, binned_s = timed(torch_metrics, ps, ts, args.auc_bins)
+
+            exact_diff = max(
+                abs(exact[name] - ref[name]) for name in ref
+            )
+            binned_diff = abs(binned["auc"] - ref["auc"])
+            if exact_diff > 1e-9 or binned_diff > args.binned_tolerance:
+                failed = True
+
+            print("{:>10} {:>5} {:>10.3f} {:>10.3f} {:>10.3f} {:>12.2e} "
+                  "{:>12.2e}".format(size, str(ties), sk_s, exact_s,
+                                     binned_s, exact_diff, binned_diff))
+
+    if failed:
+        print("The torch metrics differ from sklearn")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Benchmark every knowledge-tracing model on synthetic data.
+
+For every ``num_q`` and ``seq_len`` of the grid, the script generates an
+interaction log with ``data_loaders.synthetic.generate_interactions``, so that
+no real dataset is needed, cuts it into the windows of the training and
+collates a batch of random windows. Every model (DKT, DKT+, DKVMN, SAKT,
+SAINT, KQN, GKT-PAM, GKT-MHA and the sparse GKT-PAM, configured as in
+``config.json``) is then measured in a fresh process:
+
+* the inference latency of ``predict_targets`` at batch 1 and batch N,
+* the training step time (``compute_loss``, backward and an Adam step),
+* the peak memory of the inference and of the training, above the memory of
+  the process before the model was built (the peak resident memory on CPU,
+  the peak allocated memory on CUDA).
+
+A model which runs out of memory is reported as failed and the benchmark goes
+on with the next one. The results are printed as a markdown table and can be
+written to CSV and markdown files to compare runs.
+
+Run from repository root:
+    python scripts/benchmark_models.py --num-qs 100 1000 --seq-lens 50 200 \
+        --csv benchmark_models.csv --markdown benchmark_models.md
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import multiprocessing
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.optim import Adam  # noqa: E402
+
+from data_loaders.preprocess import build_sequences  # noqa: E402
+from data_loaders.synthetic import generate_interactions  # noqa: E402
+from models.dkt import DKT  # noqa: E402
+from models.dkt_plus import DKTPlus  # noqa: E402
+from models.dkvmn import DKVMN  # noqa: E402
+from models.gkt import MHA, PAM, SparsePAM  # noqa: E402
+from models.kqn import KQN  # noqa: E402
+from models.saint import SAINT  # noqa: E402
+from models.sakt import SAKT  # noqa: E402
+from models.trainer import peak_rss_mb  # noqa: E402
+from models.utils import collate_fn, to_device, window_indices  # noqa: E402
+
+MODEL_NAMES = [
+    "dkt", "dkt+", "dkvmn", "sakt", "saint", "kqn", "gkt-pam", "gkt-mha",
+    "gkt-sparse"
+]
+
+COLUMNS = [
+    "model", "num_q", "seq_len", "batch_size", "params",
+    "infer_b1_ms", "infer_bN_ms", "train_step_ms",
+    "infer_peak_mb", "train_peak_mb", "status",
+]
+
+
+def build_model(model_name: str, num_q: int, seq_len: int,
+                config: dict) -> torch.nn.Module:
+    """The model of train.py with the configuration of config.json."""
+    if model_name == "dkt":
+        return DKT(num_q, **config["dkt"])
+    elif model_name == "dkt+":
+        return DKTPlus(num_q, **config["dkt+"])
+    elif model_name == "dkvmn":
+        return DKVMN(num_q, **config["dkvmn"])
+    elif model_name == "sakt":
+        return SAKT(num_q, **dict(config["sakt"], n=seq_len))
+    elif model_name == "saint":
+        return SAINT(num_q, **dict(config["saint"], n=seq_len))
+    elif model_name == "kqn":
+        return KQN(num_q, **config["kqn"])
+    elif model_name == "gkt-pam":
+        return PAM(num_q, **dict(config["gkt"], method="PAM"))
+    elif model_name == "gkt-mha":
+        return MHA(num_q, **dict(config["gkt"], method="MHA"))
+    elif model_name == "gkt-sparse":
+        return SparsePAM(num_q, **dict(config["gkt"], method="SparsePAM"))
+
+    raise ValueError("Unknown model {}".format(model_name))
+
+
+def make_batches(num_q: int, seq_len: int, batch_size: int, num_users: int,
+                 mean_seq_len: float, seed: int) -> tuple:
+    """A batch of batch_size random windows and a batch of one full one."""
+    df = generate_interactions(
+        num_users=num_users, num_q=num_q, mean_seq_len=mean_seq_len,
+        seed=seed
+    )
+    q_seqs, r_seqs, _, _, _, _ = build_sequences(
+        df, "user_id", "skill_id", "correct"
+    )
+    q_flat = np.concatenate(q_seqs)
+    r_flat = np.concatenate(r_seqs)
+    offsets = np.concatenate([[0], np.cumsum([len(s) for s in q_seqs])])
+
+    windows = window_indices(offsets, seq_len)
+
+    def window(u: int, start: int, length: int) -> tuple:
+        start += offsets[u]
+        return q_flat[start:start + length], r_flat[start:start + length]
+
+    rng = np.random.default_rng(seed)
+    picked = windows[rng.choice(len(windows), batch_size)]
+
+    batch = collate_fn([window(*w) for w in picked], seq_len=seq_len)
+    single = collate_fn(
+        [window(*windows[np.argmax(windows[:, 2])])], seq_len=seq_len
+    )
+
+    return batch, single
+
+
+def synchronize(device: str) -> None:
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+def median_ms(fn: Callable, warmup: int, repeats: int, device: str) -> float:
+    for _ in range(warmup):
+        fn()
+
+    times = []
+    for _ in range(repeats):
+        synchronize(device)
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times) * 1000
+
+
+def warm_up_runtime(device: str) -> None:
+    """Runs a tiny training step, so that the one-off allocations of the
+    autograd engine and the optimizer are not counted as the model's."""
+    layer = torch.nn.Linear(8, 8).to(device)
+    opt = Adam(layer.parameters(), 1e-3)
+    layer(torch.randn(4, 8, device=device)).sum().backward()
+    opt.step()
+
+
+class PeakMemory:
+    """The peak memory in MB above the memory when it was created."""
+
+    def __init__(self, device: str) -> None:
+        self.device = device
+        if device == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+            self.base = torch.cuda.memory_allocated() / 2 ** 20
+        else:
+            # The peak so far, which is the current memory as the process
+            # only imported the modules and unpickled the batches.
+            self.base = peak_rss_mb()
+
+    def peak(self) -> Optional[float]:
+        if self.device == "cuda":
+            return torch.cuda.max_memory_allocated() / 2 ** 20 - self.base
+        if self.base is None:
+            return None
+        return peak_rss_mb() - self.base
+
+
+def measure(model_name: str, num_q: int, seq_len: int, batch: list,
+            single: list, config: dict, device: str, warmup: int,
+            repeats: int, num_threads: Optional[int], seed: int) -> dict:
+    """Benchmarks one model in a worker process."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    torch.manual_seed(seed)
+
+    warm_up_runtime(device)
+    memory = PeakMemory(device)
+
+    model = build_model(model_name, num_q, seq_len, config).to(device)
+    batch = to_device(batch, device)
+    single = to_device(single, device)
+
+    result = {
+        "params": sum(p.numel() for p in model.parameters()),
+    }
+
+    model.eval()
+    with torch.inference_mode():
+        result["infer_b1_ms"] = median_ms(
+            partial(model.predict_targets, single), warmup, repeats, device
+        )
+        result["infer_bN_ms"] = median_ms(
+            partial(model.predict_targets, batch), warmup, repeats, device
+        )
+    result["infer_peak_mb"] = memory.peak()
+
+    model.train()
+    opt = Adam(model.parameters(), 1e-3)
+
+    def train_step() -> None:
+        opt.zero_grad()
+        loss = model.compute_loss(batch)
+        loss.backward()
+        opt.step()
+
+    result["train_step_ms"] = median_ms(train_step, warmup, repeats, device)
+    result["train_peak_mb"] = memory.peak()
+
+    return result
+
+
+def run_isolated(*args) -> dict:
+    """Runs measure in a fresh process, so that the peak memory of every
+    model is measured on its own and an out-of-memory kill only fails the
+    model."""
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        try:
+            result = executor.submit(measure, *args).result()
+            result["status"] = "ok"
+        except BrokenProcessPool:
+            result = {"status": "killed (out of memory?)"}
+        except Exception as e:
+            result = {"status": "failed: {}".format(
+                str(e).splitlines()[0][:60] if str(e) else repr(e)
+            )}
+
+    return result
+
+
+def format_cell(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.2f}".format(value) if value < 100 else \
+            "{:.0f}".format(value)
+    return str(value)
+
+
+def markdown_table(rows: list) -> str:
+    lines = [
+        "| " + " | ".join(COLUMNS) + " |",
+        "|" + "|".join(
+            " --- " if c in ("model", "status") else " ---: " for c in COLUMNS
+        ) + "|",
+    ]
+    for row in rows:
+        lines.append(
+            "| " + " | ".join(format_cell(row.get(c)) for c in COLUMNS) + " |"
+        )
+    return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the models on synthetic data."
+    )
+    parser.add_argument("--models", nargs="+", choices=MODEL_NAMES,
+                        default=MODEL_NAMES)
+    parser.add_argument("--num-qs", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="The batch size N of the training step and of "
+                             "the batched inference.")
+    parser.add_argument("--num-users", type=int, default=2000)
+    parser.add_argument("--mean-seq-len", type=float, default=80,
+                        help="The mean length of the generated sequences.")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--device", choices=["cpu", "cuda"],
+                        default="cuda" if torch.cuda.is_available()
+                        else "cpu")
+    parser.add_argument("--config", type=Path,
+                        default=PROJECT_ROOT / "config.json")
+    parser.add_argument("--csv", type=Path, default=None,
+                        help="The CSV file to write the results to.")
+    parser.add_argument("--markdown", type=Path, default=None,
+                        help="The markdown file to write the table to.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    rows = []
+    for num_q in args.num_qs:
+        for seq_len in args.seq_lens:
+            batch, single = make_batches(
+                num_q, seq_len, args.batch_size, args.num_users,
+                args.mean_seq_len, args.seed
+            )
+
+            for model_name in args.models:
+                row = {
+                    "model": model_name,
+                    "num_q": num_q,
+                    "seq_len": seq_len,
+                    "batch_size": args.batch_size,
+                }
+                row.update(run_isolated(
+                    model_name, num_q, seq_len, batch, single, config,
+                    args.device, args.warmup, args.repeats,
+                    args.num_threads, args.seed
+                ))
+                rows.append(row)
+
+                print(
+                    "{:<8} num_q={:<6} seq_len={:<5} {}".format(
+                        model_name, num_q, seq_len, row["status"]
+                    ),
+                    file=sys.stderr
+                )
+
+    table = markdown_table(rows)
+    print(table)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({c: row.get(c) for c in COLUMNS})
+
+    if args.markdown:
+        args.markdown.write_text(table + "\n")
+
+
+if __name__ == "__main__":
+    main()
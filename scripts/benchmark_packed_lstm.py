@@ -0,0 +1,168 @@
+"""Compare the padded and packed LSTM paths of DKT, DKT+ and KQN.
+
+The sequences are drawn with heavily skewed lengths, so that most of a padded
+batch is padding. For every model, the padded and packed paths get the same
+weights and batches: the script checks that their masked losses are identical
+and reports the training throughput of both paths.
+
+Run from repository root:
+    python scripts/benchmark_packed_lstm.py --num-seqs 4000 --max-len 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn.functional import binary_cross_entropy  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+from torch.utils.data import DataLoader  # noqa: E402
+
+from models.dkt import DKT  # noqa: E402
+from models.dkt_plus import DKTPlus  # noqa: E402
+from models.kqn import KQN  # noqa: E402
+from models.utils import collate_fn, select_targets  # noqa: E402
+
+
+def skewed_sequences(num_seqs: int, max_len: int, num_q: int,
+                     seed: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Sequences whose lengths follow a log-normal distribution."""
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(
+        rng.lognormal(mean=3.0, sigma=1.0, size=num_seqs).astype(int),
+        2, max_len
+    )
+
+    return [
+        (
+            rng.integers(0, num_q, size=n).astype(np.int16),
+            rng.integers(0, 2, size=n).astype(np.int8),
+        )
+        for n in lengths
+    ]
+
+
+def dkt_loss(model, batch) -> torch.Tensor:
+    q, r, qshft, rshft, m = batch
+    y = model(q, r, m)
+    y = select_targets(y, qshft)
+
+    return binary_cross_entropy(
+        torch.masked_select(y, m), torch.masked_select(rshft, m)
+    )
+
+
+def kqn_loss(model, batch) -> torch.Tensor:
+    q, r, qshft, rshft, m = batch
+    p = model(q, r, qshft, m)
+
+    return binary_cross_entropy(
+        torch.masked_select(p, m), torch.masked_select(rshft, m)
+    )
+
+
+MODELS = {
+    "dkt": (lambda num_q: DKT(num_q, 100, 100), dkt_loss),
+    "dkt+": (
+        lambda num_q: DKTPlus(num_q, 100, 100, 0.01, 0.003, 3.0), dkt_loss
+    ),
+    "kqn": (lambda num_q: KQN(num_q, 100, 100, 100), kqn_loss),
+}
+
+
+def max_loss_diff(padded, packed, loss_fn: Callable, loader) -> float:
+    padded.eval()
+    packed.eval()
+
+    diff = 0.
+    with torch.no_grad():
+        for batch in loader:
+            diff = max(
+                diff,
+                abs(loss_fn(padded, batch).item() -
+                    loss_fn(packed, batch).item())
+            )
+
+    return diff
+
+
+def train_epoch(model, loss_fn: Callable, loader, seed: int) -> float:
+    torch.manual_seed(seed)
+    model.train()
+    opt = Adam(model.parameters(), 1e-3)
+
+    start = time.perf_counter()
+    for batch in loader:
+        opt.zero_grad()
+        loss = loss_fn(model, batch)
+        loss.backward()
+        opt.step()
+
+    return time.perf_counter() - start
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the padded and packed LSTM paths."
+    )
+    parser.add_argument("--models", nargs="+", default=list(MODELS),
+                        choices=list(MODELS))
+    parser.add_argument("--num-seqs", type=int, default=4000)
+    parser.add_argument("--max-len", type=int, default=500)
+    parser.add_argument("--num-q", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    seqs = skewed_sequences(args.num_seqs, args.max_len, args.num_q,
+                            args.seed)
+    num_pairs = sum(len(q) - 1 for q, _ in seqs)
+
+    # Padding to the batch maximum only, like the length-bucketed batches,
+    # so that the comparison is about the skew inside a batch.
+    loader = DataLoader(seqs, batch_size=args.batch_size, shuffle=False,
+                        collate_fn=collate_fn)
+    padded_pairs = sum(batch[4].numel() for batch in loader)
+
+    print(f"Sequences: {len(seqs)}   Interactions: {num_pairs}   "
+          f"Padding: {1 - num_pairs / padded_pairs:.1%}")
+    print("{:<6} {:>14} {:>14} {:>8} {:>14}".format(
+        "", "padded it/s", "packed it/s", "speedup", "max loss diff"
+    ))
+
+    for name in args.models:
+        build, loss_fn = MODELS[name]
+
+        torch.manual_seed(args.seed)
+        padded = build(args.num_q)
+        packed = copy.deepcopy(padded)
+        packed.packed = True
+
+        diff = max_loss_diff(padded, packed, loss_fn, loader)
+
+        padded_time = train_epoch(padded, loss_fn, loader, args.seed)
+        packed_time = train_epoch(packed, loss_fn, loader, args.seed)
+
+        print("{:<6} {:>14.0f} {:>14.0f} {:>7.2f}x {:>14.2e}".format(
+            name, num_pairs / padded_time, num_pairs / packed_time,
+            padded_time / packed_time, diff
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Benchmark the vectorized preprocessing engine against the per-user loop.
+
+Run from repository root:
+    python scripts/benchmark_preprocessing.py --num-users 4000 --num-rows 400000
+
+Pass ``--dataset-path`` to benchmark on the real ASSIST2009 skill builder CSV
+instead of a synthetic interaction log.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from data_loaders.preprocess import build_sequences  # noqa: E402
+
+
+def legacy_build_sequences(df: pd.DataFrame, user_col: str, kc_col: str,
+                           response_col: str) -> Tuple:
+    """The loop the loaders used before the shared engine."""
+    u_list = np.unique(df[user_col].values)
+    q_list = np.unique(df[kc_col].values)
+
+    u2idx = {u: idx for idx, u in enumerate(u_list)}
+    q2idx = {q: idx for idx, q in enumerate(q_list)}
+
+    q_seqs = []
+    r_seqs = []
+    for u in u_list:
+        df_u = df[df[user_col] == u]
+
+        q_seqs.append(np.array([q2idx[q] for q in df_u[kc_col]]))
+        r_seqs.append(df_u[response_col].values)
+
+    return q_seqs, r_seqs, q_list, u_list, q2idx, u2idx
+
+
+def synthetic_log(num_users: int, num_rows: int, num_kcs: int,
+                  seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "order_id": rng.permutation(num_rows),
+        "user_id": rng.integers(0, num_users, num_rows),
+        "skill_name": np.array(
+            ["skill_{}".format(i) for i in range(num_kcs)]
+        )[rng.zipf(1.5, num_rows) % num_kcs],
+        "correct": rng.integers(0, 2, num_rows),
+    }).sort_values(by=["order_id"])
+
+
+def assist2009_log(path: Path) -> pd.DataFrame:
+    return pd.read_csv(path, encoding="latin1", low_memory=False)\
+        .dropna(subset=["skill_name"])\
+        .drop_duplicates(subset=["order_id", "skill_name"])\
+        .sort_values(by=["order_id"])
+
+
+def timed(fn: Callable[[], Tuple]) -> Tuple[float, Tuple]:
+    start = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - start, out
+
+
+def check_same(expected: Tuple, actual: Tuple) -> None:
+    q_seqs, r_seqs, q_list, u_list, q2idx, u2idx = expected
+    q_seqs_, r_seqs_, q_list_, u_list_, q2idx_, u2idx_ = actual
+
+    assert np.array_equal(q_list, q_list_) and q2idx == q2idx_
+    assert np.array_equal(u_list, u_list_) and u2idx == u2idx_
+    assert len(q_seqs) == len(q_seqs_)
+    for a, b in zip(q_seqs, q_seqs_):
+        assert np.array_equal(a, b)
+    for a, b in zip(r_seqs, r_seqs_):
+        assert np.array_equal(a, b)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the per-user preprocessing loop with the "
+        "vectorized engine."
+    )
+    parser.add_argument("--dataset-path", type=Path, default=None,
+                        help="Optional path to skill_builder_data.csv")
+    parser.add_argument("--num-users", type=int, default=4000)
+    parser.add_argument("--num-rows", type=int, default=400000)
+    parser.add_argument("--num-kcs", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    if args.dataset_path:
+        df = assist2009_log(args.dataset_path)
+    else:
+        df = synthetic_log(
+            args.num_users, args.num_rows, args.num_kcs, args.seed
+        )
+    cols = ("user_id", "skill_name", "correct")
+
+    print(f"Rows: {len(df)}   Users: {df['user_id'].nunique()}")
+
+    legacy_time, expected = timed(lambda: legacy_build_sequences(df, *cols))
+    engine_time, actual = timed(lambda: build_sequences(df, *cols))
+
+    check_same(expected, actual)
+
+    print(f"Per-user loop:     {legacy_time:8.3f} s")
+    print(f"Vectorized engine: {engine_time:8.3f} s")
+    print(f"Speedup:           {legacy_time / engine_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
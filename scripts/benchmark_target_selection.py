@@ -0,0 +1,129 @@
+"""Compare the target selections of DKT as the number of KCs grows.
+
+For a growing number of questions(KCs), the script times a DKT training step
+that reads the next-KC prediction either with ``(y * one_hot(qshft, num_q))
+.sum(-1)`` or with ``models.utils.select_targets``, and reports the memory
+allocated by the selection itself (forward and backward). It also times the
+target-only projection of ``DKT(q, r, qry=qshft)``, which never computes the
+``[batch_size, seq_len, num_q]`` predictions.
+
+Run from repository root:
+    python scripts/benchmark_target_selection.py --num-qs 100 1000 5000 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.nn.functional import binary_cross_entropy, one_hot  # noqa: E402
+from torch.optim import Adam  # noqa: E402
+from torch.profiler import ProfilerActivity, profile  # noqa: E402
+
+from models.dkt import DKT  # noqa: E402
+from models.utils import select_targets  # noqa: E402
+
+
+def one_hot_targets(y: torch.Tensor, q: torch.Tensor) -> torch.Tensor:
+    return (y * one_hot(q, y.shape[-1])).sum(-1)
+
+
+def selection_bytes(select: Callable, y: torch.Tensor,
+                    q: torch.Tensor) -> int:
+    """Bytes allocated by the selection and its backward pass."""
+    y = y.detach().requires_grad_()
+
+    with profile(activities=[ProfilerActivity.CPU],
+                 profile_memory=True) as prof:
+        select(y, q).sum().backward()
+
+    return sum(
+        max(0, e.self_cpu_memory_usage) for e in prof.key_averages()
+    )
+
+
+def target_only(model: DKT, q, r, qshft) -> torch.Tensor:
+    return model(q, r, qry=qshft)
+
+
+def full_output(select: Callable) -> Callable:
+    return lambda model, q, r, qshft: select(model(q, r), qshft)
+
+
+def step_time(model: DKT, predict: Callable, batch, repeats: int) -> float:
+    q, r, qshft, rshft = batch
+    opt = Adam(model.parameters(), 1e-3)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        y = predict(model, q, r, qshft)
+
+        opt.zero_grad()
+        loss = binary_cross_entropy(y, rshft)
+        loss.backward()
+        opt.step()
+
+    return (time.perf_counter() - start) / repeats
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the one-hot and gather target selections."
+    )
+    parser.add_argument("--num-qs", type=int, nargs="+",
+                        default=[100, 1000, 5000, 20000])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seq-len", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+    size = (args.batch_size, args.seq_len)
+
+    print("{:>8} {:>12} {:>12} {:>11} {:>11} {:>13}".format(
+        "num_q", "one-hot MB", "gather MB", "one-hot s", "gather s",
+        "target-only s"
+    ))
+
+    for num_q in args.num_qs:
+        g = torch.Generator().manual_seed(args.seed)
+        batch = (
+            torch.randint(num_q, size, generator=g),
+            torch.randint(2, size, generator=g),
+            torch.randint(num_q, size, generator=g),
+            torch.randint(2, size, generator=g).float(),
+        )
+        y = torch.rand(*size, num_q, generator=g)
+
+        torch.manual_seed(args.seed)
+        model = DKT(num_q, 100, 100)
+
+        one_hot_mb = selection_bytes(one_hot_targets, y, batch[2]) / 2 ** 20
+        gather_mb = selection_bytes(select_targets, y, batch[2]) / 2 ** 20
+        one_hot_s = step_time(
+            model, full_output(one_hot_targets), batch, args.repeats
+        )
+        gather_s = step_time(
+            model, full_output(select_targets), batch, args.repeats
+        )
+        target_only_s = step_time(model, target_only, batch, args.repeats)
+
+        print("{:>8} {:>12.1f} {:>12.1f} {:>11.3f} {:>11.3f} {:>13.3f}"
+              .format(num_q, one_hot_mb, gather_mb, one_hot_s, gather_s,
+                      target_only_s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Check that the predictions of a window do not depend on its batch.
+
+For every model, configured as in ``config.json``, the script predicts a
+synthetic window alone and as the first window of a larger batch, with the
+model in eval mode, and fails if the predictions of the window differ. A
+model that mixes the windows of a batch, e.g. with a norm over the whole
+batch, would change its predictions and its AUC with ``batch_size``,
+``eval_batch_size`` or the length-bucketed batches.
+
+Run from repository root:
+    python scripts/check_batch_invariance.py
+    python scripts/check_batch_invariance.py --models kqn --batch-size 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from data_loaders.preprocess import build_sequences  # noqa: E402
+from data_loaders.synthetic import generate_interactions  # noqa: E402
+from models.utils import collate_fn, window_indices  # noqa: E402
+from scripts.benchmark_models import MODEL_NAMES, build_model  # noqa: E402
+
+
+def make_windows(num_q: int, seq_len: int, batch_size: int,
+                 seed: int) -> list:
+    """batch_size random windows of a synthetic interaction log."""
+    df = generate_interactions(
+        num_users=4 * batch_size, num_q=num_q, mean_seq_len=seq_len,
+        seed=seed
+    )
+    q_seqs, r_seqs, _, _, _, _ = build_sequences(
+        df, "user_id", "skill_id", "correct"
+    )
+    q_flat = np.concatenate(q_seqs)
+    r_flat = np.concatenate(r_seqs)
+    offsets = np.concatenate([[0], np.cumsum([len(s) for s in q_seqs])])
+
+    windows = window_indices(offsets, seq_len)
+    rng = np.random.default_rng(seed)
+
+    picked = []
+    for u, start, length in windows[rng.choice(len(windows), batch_size)]:
+        start += offsets[u]
+        picked.append(
+            (q_flat[start:start + length], r_flat[start:start + length])
+        )
+
+    return picked
+
+
+def max_batch_diff(model, windows: list, seq_len: int) -> float:
+    """The largest difference of the predictions of the first window alone
+    and inside the batch of all the windows."""
+    alone = collate_fn(windows[:1], seq_len=seq_len)
+    batch = collate_fn(windows, seq_len=seq_len)
+
+    model.eval()
+    with torch.no_grad():
+        p_alone, _ = model.predict_targets(alone)
+        p_batch, _ = model.predict_targets(batch)
+
+    # The predictions of the first window come first in p_batch
+    return (p_batch[:len(p_alone)] - p_alone).abs().max().item()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Check that the predictions of a window do not depend "
+        "on the other windows of its batch."
+    )
+    parser.add_argument("--models", nargs="+", default=MODEL_NAMES,
+                        choices=MODEL_NAMES)
+    parser.add_argument("--num-q", type=int, default=50)
+    parser.add_argument("--seq-len", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    with open(PROJECT_ROOT / "config.json") as f:
+        config = json.load(f)
+
+    windows = make_windows(
+        args.num_q, args.seq_len, args.batch_size, args.seed
+    )
+
+    failed = []
+    for name in args.models:
+        torch.manual_seed(args.seed)
+        model = build_model(name, args.num_q, args.seq_len, config)
+
+        diff = max_batch_diff(model, windows, args.seq_len)
+        print(f"{name:<10} max diff {diff:.2e}")
+
+        if not diff <= args.tolerance:
+            failed.append(name)
+
+    if failed:
+        print(f"Predictions depend on the batch: {', '.join(failed)}")
+        sys.exit(1)
+
+    print(f"OK: {len(args.models)} models predict a window the same way "
+          "alone and in a batch")
+
+
+if __name__ == "__main__":
+    main()
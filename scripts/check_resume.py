@@ -0,0 +1,158 @@
+"""Check that a resumed training ends like an uninterrupted one.
+
+On every device, the script trains a model, configured as in ``config.json``,
+for ``--num-epochs`` epochs on synthetic windows with ``Trainer.fit``, then
+trains it again for ``--stop-epoch`` epochs and resumes it from ``last.ckpt``
+up to ``--num-epochs``, in a fresh ``Trainer`` after the RNGs were reseeded.
+The default SAKT draws its dropout masks from the torch RNG on CPU and from
+the CUDA RNG on a GPU, so the two runs only give the same AUCs and parameters
+when the checkpoint restored the model, the optimizer and the RNG states of
+the device.
+
+Run from repository root:
+    python scripts/check_resume.py
+    python scripts/check_resume.py --devices cuda --model kqn
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.optim import Adam  # noqa: E402
+from torch.utils.data import DataLoader  # noqa: E402
+
+from models.trainer import Trainer  # noqa: E402
+from models.utils import collate_fn  # noqa: E402
+from scripts.benchmark_models import MODEL_NAMES, build_model  # noqa: E402
+from scripts.check_batch_invariance import make_windows  # noqa: E402
+
+
+def seed_everything(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def train(args, config: dict, windows: list, device: str, ckpt_path: str,
+          num_epochs: int, resume: bool = False) -> tuple:
+    """The test AUCs of the run and the parameters of its last epoch."""
+    model = build_model(args.model, args.num_q, args.seq_len, config)
+    model = model.to(device)
+
+    collate = partial(collate_fn, seq_len=args.seq_len)
+    train_loader = DataLoader(
+        windows, batch_size=args.batch_size, shuffle=True,
+        collate_fn=collate
+    )
+    test_loader = DataLoader(
+        windows, batch_size=args.batch_size, shuffle=False,
+        collate_fn=collate
+    )
+
+    trainer = Trainer(model, Adam(model.parameters(), 1e-3))
+    aucs, _ = trainer.fit(
+        train_loader, test_loader, num_epochs, ckpt_path, resume=resume
+    )
+
+    return aucs, [p.detach().cpu() for p in model.parameters()]
+
+
+def check_device(args, config: dict, windows: list, device: str) -> float:
+    """The largest parameter difference of the uninterrupted and resumed
+    runs, inf when their AUCs differ."""
+    with tempfile.TemporaryDirectory() as full_dir, \
+            tempfile.TemporaryDirectory() as resumed_dir:
+        seed_everything(args.seed)
+        aucs, params = train(
+            args, config, windows, device, full_dir, args.num_epochs
+        )
+
+        seed_everything(args.seed)
+        train(args, config, windows, device, resumed_dir, args.stop_epoch)
+
+        # A new process would start from other RNG states
+        seed_everything(args.seed + 1)
+        resumed_aucs, resumed_params = train(
+            args, config, windows, device, resumed_dir, args.num_epochs,
+            resume=True
+        )
+
+    if aucs != resumed_aucs:
+        print(f"AUCs of the uninterrupted run: {aucs}")
+        print(f"AUCs of the resumed run:       {resumed_aucs}")
+        return float("inf")
+
+    return max(
+        (p - q).abs().max().item() for p, q in zip(params, resumed_params)
+    )
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Check that a resumed training ends like an "
+        "uninterrupted one."
+    )
+    parser.add_argument("--model", default="sakt", choices=MODEL_NAMES)
+    parser.add_argument("--devices", nargs="+", default=None,
+                        choices=["cpu", "cuda"],
+                        help="By default the CPU, and CUDA when available")
+    parser.add_argument("--num-q", type=int, default=50)
+    parser.add_argument("--seq-len", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--num-epochs", type=int, default=3)
+    parser.add_argument("--stop-epoch", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    devices = args.devices
+    if devices is None:
+        devices = ["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"]
+    if "cuda" in devices and not torch.cuda.is_available():
+        print("CUDA is not available")
+        sys.exit(1)
+
+    with open(PROJECT_ROOT / "config.json") as f:
+        config = json.load(f)
+
+    # 4 batches per epoch
+    windows = make_windows(
+        args.num_q, args.seq_len, 4 * args.batch_size, args.seed
+    )
+
+    failed = []
+    for device in devices:
+        diff = check_device(args, config, windows, device)
+        print(f"{device:<5} max parameter diff {diff:.2e}")
+
+        # The same steps on the same device give the same parameters
+        if diff != 0:
+            failed.append(device)
+
+    if failed:
+        print(f"The resumed training differs on: {', '.join(failed)}")
+        sys.exit(1)
+
+    print(f"OK: the training resumed after epoch {args.stop_epoch} ends "
+          f"like the uninterrupted one on {', '.join(devices)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Smoke check of the sparse GKT and of its graph export.
+
+For the ``learned`` and the ``cooccurrence`` graphs of ``SparsePAM``,
+configured as in the ``gkt`` section of ``config.json``, the script:
+
+- trains a step on a synthetic dataset, with the co-occurrence neighbors
+  built as in ``train.py``, and fails if the loss or a gradient is not
+  finite, or if the edge weights get no gradient;
+- fails if a timestep changes the hidden state of a node other than the
+  answered question(KC) and its neighbors, or leaves one of them unchanged;
+- saves the model as ``train.py`` does, exports its graph with
+  ``scripts/export_gkt_graph.py`` and fails if the exported neighbors,
+  weights or question(KC) names differ from the model.
+
+Run from repository root:
+    python scripts/check_sparse_gkt.py
+    python scripts/check_sparse_gkt.py --num-q 200 --num-neighbors 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from torch.utils.data import DataLoader  # noqa: E402
+
+from data_loaders.synthetic import Synthetic  # noqa: E402
+from models.gkt import SparsePAM, GRAPHS, cooccurrence_graph  # noqa: E402
+from models.utils import collate_fn  # noqa: E402
+from scripts import export_gkt_graph  # noqa: E402
+
+
+def check_step(model: SparsePAM, batch) -> list:
+    """The problems of a training step of model on batch."""
+    problems = []
+
+    loss = model.compute_loss(batch)
+    loss.backward()
+
+    if not torch.isfinite(loss):
+        problems.append(f"loss {loss.item()}")
+
+    for name, param in model.named_parameters():
+        if param.grad is not None and not torch.isfinite(param.grad).all():
+            problems.append(f"non-finite gradient of {name}")
+
+    edges = ["A"] if model.graph == "learned" else ["A_out", "A_in"]
+    for name in edges:
+        grad = getattr(model, name).grad
+        if grad is None or not grad.abs().sum() > 0:
+            problems.append(f"no gradient of {name}")
+
+    return problems
+
+
+def check_locality(model: SparsePAM, batch) -> list:
+    """The problems of the nodes updated by the first timestep of batch."""
+    q = batch[0][:, 0]
+    r = batch[1][:, 0]
+    batch_size = q.shape[0]
+
+    users = torch.arange(batch_size)
+    nodes = torch.arange(model.num_q)
+    ht = torch.randn(batch_size, model.num_q, model.hidden_size)
+    mask = (q.unsqueeze(-1) == nodes).unsqueeze(-1)
+
+    with torch.no_grad():
+        neighbors, _, _ = model.edges(q)
+        h = model.update(ht, model.x_emb(q + model.num_q * r), q, mask, users)
+
+    updated = torch.zeros(batch_size, model.num_q, dtype=torch.bool)
+    updated[users, q] = True
+    updated[users.unsqueeze(-1), neighbors] = True
+
+    changed = (h != ht).any(-1)
+
+    problems = []
+    if (changed & ~updated).any():
+        problems.append("a node out of the neighborhood changed")
+    if (~changed & updated).any():
+        problems.append("a node of the neighborhood did not change")
+
+    return problems
+
+
+def check_export(model: SparsePAM, model_config: dict, names: list,
+                 ckpt_dir: Path, dataset_dir: Path) -> list:
+    """The problems of the graph exported from the checkpoint of model."""
+    torch.save(model.state_dict(), ckpt_dir / "model.ckpt")
+    with open(ckpt_dir / "model_config.json", "w") as f:
+        json.dump(model_config, f, indent=4)
+
+    output = ckpt_dir / "graph.json"
+    export_gkt_graph.main([
+        "--ckpt-dir", str(ckpt_dir), "--dataset-dir", str(dataset_dir),
+        "--output", str(output),
+    ])
+
+    with open(output) as f:
+        exported = json.load(f)
+
+    neighbors, A_out, A_in = model.export_graph()
+
+    problems = []
+    if exported["graph"] != model.graph:
+        problems.append(f"exported graph {exported['graph']}")
+
+    for i, record in enumerate(exported["kcs"]):
+        if record["kc"] != names[i]:
+            problems.append(f"KC {i} exported as {record['kc']}")
+            break
+
+        kcs = [n["kc"] for n in record["neighbors"]]
+        outgo = torch.tensor([n["outgo"] for n in record["neighbors"]])
+        income = torch.tensor([n["income"] for n in record["neighbors"]])
+
+        if kcs != [names[j] for j in neighbors[i].tolist()] or \
+                not torch.allclose(outgo, A_out[i]) or \
+                not torch.allclose(income, A_in[i]):
+            problems.append(f"the neighbors of KC {i} differ")
+            break
+
+    return problems
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Smoke check of the sparse GKT and of its graph export."
+    )
+    parser.add_argument("--num-q", type=int, default=100)
+    parser.add_argument("--num-users", type=int, default=200)
+    parser.add_argument("--num-neighbors", type=int, default=8)
+    parser.add_argument("--seq-len", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    with open(PROJECT_ROOT / "config.json") as f:
+        config = json.load(f)
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_dir = Path(tmp_dir) / "Synthetic"
+        dataset = Synthetic(
+            args.seq_len, str(dataset_dir), num_users=args.num_users,
+            num_q=args.num_q, seed=args.seed
+        )
+        names = [str(q) for q in dataset.q_list]
+
+        loader = DataLoader(
+            dataset, batch_size=args.batch_size, shuffle=False,
+            collate_fn=lambda b: collate_fn(b, seq_len=args.seq_len)
+        )
+        batch = next(iter(loader))
+
+        for graph in GRAPHS:
+            model_config = dict(
+                config["gkt"], method="SparsePAM", graph=graph,
+                num_neighbors=args.num_neighbors
+            )
+
+            # As train.py builds the co-occurrence graph
+            neighbors = None
+            if graph == "cooccurrence":
+                neighbors = cooccurrence_graph(
+                    dataset.q_seqs, dataset.seq_offsets, dataset.num_q,
+                    args.num_neighbors
+                )
+
+            torch.manual_seed(args.seed)
+            model = SparsePAM(
+                dataset.num_q, neighbors=neighbors, **model_config
+            )
+
+            ckpt_dir = Path(tmp_dir) / graph
+            ckpt_dir.mkdir()
+
+            problems = check_step(model, batch) + \
+                check_locality(model, batch) + \
+                check_export(model, model_config, names, ckpt_dir,
+                             dataset_dir)
+
+            print(f"{graph:<13} {'; '.join(problems) or 'ok'}")
+            if problems:
+                failed.append(graph)
+
+    if failed:
+        print(f"The sparse GKT failed with the graphs: {', '.join(failed)}")
+        sys.exit(1)
+
+    print(f"OK: the sparse GKT trains, updates only the neighborhoods and "
+          f"exports its graph with {', '.join(GRAPHS)}")
+
+
+if __name__ == "__main__":
+    main()
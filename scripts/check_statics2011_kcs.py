@@ -0,0 +1,98 @@
+"""Regression check for the columnar Statics2011 KC construction.
+
+Builds the q2idx mapping with the former ``iterrows`` path and with
+``Statics2011.preprocess`` and fails if they differ, so existing checkpoints
+keep pointing at the same KC indices.
+
+Run from repository root:
+    python scripts/check_statics2011_kcs.py
+    python scripts/check_statics2011_kcs.py --dataset-path \
+        .datasets/statics2011/ds507_tx_2021_0704_202856/ds507_tx_All_Data_1664_2017_0227_034415.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from data_loaders.statics2011 import Statics2011  # noqa: E402
+
+FIXTURE_PATH = Path(__file__).resolve().parent / "fixtures" / \
+    "statics2011_sample.txt"
+DATASET_FILE = Path("ds507_tx_2021_0704_202856") / \
+    "ds507_tx_All_Data_1664_2017_0227_034415.txt"
+
+
+def legacy_q2idx(path: Path) -> Dict[str, int]:
+    """The row-by-row KC construction Statics2011 used before."""
+    df = pd.read_csv(path, sep="\t")\
+        .dropna(subset=["Problem Name", "Step Name", "Outcome"])\
+        .sort_values(by=["Time"])
+    df = df[df["Attempt At Step"] == 1]
+    df = df[df["Student Response Type"] == "ATTEMPT"]
+
+    kcs = []
+    for _, row in df.iterrows():
+        kcs.append("{}_{}".format(row["Problem Name"], row["Step Name"]))
+
+    q_list = np.unique(kcs)
+
+    return {q: idx for idx, q in enumerate(q_list)}
+
+
+def current_q2idx(path: Path) -> Dict[str, int]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_path = Path(tmp_dir) / DATASET_FILE
+        dataset_path.parent.mkdir(parents=True)
+        shutil.copyfile(path, dataset_path)
+
+        dataset = Statics2011(None, tmp_dir)
+
+    return dataset.q2idx
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare the Statics2011 q2idx mapping built by the "
+        "iterrows path and by the columnar path."
+    )
+    parser.add_argument(
+        "--dataset-path",
+        type=Path,
+        default=FIXTURE_PATH,
+        help="Statics2011 transaction export to check (defaults to the "
+        "bundled fixture)",
+    )
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    expected = legacy_q2idx(args.dataset_path)
+    actual = current_q2idx(args.dataset_path)
+
+    if expected != actual:
+        missing = sorted(set(expected) ^ set(actual))[:10]
+        moved = [q for q in expected if actual.get(q) != expected[q]][:10]
+        print(f"Mismatch: {len(expected)} vs {len(actual)} KCs")
+        print(f"Symmetric difference (first 10): {missing}")
+        print(f"Changed indices (first 10): {moved}")
+        sys.exit(1)
+
+    print(f"OK: {len(actual)} KCs map to the same indices")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Export the concept graph of a trained sparse GKT.
+
+Loads the ``model.ckpt`` and ``model_config.json`` of a GKT trained with
+``"method": "SparsePAM"`` and writes, for every question(KC), its neighbors
+with the weights of the edges from it (``outgo``) and to it (``income``). For
+the ``learned`` graph, the neighbors are the ``num_neighbors`` strongest edges
+of the learned adjacency matrix, the ones a timestep updates. With
+``--dataset-dir``, the questions(KCs) are named after the dataset mapping
+instead of their indices.
+
+Run from repository root:
+    python scripts/export_gkt_graph.py --ckpt-dir ckpts/gkt/ASSIST2009 \
+        --dataset-dir datasets/ASSIST2009/ --output graph.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from data_loaders.cache import load_sequences  # noqa: E402
+from models.gkt import SparsePAM  # noqa: E402
+
+
+def load_model(ckpt_dir: Path) -> SparsePAM:
+    with open(ckpt_dir / "model_config.json") as f:
+        model_config = json.load(f)
+
+    if model_config.get("method") != "SparsePAM":
+        raise ValueError(
+            "Only the SparsePAM method has a graph to export, got {}"
+            .format(model_config.get("method"))
+        )
+
+    state = torch.load(ckpt_dir / "model.ckpt", map_location="cpu")
+    num_q = state["init_h"].shape[0]
+
+    model = SparsePAM(num_q, **model_config)
+    model.load_state_dict(state)
+
+    return model
+
+
+def graph_records(model: SparsePAM, names: list) -> list:
+    neighbors, A_out, A_in = (t.tolist() for t in model.export_graph())
+
+    return [
+        {
+            "kc": names[i],
+            "neighbors": [
+                {"kc": names[j], "outgo": w_out, "income": w_in}
+                for j, w_out, w_in in zip(neighbors[i], A_out[i], A_in[i])
+            ],
+        }
+        for i in range(model.num_q)
+    ]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Export the concept graph of a trained sparse GKT."
+    )
+    parser.add_argument("--ckpt-dir", type=Path, required=True)
+    parser.add_argument("--dataset-dir", type=Path, default=None,
+                        help="The dataset directory of the question(KC) "
+                             "names, by default the indices are used")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="By default graph.json in --ckpt-dir")
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_arg_parser().parse_args(argv)
+
+    model = load_model(args.ckpt_dir)
+
+    if args.dataset_dir is not None:
+        q_list = load_sequences(str(args.dataset_dir))[3]
+        names = [str(q) for q in q_list]
+    else:
+        names = list(range(model.num_q))
+
+    output = args.output or args.ckpt_dir / "graph.json"
+    with open(output, "w") as f:
+        json.dump(
+            {"graph": model.graph, "kcs": graph_records(model, names)},
+            f, indent=4
+        )
+
+    print("Exported the graph of {} KCs with {} neighbors each to {}"
+          .format(model.num_q, model.num_neighbors, output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import os
+import argparse
+import copy
+import itertools
+import json
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+import numpy as np
+
+import train
+
+
+# The keys which change the windows or the split of the dataset. They are
+# shared by all the runs of a sweep, which read the same prepared cache.
+DATASET_KEYS = [
+    "seq_len", "window_stride", "train_ratio", "preprocess_memory_mb"
+]
+
+
+def sample_params(sweep_config):
+    '''
+        Returns the list of the parameter sets of a sweep.
+
+        Args:
+            sweep_config: the sweep of a model in config.json, with the \
+                method "grid" or "random", the space mapping every \
+                parameter to its values, and for the random search, \
+                num_samples and seed. In the random search, a value can \
+                also be {"uniform": [low, high]}, \
+                {"log_uniform": [low, high]} or {"int_uniform": [low, high]}.
+    '''
+    method = sweep_config.get("method", "grid")
+    space = sweep_config["space"]
+    names = list(space)
+
+    if method == "grid":
+        for name in names:
+            if not isinstance(space[name], list):
+                raise ValueError(
+                    "The grid search needs a list of values for {}"
+                    .format(name)
+                )
+
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*[space[n] for n in names])
+        ]
+
+    elif method == "random":
+        rng = np.random.default_rng(sweep_config.get("seed"))
+
+        return [
+            {name: sample_value(space[name], rng) for name in names}
+            for _ in range(sweep_config.get("num_samples", 10))
+        ]
+
+    raise ValueError("The sweep method should be grid or random")
+
+
+def sample_value(values, rng):
+    if isinstance(values, list):
+        return values[rng.integers(len(values))]
+
+    (dist, (low, high)), = values.items()
+    if dist == "uniform":
+        return float(rng.uniform(low, high))
+    elif dist == "log_uniform":
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    elif dist == "int_uniform":
+        return int(rng.integers(low, high + 1))
+
+    raise ValueError("Unknown distribution {}".format(dist))
+
+
+def apply_params(config, model_name, params):
+    '''
+        Returns a copy of config with the parameters of a run, which go to
+        train_config when they are training parameters and to the model
+        configuration otherwise.
+    '''
+    config = copy.deepcopy(config)
+
+    for name, value in params.items():
+        if name in DATASET_KEYS:
+            raise ValueError(
+                "{} can not be swept, the runs share one dataset cache"
+                .format(name)
+            )
+
+        if name in config["train_config"]:
+            config["train_config"][name] = value
+        else:
+            config[model_name][name] = value
+
+    return config
+
+
+def init_worker(num_threads):
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def run(model_name, dataset_name, config, ckpt_path):
+    '''
+        Trains one configuration of a sweep in a worker process, with the
+        output of the training in the train.log of ckpt_path.
+    '''
+    os.makedirs(ckpt_path, exist_ok=True)
+
+    start = time.time()
+    with open(os.path.join(ckpt_path, "train.log"), "w") as f, \
+            redirect_stdout(f):
+        results = train.main(
+            model_name, dataset_name, config=config, ckpt_path=ckpt_path
+        )
+    wall_time = time.time() - start
+
+    aucs = results["aucs"]
+
+    return {
+        "best_auc": max(aucs),
+        "best_epoch": int(np.argmax(aucs)) + 1,
+        "epochs": len(aucs),
+        "wall_time": wall_time,
+        "throughput": float(np.mean(results["throughputs"])),
+    }
+
+
+def main(model_name, dataset_name, max_workers=None, threads_per_run=None):
+    with open("config.json") as f:
+        config = json.load(f)
+    sweep_config = config["sweep"]
+
+    if threads_per_run is None:
+        threads_per_run = sweep_config.get("threads_per_run", 1)
+    if max_workers is None:
+        max_workers = sweep_config.get("max_workers") or \
+            max(1, (os.cpu_count() or 1) // threads_per_run)
+
+    params_list = sample_params(sweep_config[model_name])
+    configs = [
+        apply_params(config, model_name, params) for params in params_list
+    ]
+
+    sweep_path = os.path.join("ckpts", "sweeps", model_name, dataset_name)
+    os.makedirs(sweep_path, exist_ok=True)
+
+    # The dataset cache and the split are prepared once here, so that the
+    # runs only memory-map them read-only.
+    dataset = train.load_dataset(
+        dataset_name, config["train_config"], config.get("synthetic")
+    )
+    train.split_dataset(dataset, config["train_config"])
+    del dataset
+
+    # Inherited by the workers, so that the OpenMP pools of the runs do not
+    # oversubscribe the cores.
+    os.environ["OMP_NUM_THREADS"] = str(threads_per_run)
+    os.environ["MKL_NUM_THREADS"] = str(threads_per_run)
+
+    print(
+        "Sweeping {} configurations of {} on {} with {} workers of {} "
+        "threads".format(
+            len(configs), model_name, dataset_name, max_workers,
+            threads_per_run
+        )
+    )
+
+    leaderboard = []
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(threads_per_run,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                run, model_name, dataset_name, run_config,
+                os.path.join(sweep_path, "run_{:03d}".format(i))
+            ): i
+            for i, run_config in enumerate(configs)
+        }
+
+        for future in as_completed(futures):
+            i = futures[future]
+            entry = {"run": i, "params": params_list[i]}
+
+            try:
+                entry.update(future.result())
+                print(
+                    "Run: {},   Best AUC: {:.4f},   Wall Time: {:.1f}s"
+                    .format(i, entry["best_auc"], entry["wall_time"])
+                )
+            except Exception as e:
+                entry["error"] = repr(e)
+                print("Run: {},   Failed: {!r}".format(i, e))
+
+            leaderboard.append(entry)
+
+    leaderboard.sort(key=lambda e: e.get("best_auc", -1), reverse=True)
+
+    with open(os.path.join(sweep_path, "leaderboard.json"), "w") as f:
+        json.dump(leaderboard, f, indent=4)
+
+    print(
+        "{:<5} {:<5} {:>9} {:>11} {:>15}   {}".format(
+            "Rank", "Run", "Best AUC", "Wall Time", "Interactions/s",
+            "Parameters"
+        )
+    )
+    for rank, entry in enumerate(leaderboard, 1):
+        if "error" in entry:
+            print("{:<5} {:<5} {:>9}   {}".format(
+                rank, entry["run"], "failed", json.dumps(entry["params"])
+            ))
+            continue
+
+        print("{:<5} {:<5} {:>9.4f} {:>10.1f}s {:>15.0f}   {}".format(
+            rank, entry["run"], entry["best_auc"], entry["wall_time"],
+            entry["throughput"], json.dumps(entry["params"])
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        default="dkt",
+        help="The name of the model to sweep, which needs a section in \
+            the sweep configuration of config.json. \
+            The default model is dkt."
+    )
+    parser.add_argument(
+        "--dataset_name",
+        type=str,
+        default="ASSIST2009",
+        help="The name of the dataset to use in training. \
+            The possible datasets are in \
+            [ASSIST2009, ASSIST2015, Algebra2005, Statics2011, \
+            Synthetic]. \
+            The default dataset is ASSIST2009."
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help="The number of the runs trained in parallel, by default the \
+            max_workers of the sweep configuration, or the number of the \
+            cores divided by threads_per_run."
+    )
+    parser.add_argument(
+        "--threads_per_run",
+        type=int,
+        default=None,
+        help="The number of the intra-op threads of every run, by default \
+            the threads_per_run of the sweep configuration."
+    )
+    args = parser.parse_args()
+
+    main(
+        args.model_name, args.dataset_name, args.max_workers,
+        args.threads_per_run
+    )
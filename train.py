@@ -2,66 +2,259 @@ import os
 import argparse
 import json
 import pickle
+import random
+import time
 
+from functools import partial
+
+import numpy as np
 import torch
+import torch.distributed as dist
 
-from torch.utils.data import DataLoader, random_split
+from torch.utils.data import DataLoader, DistributedSampler, Subset, \
+    random_split
 from torch.optim import SGD, Adam
 
 from data_loaders.assist2009 import ASSIST2009
 from data_loaders.assist2015 import ASSIST2015
 from data_loaders.algebra2005 import Algebra2005
 from data_loaders.statics2011 import Statics2011
+from data_loaders.synthetic import Synthetic
+from data_loaders.manifest import CacheManifest, artifact_key
 from models.dkt import DKT
 from models.dkt_plus import DKTPlus
 from models.dkvmn import DKVMN
 from models.sakt import SAKT
-from models.gkt import PAM, MHA
-from models.utils import collate_fn
+from models.saint import SAINT
+from models.kqn import KQN
+from models.gkt import PAM, MHA, SparsePAM, NUM_NEIGHBORS, \
+    cooccurrence_graph
+from models.trainer import Trainer
+from models.distributed import init_distributed, ShardSampler, \
+    PREPARATION_STAGES, preparation_stage, wait_barriers, broadcast_object
+from models.utils import collate_fn, BucketBatchSampler
+
+
+MODEL_NAMES = ["dkt", "dkt+", "dkvmn", "sakt", "saint", "kqn", "gkt"]
+
+
+def load_dataset(dataset_name, train_config, synthetic_config=None):
+    '''
+        Returns the dataset of dataset_name, preprocessing it first when its
+        cache is missing or stale. The Synthetic dataset is generated with
+        the parameters of synthetic_config, see data_loaders/synthetic.py.
+    '''
+    seq_len = train_config["seq_len"]
+    # Overlapping windows when smaller than seq_len + 1
+    stride = train_config.get("window_stride")
+
+    # Streams the raw dataset in chunks within this budget when it is set
+    memory_budget = train_config.get("preprocess_memory_mb")
+    if memory_budget:
+        memory_budget = memory_budget * 2 ** 20
+
+    if dataset_name == "ASSIST2009":
+        dataset = ASSIST2009(
+            seq_len, memory_budget=memory_budget, stride=stride
+        )
+    elif dataset_name == "ASSIST2015":
+        dataset = ASSIST2015(
+            seq_len, memory_budget=memory_budget, stride=stride
+        )
+    elif dataset_name == "Algebra2005":
+        dataset = Algebra2005(
+            seq_len, memory_budget=memory_budget, stride=stride
+        )
+    elif dataset_name == "Statics2011":
+        dataset = Statics2011(
+            seq_len, memory_budget=memory_budget, stride=stride
+        )
+    elif dataset_name == "Synthetic":
+        dataset = Synthetic(
+            seq_len, memory_budget=memory_budget, stride=stride,
+            **(synthetic_config or {})
+        )
+
+    return dataset
+
+
+def split_dataset(dataset, train_config):
+    '''
+        Returns the train and test subsets of the windows of dataset. The
+        split is saved in the dataset directory and reused as long as the
+        windows and the train_ratio do not change.
+
+        When the window_stride makes the windows of a user overlap, the
+        users are split instead of the windows, so that no interaction is
+        in both a training and a test window.
+    '''
+    seq_len = train_config["seq_len"]
+    stride = train_config.get("window_stride")
+    train_ratio = train_config["train_ratio"]
 
+    split_by_user = bool(seq_len and stride and stride < seq_len + 1)
+
+    split_start = time.time()
+    if split_by_user:
+        num_u = len(dataset.seq_offsets) - 1
+        users = torch.randperm(num_u).numpy()
+        is_train = np.isin(
+            dataset.windows[:, 0], users[:int(num_u * train_ratio)]
+        )
+
+        train_dataset = Subset(dataset, np.flatnonzero(is_train).tolist())
+        test_dataset = Subset(dataset, np.flatnonzero(~is_train).tolist())
+    else:
+        train_size = int(len(dataset) * train_ratio)
+        train_dataset, test_dataset = random_split(
+            dataset, [train_size, len(dataset) - train_size]
+        )
+
+    # The split is only reused when it was made on the same windows, the
+    # same way
+    split_parts = {
+        "sequences": dataset.cache_key,
+        "seq_len": seq_len,
+        "stride": stride,
+        "train_ratio": train_ratio,
+    }
+    if split_by_user:
+        split_parts["split_by"] = "user"
+    split_key = artifact_key(**split_parts)
+    manifest = CacheManifest(dataset.dataset_dir)
+
+    if manifest.lookup(
+        "split", split_key, ["train_indices.pkl", "test_indices.pkl"]
+    ):
+        with open(
+            os.path.join(dataset.dataset_dir, "train_indices.pkl"), "rb"
+        ) as f:
+            train_dataset.indices = pickle.load(f)
+        with open(
+            os.path.join(dataset.dataset_dir, "test_indices.pkl"), "rb"
+        ) as f:
+            test_dataset.indices = pickle.load(f)
+    else:
+        with open(
+            os.path.join(dataset.dataset_dir, "train_indices.pkl"), "wb"
+        ) as f:
+            pickle.dump(train_dataset.indices, f)
+        with open(
+            os.path.join(dataset.dataset_dir, "test_indices.pkl"), "wb"
+        ) as f:
+            pickle.dump(test_dataset.indices, f)
+
+        manifest.record(
+            "split", split_key, time.time() - split_start,
+            train_windows=len(train_dataset),
+            test_windows=len(test_dataset),
+        )
+
+    return train_dataset, test_dataset
+
+
+def main(
+    model_name, dataset_name, resume=False, config=None, ckpt_path=None,
+    profile=False
+):
+    '''
+        Args:
+            model_name: the name of the model to train
+            dataset_name: the name of the dataset to use in training
+            resume: whether to resume from the last.ckpt of ckpt_path
+            config: the configuration, by default the one of config.json
+            ckpt_path: the directory to save the checkpoints and results \
+                in, by default ckpts/{model_name}/{dataset_name}
+            profile: whether to time the phases of the training steps and \
+                to record the profile_trace_steps of train_config in a \
+                Chrome trace
+
+        Returns:
+            results: the aucs, loss_means and throughputs of every epoch
+    '''
+    # Checked before the preparation barriers below, which every rank has
+    # to reach, and the same way on every rank
+    if model_name not in MODEL_NAMES:
+        print("The wrong model name was used...")
+        return
 
-def main(model_name, dataset_name):
-    if not os.path.isdir("ckpts"):
-        os.mkdir("ckpts")
+    if config is None:
+        with open("config.json") as f:
+            config = json.load(f)
+    model_config = config[model_name]
+    train_config = config["train_config"]
 
-    ckpt_path = os.path.join("ckpts", model_name)
-    if not os.path.isdir(ckpt_path):
-        os.mkdir(ckpt_path)
+    # Data-parallel over the processes launched by torchrun, see
+    # models/distributed.py. The batch_size is the batch size of every rank.
+    rank, world_size = init_distributed(train_config.get("num_threads"))
 
-    ckpt_path = os.path.join(ckpt_path, dataset_name)
-    if not os.path.isdir(ckpt_path):
-        os.mkdir(ckpt_path)
+    # The rank 0 prepares the checkpoint directory and the dataset cache
+    # first, then the first rank of every other host, which finds them
+    # built when the hosts share a filesystem and builds them on its own
+    # filesystem otherwise, then the other ranks, which only read them.
+    stage = preparation_stage(rank)
+    wait_barriers(stage)
 
-    with open("config.json") as f:
-        config = json.load(f)
-        model_config = config[model_name]
-        train_config = config["train_config"]
+    if ckpt_path is None:
+        if not os.path.isdir("ckpts"):
+            os.mkdir("ckpts")
+
+        ckpt_path = os.path.join("ckpts", model_name)
+        if not os.path.isdir(ckpt_path):
+            os.mkdir(ckpt_path)
+
+        ckpt_path = os.path.join(ckpt_path, dataset_name)
+        if not os.path.isdir(ckpt_path):
+            os.mkdir(ckpt_path)
+    else:
+        os.makedirs(ckpt_path, exist_ok=True)
 
     batch_size = train_config["batch_size"]
+    # The test split is evaluated in batches of this size, so that the
+    # evaluation memory does not grow with the size of the test split
+    eval_batch_size = train_config.get("eval_batch_size") or batch_size
     num_epochs = train_config["num_epochs"]
-    train_ratio = train_config["train_ratio"]
     learning_rate = train_config["learning_rate"]
     optimizer = train_config["optimizer"]  # can be [sgd, adam]
     seq_len = train_config["seq_len"]
+    # Can be [fp32, bf16, fp16], fp16 needs a CUDA device
+    precision = train_config.get("precision", "fp32")
+    compile_model = train_config.get("compile", False)
+    # Stops when the test AUC did not improve for this many epochs
+    patience = train_config.get("early_stopping_patience")
 
-    if dataset_name == "ASSIST2009":
-        dataset = ASSIST2009(seq_len)
-    elif dataset_name == "ASSIST2015":
-        dataset = ASSIST2015(seq_len)
-    elif dataset_name == "Algebra2005":
-        dataset = Algebra2005(seq_len)
-    elif dataset_name == "Statics2011":
-        dataset = Statics2011(seq_len)
+    num_workers = train_config.get("num_workers", 0)
+    pin_memory = train_config.get("pin_memory", True)
+    prefetch_factor = train_config.get("prefetch_factor", 2)
+    persistent_workers = train_config.get("persistent_workers", False)
+
+    # Groups the training windows of similar lengths into the same batches
+    length_bucketing = train_config.get("length_bucketing", False)
+    bucket_pool_size = train_config.get("bucket_pool_size", 50)
+    # Makes the initialization, the shuffling and the order of the bucketed
+    # batches reproducible when it is set
+    seed = train_config.get("seed")
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+    dataset = load_dataset(
+        dataset_name, train_config, config.get("synthetic")
+    )
 
     if torch.cuda.is_available():
         device = "cuda"
+        if world_size > 1:
+            device = "cuda:{}".format(os.environ.get("LOCAL_RANK", 0))
     else:
         device = "cpu"
 
-    with open(os.path.join(ckpt_path, "model_config.json"), "w") as f:
-        json.dump(model_config, f, indent=4)
-    with open(os.path.join(ckpt_path, "train_config.json"), "w") as f:
-        json.dump(train_config, f, indent=4)
+    if rank == 0:
+        with open(os.path.join(ckpt_path, "model_config.json"), "w") as f:
+            json.dump(model_config, f, indent=4)
+        with open(os.path.join(ckpt_path, "train_config.json"), "w") as f:
+            json.dump(train_config, f, indent=4)
 
     if model_name == "dkt":
         model = DKT(dataset.num_q, **model_config).to(device)
@@ -71,64 +264,138 @@ def main(model_name, dataset_name):
         model = DKVMN(dataset.num_q, **model_config).to(device)
     elif model_name == "sakt":
         model = SAKT(dataset.num_q, **model_config).to(device)
+    elif model_name == "saint":
+        model = SAINT(dataset.num_q, **model_config).to(device)
+    elif model_name == "kqn":
+        model = KQN(dataset.num_q, **model_config).to(device)
     elif model_name == "gkt":
         if model_config["method"] == "PAM":
             model = PAM(dataset.num_q, **model_config).to(device)
         elif model_config["method"] == "MHA":
             model = MHA(dataset.num_q, **model_config).to(device)
-    else:
-        print("The wrong model name was used...")
-        return
+        elif model_config["method"] == "SparsePAM":
+            neighbors = None
+            if model_config.get("graph") == "cooccurrence":
+                neighbors = cooccurrence_graph(
+                    dataset.q_seqs, dataset.seq_offsets, dataset.num_q,
+                    model_config.get("num_neighbors", NUM_NEIGHBORS)
+                )
+            model = SparsePAM(
+                dataset.num_q, neighbors=neighbors, **model_config
+            ).to(device)
 
-    train_size = int(len(dataset) * train_ratio)
-    test_size = len(dataset) - train_size
+    # Only the rank 0 splits the windows and saves the split, which every
+    # rank takes below, so that all the hosts train and test on the same
+    # windows whether they share a filesystem or not.
+    split = None
+    if rank == 0:
+        split = [
+            subset.indices
+            for subset in split_dataset(dataset, train_config)
+        ]
 
-    train_dataset, test_dataset = random_split(
-        dataset, [train_size, test_size]
+    wait_barriers(PREPARATION_STAGES - 1 - stage)
+
+    train_indices, test_indices = broadcast_object(split)
+    train_dataset = Subset(dataset, train_indices)
+    test_dataset = Subset(dataset, test_indices)
+
+    # The batches are pinned by the collate function itself in the main
+    # process, and by the DataLoader pinning thread with workers.
+    pin_memory = pin_memory and torch.device(device).type == "cuda"
+
+    # The windows are padded to seq_len at collate time, or only to the
+    # longest window of the batch with the length bucketing
+    collate = partial(
+        collate_fn, seq_len=None if length_bucketing else seq_len,
+        pin_memory=pin_memory and num_workers == 0
     )
 
-    if os.path.exists(os.path.join(dataset.dataset_dir, "train_indices.pkl")):
-        with open(
-            os.path.join(dataset.dataset_dir, "train_indices.pkl"), "rb"
-        ) as f:
-            train_dataset.indices = pickle.load(f)
-        with open(
-            os.path.join(dataset.dataset_dir, "test_indices.pkl"), "rb"
-        ) as f:
-            test_dataset.indices = pickle.load(f)
+    loader_kwargs = {
+        "collate_fn": collate,
+        "num_workers": num_workers,
+        "pin_memory": pin_memory and num_workers > 0,
+    }
+    if num_workers > 0:
+        loader_kwargs["prefetch_factor"] = prefetch_factor
+        loader_kwargs["persistent_workers"] = persistent_workers
+
+    # The ranks shuffle with the same seed to split the same permutation
+    if world_size > 1 and seed is None:
+        shuffle_seed = 0
     else:
-        with open(
-            os.path.join(dataset.dataset_dir, "train_indices.pkl"), "wb"
-        ) as f:
-            pickle.dump(train_dataset.indices, f)
-        with open(
-            os.path.join(dataset.dataset_dir, "test_indices.pkl"), "wb"
-        ) as f:
-            pickle.dump(test_dataset.indices, f)
+        shuffle_seed = seed
 
-    train_loader = DataLoader(
-        train_dataset, batch_size=batch_size, shuffle=True,
-        collate_fn=collate_fn
-    )
-    test_loader = DataLoader(
-        test_dataset, batch_size=test_size, shuffle=True,
-        collate_fn=collate_fn
-    )
+    if length_bucketing:
+        train_sampler = BucketBatchSampler(
+            dataset.windows[train_dataset.indices, 2], batch_size,
+            pool_size=bucket_pool_size, seed=shuffle_seed,
+            num_replicas=world_size, rank=rank
+        )
+        train_loader = DataLoader(
+            train_dataset, batch_sampler=train_sampler, **loader_kwargs
+        )
+    elif world_size > 1:
+        train_loader = DataLoader(
+            train_dataset, batch_size=batch_size,
+            sampler=DistributedSampler(
+                train_dataset, num_replicas=world_size, rank=rank,
+                shuffle=True, seed=shuffle_seed
+            ),
+            **loader_kwargs
+        )
+    else:
+        train_loader = DataLoader(
+            train_dataset, batch_size=batch_size, shuffle=True,
+            **loader_kwargs
+        )
+
+    if world_size > 1:
+        # Every test window is evaluated once, by one of the ranks
+        test_loader = DataLoader(
+            test_dataset, batch_size=eval_batch_size,
+            sampler=ShardSampler(len(test_dataset)), **loader_kwargs
+        )
+    else:
+        test_loader = DataLoader(
+            test_dataset, batch_size=eval_batch_size, shuffle=False,
+            **loader_kwargs
+        )
 
     if optimizer == "sgd":
         opt = SGD(model.parameters(), learning_rate, momentum=0.9)
     elif optimizer == "adam":
         opt = Adam(model.parameters(), learning_rate)
 
+    trainer = Trainer(
+        model, opt, precision=precision, compile=compile_model,
+        find_unused_parameters=train_config.get(
+            "find_unused_parameters", False
+        ),
+        profile=profile,
+        trace_steps=train_config.get("profile_trace_steps"),
+        # The test AUC from histograms of this many bins instead of a sort
+        # of all the test predictions, when it is set
+        auc_bins=train_config.get("auc_bins"),
+    )
+
     aucs, loss_means = \
-        model.train_model(
-            train_loader, test_loader, num_epochs, opt, ckpt_path
+        trainer.fit(
+            train_loader, test_loader, num_epochs, ckpt_path,
+            patience=patience, resume=resume
         )
 
-    with open(os.path.join(ckpt_path, "aucs.pkl"), "wb") as f:
-        pickle.dump(aucs, f)
-    with open(os.path.join(ckpt_path, "loss_means.pkl"), "wb") as f:
-        pickle.dump(loss_means, f)
+    results = {
+        "aucs": aucs,
+        "loss_means": loss_means,
+        "throughputs": trainer.throughputs,
+    }
+
+    # The metrics of every epoch are in the metrics.json of ckpt_path
+    if world_size > 1:
+        dist.destroy_process_group()
+
+    return results
 
 
 if __name__ == "__main__":
@@ -138,7 +405,8 @@ if __name__ == "__main__":
         type=str,
         default="dkt",
         help="The name of the model to train. \
-            The possible models are in [dkt, dkt+, dkvmn, sakt, gkt]. \
+            The possible models are in \
+            [dkt, dkt+, dkvmn, sakt, saint, kqn, gkt]. \
             The default model is dkt."
     )
     parser.add_argument(
@@ -147,9 +415,27 @@ if __name__ == "__main__":
         default="ASSIST2009",
         help="The name of the dataset to use in training. \
             The possible datasets are in \
-            [ASSIST2009, ASSIST2015, Algebra2005, Statics2011]. \
+            [ASSIST2009, ASSIST2015, Algebra2005, Statics2011, \
+            Synthetic]. \
             The default dataset is ASSIST2009."
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Whether to time the data loading, forward, backward and \
+            optimizer phases of the training steps in metrics.json, and to \
+            record the profile_trace_steps of the train_config in a Chrome \
+            trace."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Whether to resume the training from the last.ckpt of the \
+            checkpoint directory, after an interruption."
+    )
     args = parser.parse_args()
 
-    main(args.model_name, args.dataset_name)
+    main(
+        args.model_name, args.dataset_name, args.resume,
+        profile=args.profile
+    )
@@ -69,9 +69,11 @@ class DKTService:
             return 0.5
         q_tensor = torch.tensor(skills, dtype=torch.long, device=self.device).unsqueeze(0)
         r_tensor = torch.tensor(answers, dtype=torch.long, device=self.device).unsqueeze(0)
+        qry_tensor = torch.full_like(q_tensor, target_skill_idx)
         with torch.no_grad():
-            preds = self.model(q_tensor, r_tensor)
-        target = preds[0, -1, target_skill_idx].item()
+            # Only the output row of the target skill is computed
+            preds = self.model(q_tensor, r_tensor, qry=qry_tensor)
+        target = preds[0, -1].item()
         return float(target)
 
 